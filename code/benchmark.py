@@ -0,0 +1,1251 @@
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from pagerank import LinkGraph
+
+BASELINE_PATH = 'benchmark_baseline.json'   # suite 的默认输出文件
+SUITE_SIZES = [10000]                       # suite 默认的语料规模，可指定 10000 100000 1000000
+SUITE_ROUNDS = 200                          # 每个查询阶段的请求数
+REGRESSION_THRESHOLD = 0.10                 # compare 中视为回归的相对变化
+
+# 合成语料的子站点及其名称，页面数按排名的幂律分布
+CORPUS_SITES = [("www", "南开大学"), ("news", "南开大学新闻网"), ("jwc", "南开大学教务部"), ("yzb", "南开大学研究生招生网"),
+                ("lib", "南开大学图书馆"), ("cc", "计算机学院"), ("math", "数学科学学院"), ("chem", "化学学院"),
+                ("hr", "人事处"), ("international", "国际合作与交流处"), ("history", "历史学院"), ("bs", "商学院")]
+# 语料中最常见的词，其余词由 CORPUS_CHARS 中的字两两组合生成，词频服从 Zipf 分布
+CORPUS_WORDS = ["南开", "大学", "学院", "通知", "公告", "研究", "教学", "招生", "新闻", "讲座", "学生", "学术", "会议",
+                "工作", "科研", "国际", "交流", "研究生", "本科", "图书馆", "实验室", "中心", "报告", "活动", "发展"]
+CORPUS_CHARS = "教学研究生院系部中心实验室国际交流合作发展规划财务后勤保卫图书馆档案校友基金化物理数史文法经管医药环境材料信息网络软件电子光"
+
+
+def synthetic_links(num_pages, avg_links=10, seed=0):
+    """
+    生成随机链接结构：每个页面指向若干个页面，目标页面按幂律分布选择
+    """
+    rng = random.Random(seed)
+    urls = [f"https://www.nankai.edu.cn/page{i}.htm" for i in range(num_pages)]
+    for url in urls:
+        count = rng.randint(0, 2 * avg_links)
+        links = [urls[min(int(rng.paretovariate(1.2)) - 1, num_pages - 1)] for _ in range(count)]
+        yield url, links
+
+
+def write_synthetic_csv(csv_file_path, num_pages, text_length=2000, seed=0):
+    """
+    生成与 finaloutput.csv 列相同的合成语料
+    """
+    rng = random.Random(seed)
+    words = ["南开", "大学", "学院", "通知", "公告", "研究", "教学", "招生", "新闻", "讲座"]
+    with open(csv_file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "url", "text", "linksurl", "pagerank", "suggest"])
+        for url, links in synthetic_links(num_pages, seed=seed):
+            title = rng.choice(words) + rng.choice(words)
+            text = " ".join(rng.choice(words) for _ in range(text_length // 3))
+            writer.writerow([title, url, text, "; ".join(links), rng.random() / num_pages, title + "..."])
+
+
+def corpus_vocabulary(size=2000, seed=0):
+    rng = random.Random(seed)
+    vocab = list(CORPUS_WORDS)
+    seen = set(vocab)
+    while len(vocab) < size:
+        word = rng.choice(CORPUS_CHARS) + rng.choice(CORPUS_CHARS)
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+
+def write_corpus(csv_file_path, num_pages, text_length=300, seed=0, chunk=10000):
+    """
+    生成与爬虫输出（title, url, text, linksurl）列相同的合成语料：
+    页面分布在若干子站点上，出链数服从幂律分布，链接目标按页面排名的 Zipf 分布选择（入度同样服从幂律），
+    其中约四成链接指向同一子站点内的热门页面（导航栏）；正文词频服从 Zipf 分布
+    """
+    rng = np.random.default_rng(seed)
+    vocab = corpus_vocabulary(seed=seed)
+    word_p = 1.0 / np.arange(1, len(vocab) + 1)
+    word_p /= word_p.sum()
+    site_p = 1.0 / np.arange(1, len(CORPUS_SITES) + 1)
+    site_p /= site_p.sum()
+
+    sites = rng.choice(len(CORPUS_SITES), size=num_pages, p=site_p)
+    urls = [f"https://{CORPUS_SITES[site][0]}.nankai.edu.cn/info/{1000 + i % 97}/{i}.htm" for i, site in enumerate(sites)]
+    site_pages = [np.flatnonzero(sites == site) for site in range(len(CORPUS_SITES))]
+
+    def zipf_ranks(n, count):
+        # 连续近似：rank = n^u - 1 时 P(rank) 与 1/(rank+1) 成正比
+        return np.minimum(np.power(float(n), rng.random(count)).astype(np.int64) - 1, n - 1)
+
+    words_per_page = max(1, text_length // 3)
+    with open(csv_file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "url", "text", "linksurl"])
+        for begin in range(0, num_pages, chunk):
+            end = min(begin + chunk, num_pages)
+            count = end - begin
+            degrees = np.minimum((rng.pareto(1.5, count) + 1) * 4, 300).astype(np.int64)
+            total = int(degrees.sum())
+            local = rng.random(total) < 0.4
+            targets = zipf_ranks(num_pages, total)
+            owners = np.repeat(sites[begin:end], degrees)
+            for site in np.unique(owners[local]):
+                mask = local & (owners == site)
+                pages = site_pages[site]
+                targets[mask] = pages[zipf_ranks(len(pages), int(mask.sum()))]
+            words = rng.choice(len(vocab), size=(count, words_per_page + 2), p=word_p).tolist()
+            offset = 0
+            for i in range(count):
+                page = begin + i
+                links = targets[offset:offset + degrees[i]].tolist()
+                offset += degrees[i]
+                row = words[i]
+                title = f"{vocab[row[0]]}{vocab[row[1]]} - {CORPUS_SITES[sites[page]][1]}"
+                text = " ".join([vocab[w] for w in row[2:]])
+                writer.writerow([title, urls[page], text, "; ".join(urls[t] for t in dict.fromkeys(links))])
+
+
+def bench_pagerank(num_pages):
+    """
+    对比稀疏矩阵 PageRank 与 networkx 的耗时，并检查结果一致性
+    """
+    start = time.perf_counter()
+    graph = LinkGraph()
+    for url, links in synthetic_links(num_pages):
+        graph.add_links(url, links)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = graph.scores_to_dict(graph.pagerank())
+    rank_time = time.perf_counter() - start
+    print(f"LinkGraph: 建图 {build_time:.3f}s, 迭代 {rank_time:.3f}s, 节点数 {len(graph)}")
+
+    try:
+        import networkx as nx
+    except ImportError:
+        print("未安装 networkx，跳过一致性检查。")
+        return
+
+    start = time.perf_counter()
+    G = nx.DiGraph()
+    for url, links in synthetic_links(num_pages):
+        for link in links:
+            G.add_edge(url, link)
+    expected = nx.pagerank(G, alpha=0.85)
+    nx_time = time.perf_counter() - start
+    max_diff = max((abs(scores[url] - value) for url, value in expected.items()), default=0.0)
+    print(f"networkx: {nx_time:.3f}s, 最大误差 {max_diff:.2e}")
+
+
+def bench_ingest(num_pages, workers, reject_rate=0.0, latency=0.0):
+    """
+    对本地模拟 ES 上传合成语料，报告吞吐和限流重试次数
+    """
+    import dataup
+    from mock_es import MockElasticsearch
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages)
+        with MockElasticsearch(reject_rate=reject_rate, latency=latency) as mock:
+            es = dataup.connect(mock.url)
+            index_name = dataup.create_versioned_index(es)
+            ingestor = dataup.BulkIngestor(es, workers=workers, chunk_size=200, initial_backoff=0.05)
+            failed = ingestor.run(dataup.read_actions(csv_file_path, index_name))
+            print(f"workers={workers}: 请求 {mock.bulk_requests} 次，被限流 {mock.rejected} 次，失败文档 {len(failed)} 条")
+
+
+def bench_suggest(num_pages, rounds=2000, es_host=None):
+    """
+    本地联想索引与 ES completion suggester 的单次查询延迟对比
+    """
+    from suggester import Suggester, collect_entries
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        index_path = os.path.join(tmp_dir, "suggest.idx")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=30)
+        start = time.perf_counter()
+        Suggester.build(collect_entries(csv_file_path)).save(index_path)
+        print(f"构建联想索引: {time.perf_counter() - start:.3f}s")
+
+        start = time.perf_counter()
+        suggester = Suggester.load(index_path)
+        print(f"加载联想索引: {(time.perf_counter() - start) * 1e3:.3f}ms")
+
+        prefixes = ["南", "南开", "学院通", "大学新闻", "招生讲"]
+        for fuzzy in (False, True):
+            latencies = []
+            for i in range(rounds):
+                prefix = prefixes[i % len(prefixes)]
+                start = time.perf_counter()
+                suggester.suggest(prefix, fuzzy=fuzzy)
+                latencies.append(time.perf_counter() - start)
+            report_latencies(f"本地联想{'（模糊）' if fuzzy else ''}", latencies)
+
+    if es_host:
+        from search import SearchEngine
+        engine = SearchEngine(es_host=es_host, suggest_index=None)
+        latencies = []
+        for i in range(min(rounds, 200)):
+            start = time.perf_counter()
+            engine.es_suggest(prefixes[i % len(prefixes)])
+            latencies.append(time.perf_counter() - start)
+        report_latencies("ES completion suggester", latencies)
+
+
+def bench_wildcard(es_host, index_name="xxjs", rounds=50):
+    """
+    对比原始 wildcard 查询与改写后查询在前导、后缀、中缀模式上的延迟（需要真实 ES）
+    """
+    from elasticsearch import Elasticsearch
+    from search import rewrite_wildcard
+
+    es = Elasticsearch([es_host])
+    patterns = {"后缀通配": ["nank*", "edu*", "南*"], "前导通配": ["*kai", "*cn", "*学"],
+                "中缀通配": ["*anka*", "*edu*", "*南开大*"]}
+    for kind, values in patterns.items():
+        for pattern in values:
+            strategy, clause = rewrite_wildcard(pattern)
+            raw = {"wildcard": {"text": {"value": pattern.lower(), "case_insensitive": True}}}
+            for name, query in (("wildcard", raw), (strategy, clause)):
+                latencies, took = [], []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    response = es.search(index=index_name, body={"query": query}, size=4, request_cache=False)
+                    latencies.append(time.perf_counter() - start)
+                    took.append(response["took"])
+                hits = response["hits"]["total"]["value"]
+                report_latencies(f"{kind} {pattern} [{name}] 命中 {hits}，服务端 {sum(took) / len(took):.1f}ms", latencies)
+
+
+def bench_neardup(num_pages, workers, dup_rate=0.3, text_length=3000, seed=0):
+    """
+    合成语料中按 dup_rate 插入改动少量词的副本，报告签名计算耗时与检出的召回率、误合并数
+    """
+    from neardup import NearDupDetector, lsh_clusters
+
+    rng = random.Random(seed)
+    words = [f"词{i}" for i in range(5000)]
+    originals, pages = [], []
+    for i in range(num_pages):
+        if originals and rng.random() < dup_rate:
+            source = rng.randrange(len(originals))
+            tokens = originals[source][1].split()
+            for _ in range(len(tokens) // 50):
+                tokens[rng.randrange(len(tokens))] = rng.choice(words)
+            pages.append((f"https://www.nankai.edu.cn/dup{i}.htm", " ".join(tokens), originals[source][0]))
+        else:
+            url = f"https://www.nankai.edu.cn/page{i}.htm"
+            text = " ".join(rng.choice(words) for _ in range(text_length // 4))
+            originals.append((url, text))
+            pages.append((url, text, url))
+
+    position = {url: i for i, (url, _, _) in enumerate(pages)}
+    expected = sum(url != origin for url, _, origin in pages)
+    for n in workers:
+        detector = NearDupDetector(workers=n)
+        start = time.perf_counter()
+        for url, text, _ in pages:
+            detector.add(url, text)
+        signatures, valid = detector.signatures()
+        sign_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        roots = lsh_clusters(signatures, valid)
+        lsh_time = time.perf_counter() - start
+        found = sum(roots[i] == roots[position[origin]] for i, (url, _, origin) in enumerate(pages) if url != origin)
+        clusters = len({roots[position[url]] for url, _ in originals})
+        print(f"workers={n}: 签名 {sign_time:.2f}s（{len(pages) / sign_time:.0f} 页/s），LSH {lsh_time:.3f}s，"
+              f"召回 {found}/{expected}，误合并 {len(originals) - clusters} 个簇")
+
+
+def bench_boilerplate(num_pages, hosts=20, seed=0):
+    """
+    合成语料中每个主机的页面共用页头导航和页脚，报告学习、去除的耗时和节省的字节数
+    """
+    from boilerplate import BoilerplateStripper
+
+    rng = random.Random(seed)
+    words = [f"词{i}" for i in range(5000)]
+    menus = {}
+    for h in range(hosts):
+        menu = " ".join(rng.choice(["首 页", "机构设置", "部门简介", "新闻动态", "通知公告", "联系我们"]) + str(i)
+                        for i in range(40))
+        menus[f"site{h}.nankai.edu.cn"] = (menu, f"版权所有 南开大学 site{h} 地址 天津市 卫津路 94号")
+    pages = []
+    for i in range(num_pages):
+        host = f"site{rng.randrange(hosts)}.nankai.edu.cn"
+        header, footer = menus[host]
+        body = " ".join(rng.choice(words) for _ in range(rng.randint(50, 500)))
+        pages.append((f"https://{host}/page{i}.htm", f"{header} {body} {footer}"))
+
+    stripper = BoilerplateStripper(cache_path=None)
+    start = time.perf_counter()
+    for url, text in pages:
+        stripper.observe(url, text)
+    stripper.finish()
+    learn_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stripped = [(text, stripper.strip(url, text)) for url, text in pages]
+    strip_time = time.perf_counter() - start
+    for text, result in stripped:
+        stripper.measure(text, result)
+    print(f"学习 {learn_time:.3f}s，去除 {strip_time:.3f}s（{len(pages) / strip_time:.0f} 页/s）")
+    stripper.report()
+
+
+def bench_segment(num_pages, seed=0, es_host=None, index_name="xxjs"):
+    """
+    分词吞吐：从合成语料学习词典，对全部正文分词，并比较按字与按词切分的词项数
+    """
+    from segmenter import Segmenter, learn_dictionary
+
+    rng = random.Random(seed)
+    words = ["南开大学", "新闻网", "招生", "研究生院", "通知", "公告", "学术讲座", "经济学院", "图书馆", "开学典礼",
+             "的", "和", "在", "举办", "关于", "我校", "教师", "学生", "国际交流", "实验室", "数学科学学院", "信息检索"]
+    texts = ["".join(rng.choice(words) for _ in range(rng.randint(100, 800))) for _ in range(num_pages)]
+    chars = sum(len(text) for text in texts)
+
+    start = time.perf_counter()
+    segmenter = Segmenter(learn_dictionary(texts[:5000]))
+    print(f"学习词典: {time.perf_counter() - start:.2f}s，{len(segmenter)} 个词")
+
+    start = time.perf_counter()
+    tokens = 0
+    for text in texts:
+        tokens += len(segmenter.cut(text))
+    elapsed = time.perf_counter() - start
+    print(f"分词: {num_pages} 页 {chars / 1e6:.1f}M 字，{elapsed:.2f}s，{chars / elapsed / 1e6:.2f}M 字/s，"
+          f"{len(texts) / elapsed:.0f} 页/s")
+    print(f"词项数: 按字 {chars}，按词 {tokens}（{tokens / chars:.2f}）")
+
+    phrases = ["南开大学", "学术讲座", "数学科学学院", "南开大学经济学院", "信息检索"]
+    for phrase in phrases:
+        print(f"短语 {phrase}: 按字 {len(phrase)} 个位置，按词 {segmenter.cut(phrase)}")
+
+    if es_host:
+        from elasticsearch import Elasticsearch
+
+        es = Elasticsearch([es_host])
+        for phrase in phrases:
+            for field, query in (("text", phrase), ("text_seg", segmenter.segment(phrase))):
+                latencies = []
+                for _ in range(50):
+                    start = time.perf_counter()
+                    es.search(index=index_name, body={"query": {"match_phrase": {field: query}}}, size=4,
+                              request_cache=False)
+                    latencies.append(time.perf_counter() - start)
+                report_latencies(f"{phrase} [{field}]", latencies)
+
+
+def bench_backend(num_pages, rounds=200, es_host=None, index_name="xxjs_bench"):
+    """
+    嵌入式后端与 ES 在同一份合成语料上的查询延迟对比（经由 SearchEngine，包含 PageRank 加权和结果整理）
+    """
+    from embedded import EmbeddedBackend, build_index, read_rows
+    from search import SearchEngine
+
+    queries = [("短语", "search_phrase", "南开大学"), ("短语", "search_phrase", "学院通知讲座"),
+               ("通配", "search_wildcard", "南*"), ("通配", "search_wildcard", "*学"),
+               ("联想", "es_suggest", "南开")]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        index_path = os.path.join(tmp_dir, "embedded.idx")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=600)
+        build_index(read_rows(csv_file_path), index_path)
+        start = time.perf_counter()
+        backends = {"嵌入式": EmbeddedBackend.load(index_path)}
+        print(f"加载嵌入式索引: {(time.perf_counter() - start) * 1e3:.3f}ms")
+
+        if es_host:
+            from dataup import connect, upload_csv
+
+            es = connect(es_host)
+            upload_csv(es, csv_file_path, alias=index_name, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"),
+                       resume=False)
+            backends["ES"] = es
+
+        results = {}
+        for name, backend in backends.items():
+            engine = SearchEngine(index_name=index_name, history_db=os.path.join(tmp_dir, "history.db"),
+                                  suggest_index=None, segment_dict=None, backend=backend)
+            for kind, method, query in queries:
+                latencies = []
+                for _ in range(rounds):
+                    engine.cache.clear()
+                    start = time.perf_counter()
+                    result = getattr(engine, method)(query)
+                    latencies.append(time.perf_counter() - start)
+                results.setdefault(query, {})[name] = result
+                report_latencies(f"{name} {kind} {query}", latencies)
+
+    if len(backends) > 1:
+        for query, by_backend in results.items():
+            top = [[item if isinstance(item, str) else item['url'] for item in result] for result in by_backend.values()]
+            print(f"{query}: 前 {len(top[0])} 条结果{'一致' if top[0] == top[1] else '不一致'}")
+
+
+def bench_batch(num_pages, num_queries=1000, batch_sizes=(10, 50, 200), concurrency=(1, 4, 16), search_latency=0.005):
+    """
+    查询日志回放：逐条 execute_query、_msearch 批量查询与异步并发批量查询的吞吐对比。
+    使用本地模拟 ES，search_latency 模拟每次请求的网络往返与服务端耗时
+    """
+    import asyncio
+
+    from dataup import upload_csv
+    from mock_es import MockElasticsearch
+    from search import SearchEngine
+
+    rng = random.Random(0)
+    words = ["南开", "大学", "学院", "通知", "公告", "研究", "教学", "招生", "新闻", "讲座"]
+    requests = []
+    for _ in range(num_queries):
+        if rng.random() < 0.2:
+            requests.append(("wildcard", rng.choice(words)[0] + "*", None))
+        else:
+            requests.append(("phrase", "".join(rng.choice(words) for _ in range(rng.randint(1, 3))), None))
+    distinct = len(set(requests))
+
+    with tempfile.TemporaryDirectory() as tmp_dir, MockElasticsearch(search_latency=search_latency) as mock:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=300)
+        es = Elasticsearch([mock.url])
+        upload_csv(es, csv_file_path, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"), resume=False)
+        engine = SearchEngine(es_host=mock.url, history_db=os.path.join(tmp_dir, "history.db"),
+                              suggest_index=None, segment_dict=None)
+        engine.search_phrase("南开")   # 模拟 ES 在第一次查询时构建索引
+
+        def run(name, search):
+            engine.cache.clear()
+            before = mock.search_requests
+            start = time.perf_counter()
+            results = search()
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {elapsed:.2f}s，{len(requests) / elapsed:.0f} 查询/s，"
+                  f"{mock.search_requests - before} 次请求")
+            return results
+
+        methods = {'phrase': engine.search_phrase, 'wildcard': engine.search_wildcard}
+        expected = run("逐条查询", lambda: [methods[kind](text, user) for kind, text, user in requests])
+        print(f"（{len(requests)} 个查询，其中不同查询 {distinct} 个）")
+        for batch_size in batch_sizes:
+            results = run(f"_msearch 批量 batch={batch_size}", lambda: engine.search_batch(requests, batch_size))
+            assert results == expected, "批量查询结果与逐条查询不一致"
+        for workers in concurrency:
+            results = run(f"异步 batch=1 并发={workers}",
+                          lambda: asyncio.run(engine.search_batch_async(requests, 1, workers)))
+            assert results == expected, "异步查询结果与逐条查询不一致"
+        results = run(f"异步 batch={batch_sizes[0]} 并发={concurrency[-1]}",
+                      lambda: asyncio.run(engine.search_batch_async(requests, batch_sizes[0], concurrency[-1])))
+        assert results == expected, "异步查询结果与逐条查询不一致"
+
+
+def bench_server(num_pages, concurrency=(1, 4, 16, 64), requests_per_client=100, search_latency=0.005):
+    """
+    HTTP 搜索服务的压测：每个并发客户端以自己的令牌登录，在保持的连接上连续发送查询与联想请求，
+    统计各并发数下的吞吐和延迟分位数。后端为本地模拟 ES，不使用查询缓存
+    """
+    import http.client
+    import json
+    import threading
+
+    from cache import QueryCache
+    from dataup import upload_csv
+    from mock_es import MockElasticsearch
+    from search import SearchEngine
+    from server import SearchService, make_server
+    from users import SessionStore, UserStore
+
+    words = ["南开", "大学", "学院", "通知", "公告", "研究", "教学", "招生", "新闻", "讲座"]
+    with tempfile.TemporaryDirectory() as tmp_dir, MockElasticsearch(search_latency=search_latency) as mock:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=300)
+        upload_csv(Elasticsearch([mock.url]), csv_file_path, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"),
+                   resume=False)
+        engine = SearchEngine(es_host=mock.url, history_db=os.path.join(tmp_dir, "history.db"),
+                              cache=QueryCache(max_entries=0), suggest_index=None, segment_dict=None,
+                              connections=max(concurrency))
+        engine.search_phrase("南开")
+        service = SearchService(engine, UserStore(os.path.join(tmp_dir, "users.db"), None), SessionStore())
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        def call(conn, method, path, body=None, token=None):
+            headers = {"Content-Type": "application/json"}
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            return response.status, json.loads(response.read())
+
+        def client(index, latencies, errors, barrier):
+            rng = random.Random(index)
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            user = {"username": f"user{index}", "password": "secret"}
+            call(conn, "POST", "/register", user)
+            token = call(conn, "POST", "/login", user)[1]["token"]
+            barrier.wait()
+            for i in range(requests_per_client):
+                if i % 5 == 4:
+                    path = "/suggest?prefix=" + quote(rng.choice(words))
+                else:
+                    path = "/search?q=" + quote("".join(rng.choice(words) for _ in range(rng.randint(1, 2))))
+                start = time.perf_counter()
+                status, _ = call(conn, "GET", path, token=token)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors.append(status)
+            conn.close()
+
+        for workers in concurrency:
+            latencies, errors = [], []
+            barrier = threading.Barrier(workers + 1)
+            threads = [threading.Thread(target=client, args=(f"{workers}_{i}", latencies, errors, barrier))
+                       for i in range(workers)]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            report_latencies(f"并发 {workers}: {len(latencies) / elapsed:.0f} 请求/s，错误 {len(errors)}", latencies)
+        server.shutdown()
+        server.server_close()
+
+
+def bench_payload(num_pages, text_length=5000, rounds=50):
+    """
+    查询响应的大小与反序列化耗时：返回完整 _source（含正文和出链）与只取所需字段 + 高亮摘要的对比
+    """
+    import http.client
+    import json
+
+    from dataup import upload_csv
+    from mock_es import MockElasticsearch
+    from search import RESULT_SIZE, SearchEngine
+
+    with tempfile.TemporaryDirectory() as tmp_dir, MockElasticsearch() as mock:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=text_length)
+        upload_csv(Elasticsearch([mock.url]), csv_file_path, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"),
+                   resume=False)
+        engine = SearchEngine(es_host=mock.url, history_db=os.path.join(tmp_dir, "history.db"),
+                              suggest_index=None, segment_dict=None)
+        host, port = mock.server.server_address[:2]
+        conn = http.client.HTTPConnection(host, port)
+        queries = [engine.phrase_query("南开大学"), engine.phrase_query("学院通知"), engine.wildcard_query("招*")]
+
+        for name, filtered in (("完整 _source", False), ("字段过滤 + 高亮", True)):
+            sizes, decode_times, rank_times = [], [], []
+            for i in range(rounds):
+                body = engine.build_body(queries[i % len(queries)])
+                if not filtered:
+                    body.pop("_source")
+                    body.pop("highlight")
+                conn.request("POST", f"/{engine.index}/_search", body=json.dumps(dict(body, size=RESULT_SIZE)),
+                             headers={"Content-Type": "application/json"})
+                raw = conn.getresponse().read()
+                start = time.perf_counter()
+                response = json.loads(raw)
+                decode_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                engine.rank_hits(response["hits"]["hits"])
+                rank_times.append(time.perf_counter() - start)
+                sizes.append(len(raw))
+            print(f"{name}: 平均响应 {sum(sizes) / len(sizes) / 1024:.1f} KB")
+            report_latencies(f"{name} 反序列化", decode_times)
+            report_latencies(f"{name} 结果处理", rank_times)
+        conn.close()
+
+
+def bench_window(num_pages, windows=(4, 20, 100, 500, 1000), rounds=30, search_latency=0.002):
+    """
+    重排窗口大小对查询延迟的影响：第一页需要取回并重排整个窗口（大于一批时用 point-in-time + search_after），
+    之后的页从缓存的窗口中切片
+    """
+    from dataup import upload_csv
+    from mock_es import MockElasticsearch
+    from search import SearchEngine
+
+    with tempfile.TemporaryDirectory() as tmp_dir, MockElasticsearch(search_latency=search_latency) as mock:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=300)
+        upload_csv(Elasticsearch([mock.url]), csv_file_path, checkpoint_path=os.path.join(tmp_dir, "checkpoint.json"),
+                   resume=False)
+        queries = ["南开大学", "学院通知", "招生"]
+        for window in windows:
+            engine = SearchEngine(es_host=mock.url, history_db=os.path.join(tmp_dir, "history.db"),
+                                  suggest_index=None, segment_dict=None, rerank_window=window)
+            engine.search_phrase("南开")
+            first, cached, rank = [], [], []
+            for i in range(rounds):
+                body = engine.build_body(engine.phrase_query(queries[i % len(queries)]))
+                hits = engine.fetch_window(body)
+                start = time.perf_counter()
+                engine.rank_hits(hits)
+                rank.append(time.perf_counter() - start)
+                engine.cache.clear()
+                start = time.perf_counter()
+                engine.page(body, 1)
+                first.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                engine.page(body, 2)
+                cached.append(time.perf_counter() - start)
+            report_latencies(f"窗口 {window} 第一页", first)
+            report_latencies(f"窗口 {window} 重排", rank)
+            report_latencies(f"窗口 {window} 翻页（缓存）", cached)
+
+
+def bench_corpus(num_pages, text_length=2000, lookups=1000):
+    """
+    各阶段从 CSV 与列式语料读取所需列的耗时对比，以及按 URL 随机访问一行的延迟
+    """
+    from corpus import Corpus, import_csv, read_records
+    from dataup import read_actions
+    from suggester import collect_entries
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        corpus_path = os.path.join(tmp_dir, "corpus")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=text_length)
+        _, seconds = timed(import_csv, csv_file_path, corpus_path)
+        corpus_size = sum(os.path.getsize(os.path.join(corpus_path, name)) for name in os.listdir(corpus_path))
+        print(f"导入语料: {seconds:.2f}s，CSV {os.path.getsize(csv_file_path) / 1e6:.1f}MB，语料 {corpus_size / 1e6:.1f}MB")
+
+        stages = {
+            "PageRank（url, linksurl）": lambda path: LinkGraph.from_csv(path),
+            "联想建议（title, pagerank）": lambda path: collect_entries(path),
+            "上传（整行）": lambda path: sum(1 for _ in read_records(path)),
+            "断点续传（后一半）": lambda path: sum(1 for _ in read_actions(path, "xxjs", num_pages // 2)),
+        }
+        for name, stage in stages.items():
+            _, csv_seconds = timed(stage, csv_file_path)
+            _, corpus_seconds = timed(stage, corpus_path)
+            print(f"{name}: CSV {csv_seconds:.3f}s，语料 {corpus_seconds:.3f}s（{csv_seconds / corpus_seconds:.1f}x）")
+
+        rng = random.Random(0)
+        urls = [row["url"] for row in read_records(corpus_path, ("url",))]
+        corpus = Corpus(corpus_path)
+        latencies = []
+        for _ in range(lookups):
+            url = rng.choice(urls)
+            start = time.perf_counter()
+            corpus.get(url, ("title", "text"))
+            latencies.append(time.perf_counter() - start)
+        report_latencies("语料按 URL 读取一行", latencies)
+        latencies = []
+        for _ in range(5):
+            url = rng.choice(urls)
+            start = time.perf_counter()
+            next(row for row in read_records(csv_file_path) if row["url"] == url)
+            latencies.append(time.perf_counter() - start)
+        report_latencies("CSV 扫描查找一行", latencies)
+
+
+def crawl_worker(db_path, start_url, output, worker, concurrency):
+    """
+    一个爬虫进程：与 NKUSpider 相同地使用共享队列和 BufferedCsvPipeline，只是不限制域名
+    """
+    from scrapy import Spider
+    from scrapy.crawler import CrawlerProcess
+
+    from frontier import enable_frontier
+
+    class BenchSpider(Spider):
+        name = "bench"
+        start_urls = [start_url]
+
+        @classmethod
+        def update_settings(cls, settings):
+            super().update_settings(settings)
+            enable_frontier(settings)
+
+        def parse(self, response):
+            links = response.xpath("//a/@href").getall()
+            yield {"title": response.xpath("//title/text()").get(), "url": response.url,
+                   "text": " ".join(response.xpath("//p/text()").getall()), "linksurl": "; ".join(links)}
+            for link in links:
+                yield response.follow(link, callback=self.parse)
+
+    process = CrawlerProcess({
+        "FRONTIER_DB": db_path, "FRONTIER_WORKER": worker, "CONCURRENT_REQUESTS": concurrency,
+        "ITEM_PIPELINES": {"pipelines.BufferedCsvPipeline": 300}, "CSV_OUTPUT_FILE": output, "CSV_BUFFER_SIZE": 100,
+        "LOG_LEVEL": "ERROR", "TELNETCONSOLE_ENABLED": False, "RETRY_ENABLED": False,
+    })
+    process.crawl(BenchSpider)
+    process.start()
+
+
+def bench_crawl(workers=(1, 2, 4), hosts=16, num_pages=1000, latency=0.2, slow_hosts=1, concurrency=4,
+                kill_after=10.0):
+    """
+    多个爬虫进程共享一个队列爬取本地模拟网站：吞吐随进程数的变化、各主机的请求间隔与同时进行的请求数，
+    以及一个进程被强制结束后以同一进程名重启、从断点继续的结果。
+    每个进程的并发数有限（CONCURRENT_REQUESTS），吞吐受响应时间限制，进程数增加时应接近线性增长
+    """
+    from frontier import Frontier, merge_outputs
+    from mock_site import MockSite
+
+    def run(site, count, tmp_dir, kill=None):
+        db_path = os.path.join(tmp_dir, "frontier.db")
+        context = multiprocessing.get_context("spawn")
+        start = time.perf_counter()
+        processes = []
+        for i in range(count):
+            process = context.Process(target=crawl_worker, args=(db_path, site.start_url,
+                                                                 os.path.join(tmp_dir, f"output{i}.csv"),
+                                                                 f"worker{i}", concurrency))
+            process.start()
+            processes.append(process)
+        if kill is not None:
+            time.sleep(kill)
+            processes[0].kill()
+            processes[0].join()
+            # 以同一进程名重启：立即收回崩溃前持有的租约，输出追加到原文件
+            processes[0] = context.Process(target=crawl_worker, args=(db_path, site.start_url,
+                                                                      os.path.join(tmp_dir, "output0.csv"),
+                                                                      "worker0", concurrency))
+            processes[0].start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        merged = merge_outputs(os.path.join(tmp_dir, "merged.csv"),
+                               [os.path.join(tmp_dir, f"output{i}.csv") for i in range(count)])
+        frontier = Frontier(db_path)
+        stats = frontier.stats()
+        frontier.conn.close()
+        return elapsed, merged, stats
+
+    def report(site, label, elapsed, merged, stats):
+        host_rows = [site.host_stats(h) for h in range(site.num_hosts)]
+        requests = sum(row[0] for row in host_rows)
+        first = min(start for reqs in site.requests for start, _, _ in reqs)
+        fast_end = max((start for h, reqs in enumerate(site.requests) if site.latencies[h] == latency
+                        for start, _, _ in reqs), default=first)
+        last = max(start for reqs in site.requests for start, _, _ in reqs)
+        fast_pages = sum(row[1] for h, row in enumerate(host_rows) if site.latencies[h] == latency)
+        print(f"{label}: 总耗时 {elapsed:.1f}s，爬取 {merged}/{num_pages} 页，请求 {requests} 次，队列 {stats}")
+        print(f"  快主机 {fast_pages / max(fast_end - first, 1e-9):.1f} 页/s（{fast_end - first:.1f}s 爬完），"
+              f"全部 {requests / max(last - first, 1e-9):.1f} 请求/s（{last - first:.1f}s）")
+        for h, (count, pages, gap, peak) in enumerate(host_rows):
+            if h < slow_hosts or h == slow_hosts:
+                kind = "慢" if h < slow_hosts else "快"
+                print(f"  {kind}主机 {h}: {count} 次请求，{pages} 页，最小间隔 "
+                      f"{(gap or 0) * 1e3:.0f}ms，最多同时 {peak} 个请求")
+        return fast_pages / max(fast_end - first, 1e-9)
+
+    baseline = None
+    for count in workers:
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                MockSite(hosts, num_pages, latency, slow_hosts, slow_latency=latency * 5) as site:
+            rate = report(site, f"{count} 个进程", *run(site, count, tmp_dir))
+            baseline = baseline or rate / count
+            print(f"  相对单进程: {rate / baseline:.2f}x（理想 {count}x）")
+
+    if kill_after:
+        count = max(2, min(workers))
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                MockSite(hosts, num_pages, latency, slow_hosts, slow_latency=latency * 5) as site:
+            report(site, f"{count} 个进程，{kill_after:.0f}s 后强制结束一个并重启", *run(site, count, tmp_dir, kill_after))
+
+
+def bench_startup(num_pages=2000, runs=5, batch=200):
+    """
+    search.py 命令行模式的冷启动与每条查询的开销：导入 search 的耗时和导入了哪些重量级模块，
+    新进程执行一条查询的总耗时，以及一次从标准输入读入 batch 条查询时摊到每条查询的耗时。
+    分别测量在本进程中查询（嵌入式索引）和复用正在运行的 server.py 两种情况，各取 runs 次中的最小值
+    """
+    from embedded import build_index, read_rows
+
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(code_dir, "search.py")
+    rng = random.Random(0)
+    queries = [rng.choice(["", "wildcard\t", "suggest\t"]) + rng.choice(CORPUS_WORDS) + rng.choice(CORPUS_WORDS)
+               for _ in range(batch)]
+
+    def best(command, stdin_text="", cwd=code_dir, lines=None):
+        elapsed = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run(command, input=stdin_text, capture_output=True, text=True, cwd=cwd)
+            elapsed.append(time.perf_counter() - start)
+            if result.returncode:
+                raise RuntimeError(result.stderr)
+            if lines is not None and result.stdout.count("\n") != lines:
+                raise RuntimeError(f"期望 {lines} 行结果: {result.stdout[:200]}")
+        return min(elapsed)
+
+    interpreter = best([sys.executable, "-c", "pass"])
+    imported = best([sys.executable, "-c", "import search"])
+    probe = subprocess.run([sys.executable, "-c", "import search, sys; print(' '.join(m for m in "
+                            "('numpy', 'pandas', 'elasticsearch', 'asyncio', 'embedded') if m in sys.modules))"],
+                           capture_output=True, text=True, cwd=code_dir)
+    print(f"解释器启动: {interpreter * 1e3:.1f}ms，import search: {(imported - interpreter) * 1e3:.1f}ms，"
+          f"导入的重量级模块: {probe.stdout.strip() or '无'}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=600)
+        build_index(read_rows(csv_file_path), os.path.join(tmp_dir, "embedded.idx"))
+
+        def measure(label, options):
+            one = best([sys.executable, script, *options], queries[0] + "\n", tmp_dir, 1)
+            many = best([sys.executable, script, *options], "\n".join(queries) + "\n", tmp_dir, batch)
+            print(f"{label:<12} 一条查询的进程总耗时 {one * 1e3:8.1f}ms   {batch} 条查询 {many * 1e3:8.1f}ms   "
+                  f"每条查询 {(many - one) / (batch - 1) * 1e3:6.2f}ms")
+
+        measure("本进程查询", ["--server", "none", "--backend", "embedded"])
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = subprocess.Popen([sys.executable, os.path.join(code_dir, "server.py"), "--backend", "embedded",
+                                   "--port", str(port)], cwd=tmp_dir, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{port}"
+            deadline = time.time() + 60
+            while subprocess.run([sys.executable, script, "--server", url, "--type", "suggest", "南"],
+                                 capture_output=True, cwd=tmp_dir).returncode:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("搜索服务没有启动")
+                time.sleep(0.2)
+            measure("复用服务", ["--server", url])
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def bench_personalize(num_pages=5000, history_sizes=(0, 100, 1000, 10000), rounds=100):
+    """
+    个性化查询的延迟与用户历史长度的关系（嵌入式后端，每次查询前清空缓存）：
+    按用户画像前 k 个词加权与旧做法（历史中出现过的所有词放进一个 terms 过滤器）对比，
+    同时记录查询体大小和记录一条查询（增量更新画像）的耗时
+    """
+    from embedded import build_index, read_rows
+    from history import query_terms
+    from search import SearchEngine
+
+    rng = random.Random(0)
+    # 查询词由两个字组成，历史越长出现过的不同词越多
+    words = [a + b for a in CORPUS_CHARS for b in CORPUS_CHARS]
+    queries = ["南开大学", "学院通知", "研究生招生"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file_path = os.path.join(tmp_dir, "finaloutput.csv")
+        index_path = os.path.join(tmp_dir, "embedded.idx")
+        write_synthetic_csv(csv_file_path, num_pages, text_length=600)
+        build_index(read_rows(csv_file_path), index_path)
+        engine = SearchEngine(history_db=os.path.join(tmp_dir, "history.db"), suggest_index=None, segment_dict=None,
+                              backend="embedded", embedded_index=index_path)
+        engine.search_phrase(queries[0])  # 加载索引
+
+        def legacy_body(query, history):
+            body = engine.build_body(engine.phrase_query(query))
+            terms = sorted({term for text in history for term in query_terms(text)})
+            if terms:
+                body["query"]["function_score"]["functions"].append({"filter": {"terms": {"text": terms}},
+                                                                     "weight": 1.5})
+            return body
+
+        def time_queries(build):
+            latencies = []
+            for i in range(rounds):
+                engine.cache.clear()
+                start = time.perf_counter()
+                engine.page(build(queries[i % len(queries)]))
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        for size in history_sizes:
+            user = f"user{size}"
+            history = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 3))) for _ in range(size)]
+            start = time.perf_counter()
+            for query in history:
+                engine.log_query(user, query, [])
+            log_ms = (time.perf_counter() - start) / size * 1e3 if size else 0.0
+            profile_body = engine.build_body(engine.phrase_query(queries[0]), user)
+            old_body = legacy_body(queries[0], history)
+            distinct = len({term for text in history for term in query_terms(text)})
+            print(f"历史 {size} 条（{distinct} 个不同的词），记录一条查询 {log_ms:.3f}ms，"
+                  f"查询体 画像 {len(json.dumps(profile_body, ensure_ascii=False))} 字节 / "
+                  f"全部历史词 {len(json.dumps(old_body, ensure_ascii=False))} 字节")
+            report_latencies(f"  画像前 {engine.history.profile_terms} 个词",
+                             time_queries(lambda query: engine.build_body(engine.phrase_query(query), user)))
+            report_latencies("  全部历史词", time_queries(lambda query: legacy_body(query, history)))
+
+
+def peak_rss_mb():
+    """
+    当前进程的峰值常驻内存（MB），不支持的平台返回 None
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def stage_metrics(items, seconds, latencies=None):
+    metrics = {"items": items, "seconds": seconds, "throughput": items / seconds if seconds else None}
+    if latencies:
+        for p in (50, 95, 99):
+            metrics[f"p{p}_ms"] = float(np.percentile(latencies, p)) * 1e3
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def suite_engine(work_dir, options, suggest_index=None):
+    from search import SearchEngine
+
+    if options["backend"] == "mock":
+        return SearchEngine(es_host=options["es_host"], history_db=os.path.join(work_dir, "history.db"),
+                            suggest_index=suggest_index, segment_dict=None, backend="es")
+    return SearchEngine(embedded_index=os.path.join(work_dir, "embedded.idx"), history_db=os.path.join(work_dir, "history.db"),
+                        suggest_index=suggest_index, segment_dict=None, backend="embedded")
+
+
+def time_requests(func, requests, rounds, before=None):
+    for request in requests:
+        func(request)  # 预热：加载索引、建立连接
+    latencies = []
+    for i in range(rounds):
+        if before:
+            before()
+        start = time.perf_counter()
+        func(requests[i % len(requests)])
+        latencies.append(time.perf_counter() - start)
+    return stage_metrics(rounds, sum(latencies), latencies)
+
+
+def stage_corpus(work_dir, options):
+    _, seconds = timed(write_corpus, "corpus.csv", options["pages"], options["text_length"], options["seed"])
+    return stage_metrics(options["pages"], seconds)
+
+
+def stage_pagerank(work_dir, options):
+    from pagerank import compute_pagerank
+
+    pagerank_data, seconds = timed(compute_pagerank, "corpus.csv")
+    with open("pagerank.json", "w") as f:
+        json.dump(pagerank_data, f)
+    return stage_metrics(len(pagerank_data), seconds)
+
+
+def stage_update_csv(work_dir, options):
+    from pagerank import update_csv_with_pagerank
+
+    with open("pagerank.json") as f:
+        pagerank_data = json.load(f)
+    _, seconds = timed(update_csv_with_pagerank, "corpus.csv", pagerank_data)
+    return stage_metrics(options["pages"], seconds)
+
+
+def stage_suggest_csv(work_dir, options):
+    from suggest import add_suggestions
+
+    _, seconds = timed(add_suggestions, os.path.join("pangerankedData", "pangerankedoutput.csv"), "finaloutput.csv")
+    return stage_metrics(options["pages"], seconds)
+
+
+def stage_suggest_index(work_dir, options):
+    from suggester import Suggester, collect_entries
+
+    suggester, seconds = timed(lambda: Suggester.build(collect_entries("finaloutput.csv")))
+    suggester.save("suggest.idx")
+    return stage_metrics(options["pages"], seconds)
+
+
+def stage_ingest(work_dir, options):
+    if options["backend"] == "mock":
+        from dataup import upload_csv
+
+        es = Elasticsearch([options["es_host"]], request_timeout=600)
+        _, seconds = timed(lambda: upload_csv(es, "finaloutput.csv", checkpoint_path="checkpoint.json", resume=False))
+    else:
+        from embedded import build_index, read_rows
+
+        _, seconds = timed(build_index, read_rows("finaloutput.csv"), "embedded.idx", False)
+    return stage_metrics(options["pages"], seconds)
+
+
+def stage_phrase_query(work_dir, options):
+    engine = suite_engine(work_dir, options)
+    return time_requests(engine.search_phrase, ["南开大学", "学院通知", "研究生招生", "图书馆 讲座"],
+                         options["rounds"], engine.cache.clear)
+
+
+def stage_wildcard_query(work_dir, options):
+    engine = suite_engine(work_dir, options)
+    return time_requests(engine.search_wildcard, ["南*", "*学", "招生*"], options["rounds"], engine.cache.clear)
+
+
+def stage_suggest_query(work_dir, options):
+    engine = suite_engine(work_dir, options, suggest_index="suggest.idx")
+    return time_requests(engine.wildcard_suggest, ["南", "南开", "学院通", "研究生招"], options["rounds"])
+
+
+# 按流水线顺序执行，后面的阶段读取前面阶段写入工作目录的文件
+SUITE_STAGES = {
+    "corpus": stage_corpus,
+    "pagerank": stage_pagerank,
+    "update_csv": stage_update_csv,
+    "suggest_csv": stage_suggest_csv,
+    "suggest_index": stage_suggest_index,
+    "ingest": stage_ingest,
+    "phrase_query": stage_phrase_query,
+    "wildcard_query": stage_wildcard_query,
+    "suggest_query": stage_suggest_query,
+}
+# compare 检查的指标：1 表示越大越好，-1 表示越小越好
+SUITE_METRICS = {"throughput": 1, "p50_ms": -1, "p95_ms": -1, "p99_ms": -1, "peak_rss_mb": -1}
+
+
+def run_stage(name, work_dir, options):
+    os.chdir(work_dir)
+    return SUITE_STAGES[name](work_dir, options)
+
+
+def bench_suite(sizes=SUITE_SIZES, backend="embedded", output=BASELINE_PATH, rounds=SUITE_ROUNDS, text_length=300,
+                seed=0):
+    """
+    在合成语料上依次运行离线流水线和查询的各个阶段，结果（吞吐、p50/p95/p99 延迟、峰值内存）写入 JSON，
+    之后可以用 compare 与基线对比。每个阶段在新启动的子进程中运行，峰值内存只包含该阶段；
+    mock 后端时模拟 ES 运行在当前进程中，不计入各阶段的内存
+    """
+    from mock_es import MockElasticsearch
+
+    report = {
+        "meta": {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "backend": backend, "rounds": rounds,
+                 "text_length": text_length, "seed": seed},
+        "results": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        results = report["results"][str(size)] = {}
+        with tempfile.TemporaryDirectory() as work_dir, \
+                (MockElasticsearch() if backend == "mock" else contextlib.nullcontext()) as mock:
+            options = {"pages": size, "backend": backend, "rounds": rounds, "text_length": text_length, "seed": seed,
+                       "es_host": mock.url if mock else None}
+            for name in SUITE_STAGES:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    metrics = executor.submit(run_stage, name, work_dir, options).result()
+                results[name] = metrics
+                print(f"{size:>8} {name:<15} " + format_metrics(metrics))
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+    return report
+
+
+def format_metrics(metrics):
+    parts = [f"{metrics['throughput']:.1f}/s" if metrics.get('throughput') else "-"]
+    parts += [f"{name[:3]} {metrics[name]:.2f}ms" for name in ("p50_ms", "p95_ms", "p99_ms") if name in metrics]
+    if metrics.get("peak_rss_mb") is not None:
+        parts.append(f"RSS {metrics['peak_rss_mb']:.0f}MB")
+    return ", ".join(parts)
+
+
+def compare_baselines(baseline_path, current_path, threshold=REGRESSION_THRESHOLD):
+    """
+    对比两次 suite 的结果，吞吐下降或延迟、内存增加超过 threshold 的指标标记为回归，返回回归的数量
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+    for key in ("backend", "cpus", "python", "rounds", "text_length", "seed"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"注意: {key} 不同（{baseline['meta'].get(key)} -> {current['meta'].get(key)}），结果可能不可比")
+
+    regressions = 0
+    for size, stages in current["results"].items():
+        for stage, metrics in stages.items():
+            base = baseline["results"].get(size, {}).get(stage)
+            if base is None:
+                print(f"{size:>8} {stage:<15} 基线中没有该阶段")
+                continue
+            for metric, direction in SUITE_METRICS.items():
+                old, new = base.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                regressed = direction * change < -threshold
+                regressions += regressed
+                print(f"{size:>8} {stage:<15} {metric:<12} {old:>12.3f} -> {new:>12.3f} {change:>+8.1%}"
+                      f"{'  回归' if regressed else ''}")
+    print(f"共 {regressions} 项回归（阈值 {threshold:.0%}）")
+    return regressions
+
+
+def report_latencies(name, latencies):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e6
+
+    print(f"{name}: p50 {percentile(50):.1f}us, p95 {percentile(95):.1f}us, p99 {percentile(99):.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="性能测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pagerank_parser = subparsers.add_parser("pagerank", help="PageRank 计算")
+    pagerank_parser.add_argument("--pages", type=int, default=10000)
+
+    ingest_parser = subparsers.add_parser("ingest", help="并发上传到模拟 ES")
+    ingest_parser.add_argument("--pages", type=int, default=10000)
+    ingest_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ingest_parser.add_argument("--reject-rate", type=float, default=0.0)
+    ingest_parser.add_argument("--latency", type=float, default=0.02)
+
+    suggest_parser = subparsers.add_parser("suggest", help="本地联想索引与 ES suggester 延迟对比")
+    suggest_parser.add_argument("--pages", type=int, default=100000)
+    suggest_parser.add_argument("--es-host", help="提供 ES 地址时同时测试 ES completion suggester")
+
+    wildcard_parser = subparsers.add_parser("wildcard", help="通配查询改写前后的延迟对比（需要 ES）")
+    wildcard_parser.add_argument("--es-host", default="http://localhost:9200")
+    wildcard_parser.add_argument("--index", default="xxjs")
+
+    neardup_parser = subparsers.add_parser("neardup", help="近似重复检测的吞吐与召回")
+    neardup_parser.add_argument("--pages", type=int, default=20000)
+    neardup_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    neardup_parser.add_argument("--dup-rate", type=float, default=0.3)
+
+    boilerplate_parser = subparsers.add_parser("boilerplate", help="站点模板去除的耗时与效果")
+    boilerplate_parser.add_argument("--pages", type=int, default=20000)
+
+    segment_parser = subparsers.add_parser("segment", help="中文分词吞吐")
+    segment_parser.add_argument("--pages", type=int, default=20000)
+    segment_parser.add_argument("--es-host", help="提供 ES 地址时对比 text 与 text_seg 上的短语查询延迟")
+
+    backend_parser = subparsers.add_parser("backend", help="嵌入式后端与 ES 的查询延迟对比")
+    backend_parser.add_argument("--pages", type=int, default=20000)
+    backend_parser.add_argument("--es-host", help="提供 ES 地址时把同一份语料上传到 ES 并对比")
+
+    batch_parser = subparsers.add_parser("batch", help="逐条、批量与异步查询的吞吐对比（本地模拟 ES）")
+    batch_parser.add_argument("--pages", type=int, default=2000)
+    batch_parser.add_argument("--queries", type=int, default=1000)
+    batch_parser.add_argument("--search-latency", type=float, default=0.005, help="每次请求的模拟耗时（秒）")
+
+    server_parser = subparsers.add_parser("server", help="HTTP 搜索服务在不同并发数下的吞吐与延迟（本地模拟 ES）")
+    server_parser.add_argument("--pages", type=int, default=2000)
+    server_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    server_parser.add_argument("--requests", type=int, default=100, help="每个客户端发送的请求数")
+    server_parser.add_argument("--search-latency", type=float, default=0.005, help="每次 ES 请求的模拟耗时（秒）")
+
+    payload_parser = subparsers.add_parser("payload", help="查询响应大小与反序列化耗时（字段过滤与高亮前后）")
+    payload_parser.add_argument("--pages", type=int, default=2000)
+    payload_parser.add_argument("--text-length", type=int, default=5000)
+
+    window_parser = subparsers.add_parser("window", help="重排窗口大小与查询延迟（本地模拟 ES）")
+    window_parser.add_argument("--pages", type=int, default=5000)
+    window_parser.add_argument("--windows", type=int, nargs="+", default=[4, 20, 100, 500, 1000])
+
+    corpus_parser = subparsers.add_parser("corpus", help="CSV 与列式语料的读取耗时对比")
+    corpus_parser.add_argument("--pages", type=int, default=20000)
+    corpus_parser.add_argument("--text-length", type=int, default=2000)
+
+    crawl_parser = subparsers.add_parser("crawl", help="多进程共享爬取队列的吞吐、按主机限速与断点续爬（本地模拟网站）")
+    crawl_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    crawl_parser.add_argument("--hosts", type=int, default=16)
+    crawl_parser.add_argument("--pages", type=int, default=1000)
+    crawl_parser.add_argument("--latency", type=float, default=0.2, help="每个主机的响应时间（秒），慢主机为其 5 倍")
+    crawl_parser.add_argument("--slow-hosts", type=int, default=1)
+    crawl_parser.add_argument("--concurrency", type=int, default=4, help="每个进程的 CONCURRENT_REQUESTS")
+    crawl_parser.add_argument("--kill-after", type=float, default=10.0, help="断点续爬测试中强制结束进程的时间，0 表示不测试")
+
+    personalize_parser = subparsers.add_parser("personalize", help="个性化查询延迟与用户历史长度的关系（用户画像与全部历史词对比）")
+    personalize_parser.add_argument("--pages", type=int, default=5000)
+    personalize_parser.add_argument("--history", type=int, nargs="+", default=[0, 100, 1000, 10000],
+                                    help="用户历史的查询数")
+    personalize_parser.add_argument("--rounds", type=int, default=100)
+
+    startup_parser = subparsers.add_parser("startup", help="search.py 命令行模式的冷启动与每条查询的开销（本进程与复用服务）")
+    startup_parser.add_argument("--pages", type=int, default=2000)
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--batch", type=int, default=200, help="一次输入的查询数")
+
+    suite_parser = subparsers.add_parser("suite", help="合成语料上各阶段的吞吐、延迟与峰值内存，结果写入 JSON")
+    suite_parser.add_argument("--sizes", type=int, nargs="+", default=SUITE_SIZES, help="语料页面数")
+    suite_parser.add_argument("--backend", choices=["embedded", "mock"], default="embedded")
+    suite_parser.add_argument("--output", default=BASELINE_PATH)
+    suite_parser.add_argument("--rounds", type=int, default=SUITE_ROUNDS)
+    suite_parser.add_argument("--text-length", type=int, default=300)
+    suite_parser.add_argument("--seed", type=int, default=0)
+
+    compare_parser = subparsers.add_parser("compare", help="对比两次 suite 的结果并标记回归")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == "pagerank":
+        bench_pagerank(args.pages)
+    elif args.command == "ingest":
+        for workers in args.workers:
+            bench_ingest(args.pages, workers, args.reject_rate, args.latency)
+    elif args.command == "suggest":
+        bench_suggest(args.pages, es_host=args.es_host)
+    elif args.command == "wildcard":
+        bench_wildcard(args.es_host, args.index)
+    elif args.command == "neardup":
+        bench_neardup(args.pages, args.workers, args.dup_rate)
+    elif args.command == "boilerplate":
+        bench_boilerplate(args.pages)
+    elif args.command == "segment":
+        bench_segment(args.pages, es_host=args.es_host)
+    elif args.command == "backend":
+        bench_backend(args.pages, es_host=args.es_host)
+    elif args.command == "batch":
+        bench_batch(args.pages, args.queries, search_latency=args.search_latency)
+    elif args.command == "server":
+        bench_server(args.pages, args.concurrency, args.requests, args.search_latency)
+    elif args.command == "payload":
+        bench_payload(args.pages, args.text_length)
+    elif args.command == "window":
+        bench_window(args.pages, args.windows)
+    elif args.command == "corpus":
+        bench_corpus(args.pages, args.text_length)
+    elif args.command == "crawl":
+        bench_crawl(args.workers, args.hosts, args.pages, args.latency, args.slow_hosts, args.concurrency,
+                    args.kill_after)
+    elif args.command == "personalize":
+        bench_personalize(args.pages, args.history, args.rounds)
+    elif args.command == "startup":
+        bench_startup(args.pages, args.runs, args.batch)
+    elif args.command == "suite":
+        bench_suite(args.sizes, args.backend, args.output, args.rounds, args.text_length, args.seed)
+    elif args.command == "compare":
+        sys.exit(1 if compare_baselines(args.baseline, args.current, args.threshold) else 0)
@@ -0,0 +1,172 @@
+# 站点模板去除：同一子域名下的页面共用页头、导航和页脚，
+# 以词的 shingle 为单位统计它们在该主机各页面中出现的比例，
+# 出现在大多数页面中的 shingle 视为模板，正文中被模板覆盖的词在索引前删除。
+import argparse
+import json
+import math
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from corpus import read_records
+
+TEMPLATE_CACHE = 'templates.json'  # 各主机学习到的模板，下次运行直接复用
+SHINGLE_SIZE = 4                   # 每个 shingle 包含的词数
+LEARN_PAGES = 50                   # 每个主机用于学习模板的页面数
+MIN_PAGES = 5                      # 页面少于该数的主机不学习模板
+TEMPLATE_RATIO = 0.6               # 出现在该比例以上页面中的 shingle 视为模板
+
+# 估算倒排表大小：中文按单字、其他按单词计词项
+TERMS = re.compile(r'[\u4e00-\u9fff]|\w+')
+
+
+def host_of(url):
+    try:
+        return (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return ''
+
+
+def shingles(tokens, k=SHINGLE_SIZE):
+    return {' '.join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def postings(text):
+    """
+    文档贡献的倒排表条目数（不同词项数）
+    """
+    return len(set(TERMS.findall(text)))
+
+
+class BoilerplateStripper:
+    """
+    按主机学习并去除模板文本。每个主机只用前 LEARN_PAGES 个页面学习一次，
+    结果保存在 cache_path 中，之后的运行（包括增量更新）不再重新学习
+    """
+
+    def __init__(self, cache_path=TEMPLATE_CACHE, k=SHINGLE_SIZE, learn_pages=LEARN_PAGES,
+                 min_pages=MIN_PAGES, ratio=TEMPLATE_RATIO):
+        self.cache_path = cache_path
+        self.k = k
+        self.learn_pages = learn_pages
+        self.min_pages = min_pages
+        self.ratio = ratio
+        self.templates = {}   # 主机 -> 模板 shingle 集合
+        self._samples = {}    # 主机 -> 学习中的页面 shingle 集合列表
+        self.docs = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.postings_before = 0
+        self.postings_after = 0
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.templates = {host: set(items) for host, items in json.load(f).items()}
+
+    def learned(self, host):
+        return host in self.templates
+
+    def observe(self, url, text):
+        """
+        加入一个学习样本，样本数够了就学习该主机的模板。返回主机名
+        """
+        host = host_of(url)
+        if host not in self.templates:
+            samples = self._samples.setdefault(host, [])
+            samples.append(shingles(text.split(' '), self.k))
+            if len(samples) >= self.learn_pages:
+                self._learn(host)
+        return host
+
+    def _learn(self, host):
+        samples = self._samples.pop(host, [])
+        template = set()
+        if len(samples) >= self.min_pages:
+            counts = {}
+            for page in samples:
+                for shingle in page:
+                    counts[shingle] = counts.get(shingle, 0) + 1
+            need = max(2, math.ceil(self.ratio * len(samples)))
+            template = {shingle for shingle, count in counts.items() if count >= need}
+        self.templates[host] = template
+
+    def finish(self):
+        """
+        样本不足 learn_pages 的主机用已有样本学习，并保存模板缓存
+        """
+        for host in list(self._samples):
+            self._learn(host)
+        if self.cache_path:
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({host: sorted(template) for host, template in self.templates.items()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+
+    def strip(self, url, text):
+        """
+        删除被模板 shingle 覆盖的词，没有模板的主机原样返回
+        """
+        template = self.templates.get(host_of(url))
+        if not template:
+            return text
+        tokens = text.split(' ')
+        keep = [True] * len(tokens)
+        k = self.k
+        for i in range(len(tokens) - k + 1):
+            if ' '.join(tokens[i:i + k]) in template:
+                keep[i:i + k] = [False] * k
+        return ' '.join(token for token, kept in zip(tokens, keep) if kept)
+
+    def measure(self, before, after):
+        self.docs += 1
+        self.bytes_before += len(before.encode('utf-8'))
+        self.bytes_after += len(after.encode('utf-8'))
+        self.postings_before += postings(before)
+        self.postings_after += postings(after)
+
+    def report(self):
+        if not self.docs:
+            return
+        saved = self.bytes_before - self.bytes_after
+        print(f"模板去除：{self.docs} 个页面，{sum(1 for t in self.templates.values() if t)} 个主机有模板，"
+              f"平均每页减少 {saved / self.docs:.0f} 字节（{saved / max(1, self.bytes_before):.1%}），"
+              f"倒排表条目 {self.postings_before} → {self.postings_after}"
+              f"（减少 {1 - self.postings_after / max(1, self.postings_before):.1%}）")
+
+
+def strip_stage(stripper):
+    """
+    去除 text 中的模板文本并累计节省的字节数与倒排表条目数，结束时打印统计
+    """
+    def stage(records):
+        for row in records:
+            text = row['text']
+            row['text'] = stripper.strip(row['url'], text)
+            stripper.measure(text, row['text'])
+            yield row
+        stripper.report()
+    return stage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="学习各主机的页面模板并统计去除效果")
+    parser.add_argument("csv_file_path", nargs="?", default="cleanednkuoutput.csv")
+    parser.add_argument("--cache", default=TEMPLATE_CACHE, help="模板缓存文件")
+    parser.add_argument("--relearn", action="store_true", help="忽略已有缓存重新学习")
+    args = parser.parse_args()
+
+    if args.relearn and os.path.exists(args.cache):
+        os.remove(args.cache)
+    start = time.perf_counter()
+    stripper = BoilerplateStripper(args.cache)
+    for row in read_records(args.csv_file_path, ('url', 'text')):
+        stripper.observe(row['url'], re.sub(r'\s+', ' ', row.get('text') or '').strip())
+    stripper.finish()
+    print(f"学习模板用时 {time.perf_counter() - start:.2f}s，已保存到 {args.cache}")
+
+    start = time.perf_counter()
+    for row in read_records(args.csv_file_path, ('url', 'text')):
+        text = re.sub(r'\s+', ' ', row.get('text') or '').strip()
+        stripper.measure(text, stripper.strip(row['url'], text))
+    stripper.report()
+    print(f"去除模板用时 {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_MAX_ENTRIES = 1000             # 最多缓存的查询数
+CACHE_MAX_BYTES = 32 * 1024 * 1024   # 缓存结果的总字节数上限
+CACHE_TTL = 300                      # 缓存有效期（秒）
+
+
+class QueryCache:
+    """
+    查询结果缓存：按条数和字节数限制容量，LRU 淘汰，超过 TTL 的条目视为失效。
+    version 记录索引版本，版本变化时清空全部缓存
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()  # key -> (过期时间, 字节数, 结果)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(query):
+        return json.dumps(query, sort_keys=True, ensure_ascii=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, size, results = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(res) for res in results]
+
+    def put(self, key, results):
+        size = len(key.encode('utf-8')) + len(json.dumps(results, ensure_ascii=False).encode('utf-8'))
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, [dict(res) for res in results])
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def set_version(self, version):
+        """
+        索引版本（别名指向的索引）变化时清空缓存
+        """
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self._entries.clear()
+                    self._bytes = 0
+                    self.invalidations += 1
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'version': self.version,
+            }
@@ -0,0 +1,387 @@
+# 列式语料存储：代替各阶段之间传递的中间 CSV。
+#
+# 语料是一个目录，每列单独存放并以 mmap 只读打开，各阶段只读取需要的列（PageRank 只读 url 和 linksurl，
+# 联想建议只读 title），不需要解析正文：
+#   meta.json           行数与列名、列类型
+#   <列名>.off / .bin   字符串列：n+1 个 uint64 偏移量 + UTF-8 字节块，第 i 行为 bin[off[i]:off[i+1]]
+#   <列名>.f8           数值列（pagerank）：n 个 float64，缺失值为 NaN
+#   url.hash            url -> 行号的开放寻址哈希表，按 URL 查找一行是 O(1)
+#
+# 添加一列（PageRank、联想建议）只写入该列的文件，不重写整个语料。
+import argparse
+import csv
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+import time
+from array import array
+
+import numpy as np
+
+csv.field_size_limit(2**31 - 1)
+
+CORPUS_DIR = 'corpus'                   # 默认的语料目录
+META_FILE = 'meta.json'
+URL_INDEX = 'url.hash'
+NUMERIC_COLUMNS = ('pagerank',)         # 以 float64 存储的列
+VERSION = 1
+
+
+def is_corpus(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def url_hash(url_bytes):
+    return int.from_bytes(hashlib.blake2b(url_bytes, digest_size=8).digest(), 'little')
+
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, META_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+class StringColumn:
+    """
+    字符串列：按下标取值时才解码对应的字节，view 返回不复制的 memoryview
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def view(self, i):
+        return memoryview(self.blob)[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        blob = self.blob
+        bounds = self.offsets[start:].tolist()
+        for begin, end in zip(bounds, bounds[1:]):
+            yield str(blob[begin:end], 'utf-8')
+
+
+class _ColumnFiles:
+    """
+    写入一列：字符串列边写字节块边记录偏移量，数值列先收集到数组
+    """
+
+    def __init__(self, path, name, numeric, suffix=''):
+        self.path = path
+        self.name = name
+        self.numeric = numeric
+        self.suffix = suffix
+        if numeric:
+            self.values = array('d')
+        else:
+            self.offsets = array('Q', [0])
+            self.size = 0
+            self.blob = open(self.file('.bin'), 'wb')
+
+    def file(self, ext):
+        return os.path.join(self.path, self.name + ext + self.suffix)
+
+    def append(self, value):
+        if self.numeric:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                value = math.nan
+            self.values.append(value)
+        else:
+            data = ('' if value is None else str(value)).encode('utf-8')
+            self.blob.write(data)
+            self.size += len(data)
+            self.offsets.append(self.size)
+
+    def close(self):
+        if self.numeric:
+            with open(self.file('.f8'), 'wb') as f:
+                self.values.tofile(f)
+            return ['.f8']
+        self.blob.close()
+        with open(self.file('.off'), 'wb') as f:
+            self.offsets.tofile(f)
+        return ['.bin', '.off']
+
+
+def build_url_index(urls, path):
+    """
+    开放寻址（线性探测）哈希表，槽中存 行号 + 1，0 为空槽；URL 重复时保留第一行
+    """
+    size = 1 << max(4, (2 * len(urls)).bit_length())
+    slots = np.zeros(size, dtype=np.int64)
+    mask = size - 1
+    for row in range(len(urls)):
+        key = urls.view(row)
+        slot = url_hash(key) & mask
+        while slots[slot]:
+            if urls.view(slots[slot] - 1) == key:
+                break
+            slot = (slot + 1) & mask
+        else:
+            slots[slot] = row + 1
+    slots.tofile(path)
+
+
+class CorpusWriter:
+    """
+    逐行写入新语料：先写到临时目录，close 时整体替换旧语料，读者不会看到写了一半的语料
+    """
+
+    def __init__(self, path=CORPUS_DIR, columns=None, numeric=NUMERIC_COLUMNS):
+        self.path = path
+        self.tmp_path = path.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self.numeric = set(numeric)
+        self.columns = {}
+        self.rows = 0
+        for name in columns or ():
+            self._add(name)
+
+    def _add(self, name):
+        column = self.columns[name] = _ColumnFiles(self.tmp_path, name, name in self.numeric)
+        # 新出现的列，前面的行补空值
+        for _ in range(self.rows):
+            column.append(None)
+        return column
+
+    def append(self, row):
+        for name, value in row.items():
+            if name and name not in self.columns:
+                self._add(name)
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+        self.rows += 1
+
+    def close(self):
+        kinds = {}
+        for name, column in self.columns.items():
+            column.close()
+            kinds[name] = 'f8' if column.numeric else 'str'
+        if 'url' in self.columns:
+            build_url_index(Corpus._string_column(self.tmp_path, 'url'), os.path.join(self.tmp_path, URL_INDEX))
+        _write_meta(self.tmp_path, {'version': VERSION, 'rows': self.rows, 'columns': kinds})
+        old_path = self.path.rstrip(os.sep) + '.old'
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return Corpus(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class Corpus:
+    """
+    只读打开的语料，列在第一次访问时 mmap
+    """
+
+    def __init__(self, path=CORPUS_DIR):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != VERSION:
+            raise ValueError(f"{path} 不是本版本的语料目录")
+        self.rows = meta['rows']
+        self.kinds = meta['columns']
+        self._columns = {}
+        self._slots = None
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def columns(self):
+        return list(self.kinds)
+
+    @staticmethod
+    def _string_column(path, name):
+        offsets = np.frombuffer(_map(os.path.join(path, name + '.off')), dtype=np.uint64)
+        return StringColumn(offsets, _map(os.path.join(path, name + '.bin')))
+
+    def column(self, name):
+        """
+        字符串列返回 StringColumn，数值列返回只读的 numpy 数组
+        """
+        column = self._columns.get(name)
+        if column is None:
+            kind = self.kinds.get(name)
+            if kind is None:
+                raise KeyError(f"语料中没有 '{name}' 列")
+            if kind == 'f8':
+                data = _map(os.path.join(self.path, name + '.f8'))
+                column = np.frombuffer(data, dtype=np.float64) if data else np.zeros(0)
+            else:
+                column = self._string_column(self.path, name)
+            self._columns[name] = column
+        return column
+
+    def row_of(self, url):
+        """
+        URL 所在的行号，不存在时返回 None
+        """
+        if self._slots is None:
+            data = _map(os.path.join(self.path, URL_INDEX))
+            self._slots = np.frombuffer(data, dtype=np.int64)
+        key = url.encode('utf-8')
+        urls = self.column('url')
+        mask = len(self._slots) - 1
+        slot = url_hash(key) & mask
+        while True:
+            row = int(self._slots[slot])
+            if row == 0:
+                return None
+            if urls.view(row - 1) == key:
+                return row - 1
+            slot = (slot + 1) & mask
+
+    def value(self, name, row):
+        value = self.column(name)[row]
+        if self.kinds[name] == 'f8':
+            value = float(value)
+            return None if math.isnan(value) else value
+        return value
+
+    def get(self, url, columns=None):
+        row = self.row_of(url)
+        if row is None:
+            return None
+        return {name: self.value(name, row) for name in (columns or self.kinds)}
+
+    def records(self, columns=None, start=0):
+        """
+        按行产生只包含 columns 中各列的 dict（不存在的列跳过），与 csv.DictReader 的行兼容
+        """
+        names = [name for name in (columns or self.kinds) if name in self.kinds]
+        iterators = []
+        for name in names:
+            column = self.column(name)
+            if self.kinds[name] == 'f8':
+                values = column[start:].tolist()
+                iterators.append(None if math.isnan(value) else value for value in values)
+            else:
+                iterators.append(column.iter_from(start))
+        for values in zip(*iterators):
+            yield dict(zip(names, values))
+
+    def add_column(self, name, values, numeric=None):
+        """
+        添加或替换一列，values 与行一一对应；已有的列保持不变
+        """
+        numeric = name in NUMERIC_COLUMNS if numeric is None else numeric
+        files = _ColumnFiles(self.path, name, numeric, suffix='.tmp')
+        count = 0
+        for value in values:
+            files.append(value)
+            count += 1
+        if count != self.rows:
+            raise ValueError(f"'{name}' 列有 {count} 个值，语料有 {self.rows} 行")
+        for ext in files.close():
+            os.replace(files.file(ext), os.path.join(self.path, name + ext))
+        self._columns.pop(name, None)
+        self.kinds[name] = 'f8' if numeric else 'str'
+        _write_meta(self.path, {'version': VERSION, 'rows': self.rows, 'columns': self.kinds})
+
+
+def read_records(path, columns=None, start=0):
+    """
+    统一读取 CSV 文件或语料目录，产生 dict 行。语料目录只读取 columns 中的列，
+    CSV 总是返回整行；start 跳过前面的行
+    """
+    if is_corpus(path):
+        yield from Corpus(path).records(columns, start)
+        return
+    # utf-8-sig 会自动去掉列名中的 BOM 标记
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            if i >= start:
+                yield row
+
+
+def import_csv(csv_file_path, path=CORPUS_DIR):
+    with CorpusWriter(path) as writer:
+        for row in read_records(csv_file_path):
+            writer.append(row)
+    return writer.rows
+
+
+def export_csv(path, csv_file_path, columns=None):
+    corpus = Corpus(path)
+    fieldnames = [name for name in (columns or corpus.columns) if name in corpus.kinds]
+    count = 0
+    with open(csv_file_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in corpus.records(fieldnames):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="列式语料存储")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="从 CSV 导入")
+    import_parser.add_argument("csv_file_path")
+    import_parser.add_argument("path", nargs="?", default=CORPUS_DIR)
+
+    export_parser = subparsers.add_parser("export", help="导出为 CSV")
+    export_parser.add_argument("path")
+    export_parser.add_argument("csv_file_path")
+    export_parser.add_argument("--columns", nargs="+")
+
+    get_parser = subparsers.add_parser("get", help="按 URL 查看一行")
+    get_parser.add_argument("url")
+    get_parser.add_argument("--path", default=CORPUS_DIR)
+    get_parser.add_argument("--columns", nargs="+")
+
+    info_parser = subparsers.add_parser("info", help="行数与各列大小")
+    info_parser.add_argument("path", nargs="?", default=CORPUS_DIR)
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.command == "import":
+        count = import_csv(args.csv_file_path, args.path)
+        print(f"导入 {count} 行到 {args.path}，用时 {time.perf_counter() - start:.2f}s")
+    elif args.command == "export":
+        count = export_csv(args.path, args.csv_file_path, args.columns)
+        print(f"导出 {count} 行到 {args.csv_file_path}，用时 {time.perf_counter() - start:.2f}s")
+    elif args.command == "get":
+        row = Corpus(args.path).get(args.url, args.columns)
+        print(json.dumps(row, ensure_ascii=False, indent=2) if row else f"语料中没有 {args.url}")
+    elif args.command == "info":
+        corpus = Corpus(args.path)
+        print(f"{args.path}: {len(corpus)} 行")
+        for name, kind in corpus.kinds.items():
+            size = sum(os.path.getsize(os.path.join(args.path, name + ext))
+                       for ext in (('.f8',) if kind == 'f8' else ('.off', '.bin')))
+            print(f"  {name:<10} {kind:<4} {size / 1e6:10.2f}MB")
@@ -0,0 +1,128 @@
+import hashlib
+import sqlite3
+from datetime import datetime
+
+CRAWL_STATE_DB = 'crawl_state.db'   # 增量爬取记录的页面状态
+COMMIT_EVERY = 500                  # 每更新多少个页面提交一次事务
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    title TEXT,
+    links TEXT,
+    run INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_run ON pages (run);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    finished TEXT
+);
+"""
+
+
+def content_hash(title, text, linksurl):
+    """
+    页面内容的指纹：标题、清洗后的正文和出链都参与计算，出链变化也会影响 PageRank
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (title, text, linksurl):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class CrawlState:
+    """
+    增量爬取的页面状态（SQLite）：每个 URL 的 ETag、Last-Modified、内容指纹和出链，
+    以及最后一次访问到它的爬取轮次。本轮结束时没有访问到的页面视为已删除
+    """
+
+    def __init__(self, db_path=CRAWL_STATE_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.run = None
+        self._pending = 0
+
+    def start_run(self):
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO runs (started) VALUES (?)", (datetime.now().isoformat(),))
+        self.run = cursor.lastrowid
+        return self.run
+
+    def finish_run(self):
+        self.conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (datetime.now().isoformat(), self.run))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def get(self, url):
+        """
+        返回 (etag, last_modified, content_hash, title, links)，没有记录时返回 None
+        """
+        return self.conn.execute(
+            "SELECT etag, last_modified, content_hash, title, links FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def conditional_headers(self, url):
+        """
+        根据上次的响应生成条件请求头，页面未变化时服务器返回 304
+        """
+        page = self.get(url)
+        headers = {}
+        if page:
+            etag, last_modified = page[0], page[1]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def touch(self, url):
+        """
+        页面未变化（304 或内容指纹相同）：只记录本轮访问过
+        """
+        self.conn.execute("UPDATE pages SET run = ? WHERE url = ?", (self.run, url))
+        self._tick()
+
+    def update(self, url, etag, last_modified, digest, title, links):
+        """
+        记录页面的新状态，返回变化类型："new"、"changed"，内容未变化时返回 None
+        """
+        page = self.get(url)
+        if page is None:
+            change = 'new'
+        elif page[2] != digest:
+            change = 'changed'
+        else:
+            change = None
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, title, links, run)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", (url, etag, last_modified, digest, title, links, self.run))
+        self._tick()
+        return change
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def deleted(self):
+        """
+        取出本轮没有访问到的页面 (url, title) 并删除其记录，只应在爬取完整结束后调用
+        """
+        self.conn.commit()
+        rows = self.conn.execute("SELECT url, title FROM pages WHERE run < ?", (self.run,)).fetchall()
+        with self.conn:
+            self.conn.execute("DELETE FROM pages WHERE run < ?", (self.run,))
+        return rows
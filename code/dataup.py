@@ -1,112 +1,481 @@
-import pandas as pd
-from elasticsearch import Elasticsearch, helpers, exceptions
+from elasticsearch import ConnectionError as TransportConnectionError, ConnectionTimeout, Elasticsearch, helpers
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import hashlib
+import math
 import os
+import threading
+import time
 from tqdm import tqdm
 import json
 
+import metrics
+from corpus import read_records
+from segmenter import SEGMENT_META, load_segmenter
+
 # 配置参数
 CSV_FILE_PATH = 'finaloutput.csv'  # CSV文件路径
 ES_HOST = 'http://localhost:9200'      # Elasticsearch主机
-INDEX_NAME = 'xxjs'                     # Elasticsearch索引名称
+INDEX_NAME = 'xxjs'                     # Elasticsearch索引别名，实际数据在 xxjs_v<时间戳> 中
+NUMBER_OF_REPLICAS = 1                  # 上传完成后恢复的副本数
+REFRESH_INTERVAL = '1s'                 # 上传完成后恢复的刷新间隔
+KEEP_VERSIONS = 0                       # 切换别名后保留的旧版本索引数
 CHUNK_SIZE = 1000                       # 每批处理的行数，根据实际情况调整
+WORKERS = 4                             # 并发上传的线程数
+MAX_CHUNK_BYTES = 10 * 1024 * 1024      # 每批请求体的最大字节数
+MIN_CHUNK_BYTES = 256 * 1024            # 限流时批次字节数的下限
+MAX_RETRIES = 5                         # 429/连接错误的最大重试次数
+INITIAL_BACKOFF = 1                     # 首次重试等待（秒），之后指数增长
+MAX_BACKOFF = 60                        # 单次重试最长等待（秒）
+CHECKPOINT_PATH = 'dataup_checkpoint.json'  # 断点续传记录
 
-# 连接Elasticsearch
-es = Elasticsearch([ES_HOST])
-
-# 检查Elasticsearch连接
-if not es.ping():
-    raise ValueError("无法连接到Elasticsearch，请检查ES_HOST配置。")
-else:
-    print("成功连接到Elasticsearch。")
 
-# 确保索引存在
+# 索引映射
+# text 的子字段用于快速通配查询：
+# - index_prefixes：后缀通配（abc*）走前缀索引
+# - text.reversed：词项反转后索引，前缀通配（*abc）改写为反转字段上的前缀查询
+# - text.ngram：三元组索引，中缀通配（*abc*）改写为三元组短语查询
+# title_seg / text_seg 是入库前用 segmenter.py 分好词、以空格分隔的文本，
+# 按空格切分，短语查询和个性化词项过滤走这两个字段，词项比单字少且更有区分度
 mapping = {
+    "settings": {
+        "analysis": {
+            "analyzer": {
+                "reverse_analyzer": {"type": "custom", "tokenizer": "standard", "filter": ["lowercase", "reverse"]},
+                "trigram_analyzer": {"type": "custom", "tokenizer": "trigram_tokenizer", "filter": ["lowercase"]},
+                "segmented_analyzer": {"type": "custom", "tokenizer": "whitespace", "filter": ["lowercase"]}
+            },
+            "tokenizer": {
+                "trigram_tokenizer": {"type": "ngram", "min_gram": 3, "max_gram": 3, "token_chars": ["letter", "digit"]}
+            }
+        }
+    },
     "mappings": {
         "properties": {
             "title": {"type": "text"},
+            "title_seg": {"type": "text", "analyzer": "segmented_analyzer"},
             "url": {"type": "keyword"},
-            "text": {"type": "text"},
+            "text": {
+                "type": "text",
+                "index_prefixes": {"min_chars": 1, "max_chars": 10},
+                "fields": {
+                    "reversed": {"type": "text", "analyzer": "reverse_analyzer"},
+                    "ngram": {"type": "text", "analyzer": "trigram_analyzer"}
+                }
+            },
+            "text_seg": {"type": "text", "analyzer": "segmented_analyzer"},
             "linksurl": {"type": "keyword"},
             "pagerank": {"type": "float"},
-            "suggest": {"type": "completion"}
+            "suggest": {"type": "completion"},
+            "cluster": {"type": "keyword"}
         }
     }
 }
 
-if not es.indices.exists(index=INDEX_NAME):
-    es.indices.create(index=INDEX_NAME, body=mapping)
-    print(f"索引 '{INDEX_NAME}' 创建成功。")
-else:
-    print(f"索引 '{INDEX_NAME}' 已存在。")
-
-# 计算总行数以显示进度条
-with open(CSV_FILE_PATH, 'r', encoding='utf-8') as f:
-    total_lines = sum(1 for _ in f) - 1  # 减去表头
-print(f"总共有 {total_lines} 条数据需要上传。")
-
-# 初始化失败文档列表
-failed_documents = []
-
-# 读取CSV并分批上传
-chunks = pd.read_csv(CSV_FILE_PATH, chunksize=CHUNK_SIZE, encoding='utf-8')
-
-for chunk in tqdm(chunks, total=total_lines//CHUNK_SIZE + 1, desc="上传进度"):
-    # 构建批量操作
-    actions = []
-    for _, row in chunk.iterrows():
-        action = {
-            "_index": INDEX_NAME,
-            "_source": {
-                "title": row.get('title', ''),
-                "url": row.get('url', ''),
-                "text": row.get('text', ''),
-                "linksurl": row.get('linksurl', ''),
-                "pagerank": row.get('pagerank', ''),
-                "suggest": row.get('suggest', '')
-            }
-        }
-        actions.append(action)
-    
+
+def connect(es_host=ES_HOST):
+    # 连接Elasticsearch
+    es = Elasticsearch([es_host])
+
+    # 检查Elasticsearch连接
+    if not es.ping():
+        raise ValueError("无法连接到Elasticsearch，请检查ES_HOST配置。")
+    else:
+        print("成功连接到Elasticsearch。")
+    return es
+
+
+def create_versioned_index(es, alias=INDEX_NAME, segment_dict=None):
+    """
+    创建新版本索引，上传期间关闭刷新并且不设副本以加快写入。
+    segment_dict 为生成 title_seg / text_seg 的分词词典指纹，记录在 _meta 中，
+    search.py 只在本地词典与之一致时查询预分词字段
+    """
+    index_name = f"{alias}_v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    settings = dict(mapping["settings"], index={"refresh_interval": "-1", "number_of_replicas": 0})
+    body = dict(mapping, settings=settings)
+    if segment_dict:
+        body["mappings"] = dict(mapping["mappings"], _meta={SEGMENT_META: segment_dict})
+    es.indices.create(index=index_name, body=body)
+    print(f"索引 '{index_name}' 创建成功。")
+    return index_name
+
+
+def publish_index(es, index_name, alias=INDEX_NAME, replicas=NUMBER_OF_REPLICAS, keep_versions=KEEP_VERSIONS):
+    """
+    恢复刷新与副本设置、合并段，然后原子地把别名切换到新索引并删除旧版本
+    """
+    es.indices.put_settings(index=index_name, body={
+        "index": {"refresh_interval": REFRESH_INTERVAL, "number_of_replicas": replicas}
+    })
+    es.indices.refresh(index=index_name)
+    es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    if es.indices.exists_alias(name=alias):
+        old_indices = list(es.indices.get_alias(name=alias))
+        actions = [{"remove": {"index": old, "alias": alias}} for old in old_indices] + actions
+    elif es.indices.exists(index=alias):
+        # 旧版本直接写入了名为 xxjs 的索引，切换时一并删除
+        actions.append({"remove_index": {"index": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    print(f"别名 '{alias}' 已指向 '{index_name}'。")
+
+    versions = sorted(index for index in es.indices.get(index=f"{alias}_v*") if index != index_name)
+    stale = versions[:len(versions) - keep_versions] if keep_versions else versions
+    for old in stale:
+        es.indices.delete(index=old)
+        print(f"已删除旧索引 '{old}'。")
+
+
+def doc_id(url):
+    """
+    以 URL 的哈希作为文档 _id，便于按 URL 做局部更新
+    """
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def parse_pagerank(value):
+    """
+    CSV 中读到的 PageRank 是字符串，转换为数值后写入 _source，缺失时为 None
+    """
     try:
-        # 执行批量上传，设置 raise_on_error=False 以捕获错误而不中断
-        success, errors = helpers.bulk(es, actions, raise_on_error=False, request_timeout=60)
-        
-        if errors:
-            for error in errors:
-                # 提取错误信息
-                error_info = error.get('index', {}).get('error', {})
-                reason = error_info.get('reason', 'Unknown error')
-                failed_doc = error.get('index', {}).get('_source', {})
-                failed_documents.append({
-                    'document': failed_doc,
-                    'error': reason
-                })
-                print(f"文档上传失败: {reason}")
-    
-    except exceptions.BulkIndexError as bulk_error:
-        # 捕获BulkIndexError并记录详细信息
-        for error in bulk_error.errors:
-            error_info = error.get('index', {}).get('error', {})
-            reason = error_info.get('reason', 'Unknown error')
-            failed_doc = error.get('index', {}).get('_source', {})
-            failed_documents.append({
-                'document': failed_doc,
-                'error': reason
-            })
-            print(f"文档上传失败: {reason}")
-    except Exception as e:
-        # 捕获其他异常
-        print(f"发生异常: {e}")
-        continue
-
-# 上传完成后输出结果
-print("所有数据已尝试上传到Elasticsearch。")
-
-if failed_documents:
-    print(f"共有 {len(failed_documents)} 条文档上传失败。")
-    # 将失败的文档及错误原因保存到JSON文件中，便于后续分析
-    with open('failed_documents.json', 'w', encoding='utf-8') as f:
-        json.dump(failed_documents, f, ensure_ascii=False, indent=2)
-    print("失败的文档及错误原因已保存到 'failed_documents.json' 文件中。")
-else:
-    print("所有文档均成功上传。")
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def build_action(row, index_name=INDEX_NAME):
+    """
+    将一条记录（dict 或 pandas 行）转换为 bulk 索引操作
+    """
+    return {
+        "_index": index_name,
+        "_id": doc_id(str(row.get('url', ''))),
+        "_source": {
+            "title": row.get('title', ''),
+            "title_seg": row.get('title_seg', ''),
+            "url": row.get('url', ''),
+            "text": row.get('text', ''),
+            "text_seg": row.get('text_seg', ''),
+            "linksurl": row.get('linksurl', ''),
+            "pagerank": parse_pagerank(row.get('pagerank')),
+            "suggest": row.get('suggest', ''),
+            # 近似重复簇的规范 URL，未做去重时每个页面自成一簇
+            "cluster": row.get('cluster') or row.get('url', '')
+        }
+    }
+
+
+def build_delete_action(url, index_name=INDEX_NAME):
+    """
+    增量爬取中已删除页面对应的 bulk 删除操作
+    """
+    return {"_op_type": "delete", "_index": index_name, "_id": doc_id(url), "_source": {"url": url}}
+
+
+def collect_errors(errors, failed_documents):
+    for error in errors:
+        # 提取错误信息
+        item = next(iter(error.values()), {})
+        if item.get('status') == 404:
+            # 文档不存在（只作为链接目标出现的页面、或已被删除），无需更新
+            continue
+        reason = item.get('error', {}).get('reason', 'Unknown error')
+        failed_documents.append({
+            'document': item.get('_source', item.get('_id', {})),
+            'error': reason
+        })
+        print(f"文档上传失败: {reason}")
+
+
+def read_actions(csv_file_path, index_name=INDEX_NAME, start_offset=0):
+    """
+    逐行读取 CSV 或语料目录生成 (行号, bulk 操作)，跳过 start_offset 之前已提交的行
+    （语料目录直接从该行开始读取，不需要逐行解析前面的数据）
+    """
+    for offset, row in enumerate(read_records(csv_file_path, start=start_offset), start_offset):
+        yield offset, build_action(row, index_name)
+
+
+def serialize_action(action):
+    op_type = action.get("_op_type", "index")
+    meta = {op_type: {"_index": action["_index"], "_id": action["_id"]}}
+    if op_type == "delete":
+        return (json.dumps(meta) + "\n").encode('utf-8')
+    return (json.dumps(meta) + "\n" + json.dumps(action["_source"], ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def retryable(error):
+    """
+    只有连接错误（含超时）、429 限流和 5xx 可以重试；序列化错误、参数错误等重试也不会成功
+    """
+    if isinstance(error, (TransportConnectionError, ConnectionTimeout)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class Checkpoint:
+    """
+    记录已连续提交的最后行号，批次乱序完成时只推进到第一个未完成的批次
+    """
+
+    def __init__(self, path, csv_file_path):
+        self.path = path
+        self.csv_file_path = os.path.abspath(csv_file_path)
+        self.index = None
+        self.offset = 0
+        self._done = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('csv') == self.csv_file_path:
+                self.index = state.get('index')
+                self.offset = state.get('offset', 0)
+
+    def commit(self, start, end):
+        with self._lock:
+            self._done[start] = end
+            moved = False
+            while self.offset in self._done:
+                self.offset = self._done.pop(self.offset)
+                moved = True
+            if moved:
+                self.save()
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'csv': self.csv_file_path, 'index': self.index, 'offset': self.offset}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BulkIngestor:
+    """
+    多线程并发执行 _bulk 请求：
+    - 批次大小按字节数控制，遇到 429 时减半，成功后逐渐恢复
+    - 同时在途的批次数有上限，读取速度不会超过发送速度
+    - 429 和连接错误按指数退避重试，失败的文档记录到 failed_documents
+    """
+
+    def __init__(self, es, workers=WORKERS, chunk_size=CHUNK_SIZE, max_chunk_bytes=MAX_CHUNK_BYTES,
+                 max_retries=MAX_RETRIES, initial_backoff=INITIAL_BACKOFF, checkpoint=None):
+        self.es = es
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.checkpoint = checkpoint
+        self.failed_documents = []
+        self.indexed = 0
+        self.failed_batches = 0
+        self._lock = threading.Lock()
+
+    def batches(self, actions):
+        batch, size = [], 0
+        for offset, action in actions:
+            payload = serialize_action(action)
+            batch.append((offset, payload, action))
+            size += len(payload)
+            if len(batch) >= self.chunk_size or size >= self.chunk_bytes:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _throttle(self):
+        with self._lock:
+            self.chunk_bytes = max(MIN_CHUNK_BYTES, self.chunk_bytes // 2)
+
+    def _recover(self):
+        with self._lock:
+            self.chunk_bytes = min(self.max_chunk_bytes, int(self.chunk_bytes * 1.25))
+
+    def send(self, batch):
+        with metrics.span('ingest_chunk'):
+            return self._send(batch)
+
+    def _send(self, batch):
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(min(MAX_BACKOFF, self.initial_backoff * 2 ** (attempt - 1)))
+            try:
+                response = self.es.bulk(body=b"".join(doc[1] for doc in pending), request_timeout=60)
+            except Exception as e:
+                if not retryable(e):
+                    return self._give_up(batch, pending, str(e))
+                if getattr(e, 'status_code', None) == 429:
+                    self._throttle()
+                metrics.counter('ingest_retries_total', '_bulk 请求的重试次数', reason=type(e).__name__).inc()
+                error = str(e)
+                continue
+
+            rejected, indexed = [], 0
+            for doc, item in zip(pending, response['items']):
+                result = next(iter(item.values()))
+                if result.get('status') == 429:
+                    rejected.append(doc)
+                elif 'error' in result:
+                    self._fail([doc], result['error'].get('reason', 'Unknown error'))
+                else:
+                    indexed += 1
+            with self._lock:
+                self.indexed += indexed
+            metrics.counter('ingest_docs_total', '成功写入的文档数').inc(indexed)
+            if not rejected:
+                self._recover()
+                return True
+            self._throttle()
+            metrics.counter('ingest_retries_total', '_bulk 请求的重试次数', reason='rejected_docs').inc()
+            pending, error = rejected, "429 Too Many Requests"
+
+        # 重试次数用尽：不推进断点，下次可从这里续传
+        return self._give_up(batch, pending, error)
+
+    def _give_up(self, batch, pending, error):
+        """
+        批次未能完整写入：记录失败的文档，不推进断点，上传结束后也不切换别名
+        """
+        print(f"批次 {batch[0][0]}-{batch[-1][0]} 上传失败: {error}")
+        self._fail(pending, error)
+        with self._lock:
+            self.failed_batches += 1
+        return False
+
+    def _fail(self, docs, reason):
+        metrics.counter('ingest_failed_docs_total', '写入失败的文档数').inc(len(docs))
+        with self._lock:
+            for offset, _, action in docs:
+                self.failed_documents.append({'document': action['_source'], 'error': reason})
+
+    def run(self, actions, progress=None):
+        in_flight = threading.BoundedSemaphore(self.workers * 2)
+
+        def done(future, batch):
+            in_flight.release()
+            if progress is not None:
+                progress.update(len(batch))
+            try:
+                committed = future.result()
+            except Exception as e:
+                # send 中未预料的异常（如响应格式不对）在回调里不会被抛出，按失败批次处理
+                committed = self._give_up(batch, batch, repr(e))
+            if committed and self.checkpoint is not None:
+                self.checkpoint.commit(batch[0][0], batch[-1][0] + 1)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in self.batches(actions):
+                in_flight.acquire()
+                future = executor.submit(self.send, batch)
+                future.add_done_callback(lambda f, b=batch: done(f, b))
+        elapsed = time.perf_counter() - start
+        rate = self.indexed / elapsed if elapsed > 0 else 0.0
+        print(f"上传 {self.indexed} 条文档，用时 {elapsed:.2f}s，吞吐 {rate:.1f} docs/s")
+        return self.failed_documents
+
+
+def upload_csv(es, csv_file_path=CSV_FILE_PATH, alias=INDEX_NAME, workers=WORKERS,
+               checkpoint_path=CHECKPOINT_PATH, resume=True, keep_versions=KEEP_VERSIONS, segment_dict=None):
+    """
+    上传到新版本索引，全部批次提交后才切换别名，搜索始终看到完整的数据
+    """
+    checkpoint = Checkpoint(checkpoint_path, csv_file_path)
+    if resume and checkpoint.index and es.indices.exists(index=checkpoint.index):
+        index_name = checkpoint.index
+        print(f"从第 {checkpoint.offset} 行继续上传到 '{index_name}'。")
+    else:
+        index_name = create_versioned_index(es, alias, segment_dict)
+        checkpoint.index, checkpoint.offset = index_name, 0
+        checkpoint.save()
+
+    ingestor = BulkIngestor(es, workers=workers, checkpoint=checkpoint)
+    with tqdm(desc="上传进度", unit="docs") as progress:
+        failed_documents = ingestor.run(read_actions(csv_file_path, index_name, checkpoint.offset), progress)
+
+    if ingestor.failed_batches:
+        print(f"有 {ingestor.failed_batches} 个批次未能提交，别名未切换，重新运行将从第 {checkpoint.offset} 行继续。")
+        return failed_documents
+
+    checkpoint.clear()
+    publish_index(es, index_name, alias, keep_versions=keep_versions)
+    return failed_documents
+
+
+def update_pagerank(es, pagerank_data, index_name=INDEX_NAME):
+    """
+    只对 PageRank 发生变化的文档做局部更新，无需重新上传全部语料
+    """
+    actions = (
+        {
+            "_op_type": "update",
+            "_index": index_name,
+            "_id": doc_id(url),
+            "doc": {"pagerank": score}
+        }
+        for url, score in pagerank_data.items()
+    )
+    failed_documents = []
+    success, errors = helpers.bulk(es, actions, chunk_size=CHUNK_SIZE, raise_on_error=False, request_timeout=60)
+    if errors:
+        collect_errors(errors, failed_documents)
+    print(f"已更新 {success} 条文档的 PageRank。")
+    return failed_documents
+
+
+def report_failures(failed_documents):
+    if failed_documents:
+        print(f"共有 {len(failed_documents)} 条文档上传失败。")
+        # 将失败的文档及错误原因保存到JSON文件中，便于后续分析
+        with open('failed_documents.json', 'w', encoding='utf-8') as f:
+            json.dump(failed_documents, f, ensure_ascii=False, indent=2)
+        print("失败的文档及错误原因已保存到 'failed_documents.json' 文件中。")
+    else:
+        print("所有文档均成功上传。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="上传数据到 Elasticsearch")
+    parser.add_argument("--csv", default=CSV_FILE_PATH, help="要上传的 CSV 文件或语料目录")
+    parser.add_argument("--es-host", default=ES_HOST)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="并发上传的线程数")
+    parser.add_argument("--no-resume", action="store_true", help="忽略断点记录，从头上传")
+    parser.add_argument("--keep-versions", type=int, default=KEEP_VERSIONS, help="切换别名后保留的旧版本索引数")
+    parser.add_argument("--pagerank-delta", help="只更新该 JSON 文件中 URL 的 PageRank（由 pagerank.py --incremental 生成）")
+    parser.add_argument("--segment-dict", help="CSV 中的 title_seg、text_seg 由该分词词典生成（pipeline.py --segment），记录到索引中")
+    parser.add_argument("--metrics", help="结束时把各阶段耗时等指标写入该文件（.prom 为 Prometheus 格式，否则为 JSON lines）")
+    args = parser.parse_args()
+
+    segment_dict = None
+    if args.segment_dict:
+        segmenter = load_segmenter(args.segment_dict)
+        if segmenter is None:
+            parser.error(f"分词词典 '{args.segment_dict}' 不存在")
+        segment_dict = segmenter.fingerprint
+
+    es = connect(args.es_host)
+
+    if args.pagerank_delta:
+        with open(args.pagerank_delta, 'r', encoding='utf-8') as f:
+            failed_documents = update_pagerank(es, json.load(f))
+    else:
+        failed_documents = upload_csv(es, args.csv, workers=args.workers, resume=not args.no_resume,
+                                      keep_versions=args.keep_versions, segment_dict=segment_dict)
+        # 上传完成后输出结果
+        print("所有数据已尝试上传到Elasticsearch。")
+
+    report_failures(failed_documents)
+    if args.metrics:
+        metrics.REGISTRY.dump(args.metrics)
+        print(metrics.REGISTRY.report('ingest'))
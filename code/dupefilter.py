@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.job import job_dir
+
+logger = logging.getLogger(__name__)
+
+BLOOM_CAPACITY = 2000000     # 预计的 URL 数
+BLOOM_ERROR_RATE = 0.001     # 可接受的误判率
+SEEN_FILTER_FILE = 'seen_urls.bloom'   # JOBDIR 中保存过滤器的文件名
+SAVE_SECONDS = 60            # 运行期间每隔这么久保存一次过滤器
+
+INDEX_PAGE = re.compile(r'/(index|default)\.(htm|html|shtml|php|jsp|asp|aspx)$', re.I)
+
+
+def canonicalize_url(url):
+    """
+    规范化 URL：小写协议和主机名，去掉默认端口、片段、重复斜杠、末尾斜杠和
+    index.htm 之类的默认页，查询参数排序。无法解析时返回 None
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    host = (parts.hostname or '').lower()
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    path = INDEX_PAGE.sub('/', path)
+    if path != '/':
+        path = path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), netloc, path, query, ''))
+
+
+def canonical_key(url):
+    """
+    去重用的键：在规范化的基础上忽略 http/https 的区别
+    """
+    canonical = canonicalize_url(url)
+    return canonical.split('://', 1)[-1] if canonical else None
+
+
+def canonical_url(url):
+    """
+    作为页面键输出的 URL（爬取结果的 url、linksurl，进而是 PageRank 图的节点）：
+    与 canonical_key 一样不区分 http/https，统一写成 http
+    """
+    key = canonical_key(url)
+    return 'http://' + key if key else None
+
+
+def in_domain(url, domain):
+    """
+    只接受主机名是 domain 或其子域名的 http(s) 链接，查询参数中带有域名的不算
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    host = (parts.hostname or '').lower()
+    return parts.scheme in ('http', 'https') and (host == domain or host.endswith('.' + domain))
+
+
+class BloomFilter:
+    """
+    定长位数组的布隆过滤器，用 blake2b 的两个 64 位分量做双重哈希
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """
+        加入 key，返回加入前是否（可能）已存在
+        """
+        seen = True
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                seen = False
+                self.bits[byte] |= 1 << bit
+        if not seen:
+            self.count += 1
+        return seen
+
+    def __contains__(self, key):
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(key))
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def false_positive_rate(self):
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def save(self, path):
+        header = f"{self.num_bits} {self.num_hashes} {self.count}\n".encode('ascii')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            num_bits, num_hashes, count = map(int, f.readline().split())
+            bloom = cls.__new__(cls)
+            bloom.num_bits, bloom.num_hashes, bloom.count = num_bits, num_hashes, count
+            bloom.bits = bytearray(f.read())
+        return bloom
+
+
+def seen_filter_path(settings):
+    """
+    持久化过滤器的路径：只在设置了 JOBDIR 时保存，与 Scrapy 保存在 JOBDIR 中的请求队列一起用于断点续爬；
+    否则每次运行都是完整的爬取。增量爬取需要重新访问所有页面（未变化的返回 304），也不保存
+    """
+    directory = job_dir(settings)
+    if directory is None or settings.getbool('INCREMENTAL_CRAWL'):
+        return None
+    return os.path.join(directory, settings.get('SEEN_FILTER_FILE', SEEN_FILTER_FILE))
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """
+    Scrapy 去重过滤器：按规范化后的 URL 去重。设置 JOBDIR 时布隆过滤器保存在其中，
+    运行期间每 save_seconds 秒保存一次，结束时再保存一次，中断后用同一 JOBDIR 继续
+    """
+
+    def __init__(self, path=None, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE, save_seconds=SAVE_SECONDS):
+        self.path = path
+        self.resumed = bool(path) and os.path.exists(path)
+        if self.resumed:
+            self.bloom = BloomFilter.load(path)
+        else:
+            self.bloom = BloomFilter(capacity, error_rate)
+        self.save_seconds = save_seconds
+        self.duplicates = 0
+        self._saved = time.monotonic()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(seen_filter_path(settings),
+                   settings.getint('SEEN_FILTER_CAPACITY', BLOOM_CAPACITY),
+                   settings.getfloat('SEEN_FILTER_ERROR_RATE', BLOOM_ERROR_RATE),
+                   settings.getfloat('SEEN_FILTER_SAVE_SECONDS', SAVE_SECONDS))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings)
+
+    def request_seen(self, request):
+        key = canonical_key(request.url) or request.url
+        if self.bloom.add(key):
+            self.duplicates += 1
+            return True
+        if self.path and time.monotonic() - self._saved >= self.save_seconds:
+            # 保存的过滤器只会落后于 JOBDIR 中的队列，崩溃后多出的只是少量重复请求，不会漏掉页面
+            self.bloom.save(self.path)
+            self._saved = time.monotonic()
+        return False
+
+    def log(self, request, spider):
+        spider.crawler.stats.inc_value('dupefilter/filtered')
+
+    def close(self, reason):
+        if self.path:
+            self.bloom.save(self.path)
+        logger.info("已记录 %d 个 URL，过滤重复请求 %d 个，过滤器占用 %.1f MB，估计误判率 %.2e",
+                    self.bloom.count, self.duplicates, self.bloom.nbytes / 1024 / 1024,
+                    self.bloom.false_positive_rate())
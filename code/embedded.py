@@ -0,0 +1,721 @@
+# 嵌入式搜索后端：纯 Python + NumPy 的位置倒排索引，BM25 打分，
+# 由 finaloutput.csv 构建，保存为单个可 mmap 的文件。
+# EmbeddedBackend 实现了 SearchEngine 用到的 Elasticsearch 客户端接口子集
+# （ping、search、msearch、point-in-time、indices.get_alias / get_mapping），查询体仍是同样的 ES DSL，可直接替换 ES。
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+
+import numpy as np
+
+from corpus import read_records
+from segmenter import SEGMENT_META, load_segmenter
+from suggester import Suggester
+
+EMBEDDED_INDEX = 'embedded.idx'   # 嵌入式索引文件
+K1 = 1.2                          # BM25 参数，与 ES 默认值相同
+B = 0.75
+
+MAGIC = b'NKEI'
+VERSION = 1
+HEADER = struct.Struct('<4sII')   # 魔数、版本、元数据长度
+ALIGN = 8
+
+# 与 ES standard 分词器一致：汉字按单字切分，其他按字母数字串切分，统一小写
+TOKEN = re.compile(r'[一-鿿]|[^\W_一-鿿]+')
+
+
+def analyze(text):
+    return TOKEN.findall(text.lower())
+
+
+def analyze_segmented(text):
+    # text_seg 入库前已分好词，与 segmented_analyzer 一样按空格切分
+    return text.lower().split()
+
+
+ANALYZERS = {'text': analyze, 'text_seg': analyze_segmented}
+SCORE_SORT = [{'_score': 'desc'}, {'_shard_doc': 'asc'}]   # 支持的唯一排序：得分降序，同分按文档编号
+STORED_FIELDS = ['title', 'url', 'text', 'cluster']
+
+# 一个 UTF-8 字符，用于在字节形式的词典上执行通配符匹配
+_UTF8_CHAR = rb'(?:[\x00-\x7f]|[\xc0-\xdf][\x80-\xbf]|[\xe0-\xef][\x80-\xbf]{2}|[\xf0-\xf7][\x80-\xbf]{3})'
+
+
+def wildcard_regex(pattern):
+    """
+    把 ES 通配符模式（* 和 ?）转换为在换行分隔的词典字节串上逐行匹配的正则
+    """
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append(rb'[^\n]*')
+        elif char == '?':
+            parts.append(_UTF8_CHAR)
+        else:
+            parts.append(re.escape(char.encode('utf-8')))
+    return re.compile(rb'^' + b''.join(parts) + rb'$', re.M)
+
+
+class _Strings:
+    """
+    按偏移量从 UTF-8 字节块中取字符串（字符串之间以换行分隔），支持 bisect
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1] - 1], 'utf-8')
+
+
+def _pack_strings(strings):
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.replace('\n', ' ').encode('utf-8')
+        blob += b'\n'
+        offsets.append(len(blob))
+    return np.frombuffer(offsets, dtype=np.uint64), bytes(blob)
+
+
+def _intersect(a, b):
+    """
+    两个升序且无重复的数组求交：在较长的数组中二分查找较短数组的元素，不需要重新排序
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    found = np.searchsorted(b, a)
+    found[found == len(b)] = 0
+    return a[b[found] == a]
+
+
+def _ranges(starts, ends):
+    """
+    把若干个 [start, end) 区间展开成一个下标数组
+    """
+    lengths = (ends - starts).astype(np.int64)
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts.astype(np.int64) - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return shifts + np.arange(total, dtype=np.int64)
+
+
+class FieldIndex:
+    """
+    一个字段的位置倒排表：词典按字典序排列；第 t 个词的倒排表为 docs/tfs[term_ptr[t]:term_ptr[t+1]]，
+    第 p 条倒排记录的位置为 positions[pos_ptr[p]:pos_ptr[p+1]]
+    """
+
+    def __init__(self, name, terms, term_ptr, docs, tfs, pos_ptr, positions, doclen, avgdl, n_docs):
+        self.name = name
+        self.terms = terms
+        self.term_ptr = term_ptr
+        self.docs = docs
+        self.tfs = tfs
+        self.pos_ptr = pos_ptr
+        self.positions = positions
+        self.doclen = doclen
+        self.avgdl = avgdl or 1.0
+        self.n_docs = n_docs
+
+    def term_id(self, term):
+        i = bisect.bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return None
+
+    def postings(self, term_id):
+        start, end = int(self.term_ptr[term_id]), int(self.term_ptr[term_id + 1])
+        return start, end
+
+    def idf(self, df):
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def _bm25(self, docs, freqs, idf):
+        norm = K1 * (1 - B + B * self.doclen[docs] / self.avgdl)
+        return idf * freqs * (K1 + 1) / (freqs + norm)
+
+    def term(self, term):
+        term_id = self.term_id(term)
+        if term_id is None:
+            return _empty()
+        start, end = self.postings(term_id)
+        docs = self.docs[start:end]
+        return docs, self._bm25(docs, self.tfs[start:end].astype(np.float64), self.idf(end - start))
+
+    def phrase(self, tokens):
+        """
+        短语匹配：先求各词倒排表的交集，再把各词位置减去其在短语中的偏移后求交，
+        匹配次数作为词频代入 BM25，idf 为各词 idf 之和（与 Lucene 一致）
+        """
+        if not tokens:
+            return _empty()
+        if len(tokens) == 1:
+            return self.term(tokens[0])
+        ranges = []
+        for token in tokens:
+            term_id = self.term_id(token)
+            if term_id is None:
+                return _empty()
+            ranges.append(self.postings(term_id))
+        docs = None
+        for start, end in sorted(ranges, key=lambda r: r[1] - r[0]):
+            term_docs = self.docs[start:end]
+            docs = term_docs if docs is None else _intersect(docs, term_docs)
+            if not len(docs):
+                return _empty()
+
+        matches = None
+        rank = np.arange(len(docs), dtype=np.int64) << 32
+        for offset, (start, end) in sorted(enumerate(ranges), key=lambda item: item[1][1] - item[1][0]):
+            entries = start + np.searchsorted(self.docs[start:end], docs)
+            counts = (self.pos_ptr[entries + 1] - self.pos_ptr[entries]).astype(np.int64)
+            positions = self.positions[_ranges(self.pos_ptr[entries], self.pos_ptr[entries + 1])].astype(np.int64)
+            keys = np.repeat(rank, counts) + positions - offset
+            matches = keys if matches is None else _intersect(matches, keys)
+            if not len(matches):
+                return _empty()
+        hit_ranks, freqs = np.unique(matches >> 32, return_counts=True)
+        docs = docs[hit_ranks]
+        idf = sum(self.idf(end - start) for start, end in ranges)
+        return docs, self._bm25(docs, freqs.astype(np.float64), idf)
+
+    def prefix_terms(self, prefix):
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix + '\U0010ffff', lo)
+        return range(lo, hi)
+
+    def wildcard_terms(self, pattern):
+        offsets = self.terms.offsets
+        starts = [match.start() for match in wildcard_regex(pattern).finditer(self.terms.blob)]
+        return np.searchsorted(offsets, np.array(starts, dtype=np.uint64), side='right') - 1
+
+    def docs_for_terms(self, term_ids):
+        """
+        命中任意一个词的文档（多词项查询与 ES 一样按常数得分）
+        """
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        if not len(term_ids):
+            return np.zeros(0, dtype=np.uint32)
+        entries = _ranges(self.term_ptr[term_ids], self.term_ptr[term_ids + 1])
+        return np.unique(self.docs[entries])
+
+
+def _empty():
+    return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float64)
+
+
+def _constant(docs, boost=1.0):
+    return docs, np.full(len(docs), boost, dtype=np.float64)
+
+
+def filter_source(source, spec):
+    """
+    与 ES 的 _source 参数相同：True/False、字段名、字段名列表或 {"includes": [...], "excludes": [...]}
+    """
+    if spec is True or spec is None:
+        return source
+    if spec is False:
+        return {}
+    if isinstance(spec, str):
+        spec = [spec]
+    if isinstance(spec, dict):
+        includes, excludes = spec.get('includes') or [], set(spec.get('excludes') or [])
+    else:
+        includes, excludes = spec, set()
+    fields = includes or list(source)
+    return {name: source[name] for name in fields if name in source and name not in excludes}
+
+
+# 高亮时在原文上匹配的一个词元内的字符（与 TOKEN 一致：汉字各自成词，字母数字连续成词）
+_WORD_CHAR = r'[^\W_\u4e00-\u9fff]'
+_HAN_OR_WORD = r'(?:[\u4e00-\u9fff]|[^\W_])'
+
+
+def _bounded(pattern):
+    # 不从字母数字词的中间开始或结束匹配
+    return re.compile(rf'(?<!{_WORD_CHAR}){pattern}(?!{_WORD_CHAR})', re.I)
+
+
+def _highlight_pattern(query):
+    """
+    从高亮查询中得到在原文上匹配的正则：短语按分词结果匹配（词之间允许标点和空白），
+    通配、前缀和单词项查询按词元匹配
+    """
+    kind, spec = next(iter(query.items()))
+    _, value = next(iter(spec.items()))
+    if isinstance(value, dict):
+        value = value.get('query', value.get('value', ''))
+    value = str(value)
+    if kind == 'match_phrase':
+        tokens = analyze(value)
+        return _bounded(r'[\W_]*'.join(map(re.escape, tokens))) if tokens else None
+    if kind in ('wildcard', 'prefix', 'term'):
+        if kind == 'prefix':
+            value += '*'
+        parts = [f'{_WORD_CHAR}*' if c == '*' else _HAN_OR_WORD if c == '?' else re.escape(c) for c in value]
+        return _bounded(''.join(parts)) if value.strip('*') else None
+    return None
+
+
+def snippet(text, pattern, fragment_size=200, no_match_size=0, pre_tag='<em>', post_tag='</em>'):
+    """
+    本地摘要：截取第一个匹配附近 fragment_size 个字符，并用标签包围其中的所有匹配。
+    没有匹配时返回开头 no_match_size 个字符，no_match_size 为 0 时返回 None
+    """
+    match = pattern.search(text) if pattern is not None else None
+    if match is None:
+        return text[:no_match_size] if no_match_size else None
+    start = max(0, min(match.start() - (fragment_size - (match.end() - match.start())) // 2,
+                       len(text) - fragment_size))
+    fragment = text[start:start + fragment_size]
+    return pattern.sub(lambda m: f"{pre_tag}{m.group(0)}{post_tag}" if m.group(0) else '', fragment)
+
+
+def highlight_fields(source, highlight):
+    """
+    按 ES highlight 参数为命中文档生成 {字段: [摘要]}，只支持 highlight_query 中的单个查询
+    """
+    query = highlight.get('highlight_query')
+    pattern = _highlight_pattern(query) if query else None
+    pre_tag = (highlight.get('pre_tags') or ['<em>'])[0]
+    post_tag = (highlight.get('post_tags') or ['</em>'])[0]
+    result = {}
+    for name, options in highlight.get('fields', {}).items():
+        options = dict(highlight, **(options or {}))
+        fragment = snippet(source.get(name) or '', pattern, options.get('fragment_size', 100),
+                           options.get('no_match_size', 0), pre_tag, post_tag)
+        if fragment:
+            result[name] = [fragment]
+    return result
+
+
+class EmbeddedIndex:
+    """
+    单文件索引：文件头 + JSON 元数据 + 按 8 字节对齐的各个数组，加载时用 mmap 零拷贝映射
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        magic, version, meta_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("不是有效的嵌入式索引文件。")
+        self.meta = json.loads(bytes(buffer[HEADER.size:HEADER.size + meta_length]))
+        self._base = HEADER.size + meta_length + (-(HEADER.size + meta_length) % ALIGN)
+        self.n_docs = self.meta['n_docs']
+        self.fields = {}
+        for name, info in self.meta['fields'].items():
+            section = lambda part: self._section(f"{name}.{part}")
+            self.fields[name] = FieldIndex(
+                name, _Strings(section('term_offsets'), section('terms')), section('term_ptr'),
+                section('docs'), section('tfs'), section('pos_ptr'), section('positions'),
+                section('doclen'), info['avgdl'], self.n_docs)
+        self.stored = {name: _Strings(self._section(f"stored.{name}.offsets"), self._section(f"stored.{name}"))
+                       for name in STORED_FIELDS}
+        self.pagerank = self._section('pagerank')
+        suggest = self._section('suggest')
+        self.suggester = Suggester(suggest) if len(suggest) else None
+
+    def _section(self, name):
+        offset, length, dtype = self.meta['sections'][name]
+        dtype = np.dtype(dtype)
+        if dtype == np.uint8:
+            return memoryview(self.buffer)[self._base + offset:self._base + offset + length]
+        return np.frombuffer(self.buffer, dtype=dtype, count=length // dtype.itemsize, offset=self._base + offset)
+
+    @classmethod
+    def load(cls, path=EMBEDDED_INDEX):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def version(self):
+        return self.meta['built']
+
+    def source(self, doc):
+        source = {name: strings[doc] for name, strings in self.stored.items()}
+        pagerank = float(self.pagerank[doc])
+        if not math.isnan(pagerank):
+            source['pagerank'] = pagerank
+        return source
+
+
+def build_index(records, path=EMBEDDED_INDEX, verbose=True, segment_dict=None):
+    """
+    从记录（finaloutput.csv 的行）构建索引：所有 (词, 文档, 位置) 三元组收集到整数数组中，
+    最后一次排序生成倒排表。segment_dict 为生成 text_seg 的分词词典指纹，与 ES 索引一样记录在 _meta 中
+    """
+    start = time.perf_counter()
+    stored = {name: [] for name in STORED_FIELDS}
+    pageranks = array('d')
+    suggestions = {}
+    vocab = {name: {} for name in ANALYZERS}
+    triples = {name: (array('I'), array('I'), array('I')) for name in ANALYZERS}
+    doclens = {name: array('I') for name in ANALYZERS}
+
+    for doc, row in enumerate(records):
+        for name in STORED_FIELDS:
+            stored[name].append(row.get(name) or '')
+        if not stored['cluster'][-1]:
+            stored['cluster'][-1] = stored['url'][-1]
+        try:
+            pagerank = float(row.get('pagerank'))
+        except (TypeError, ValueError):
+            pagerank = math.nan
+        pageranks.append(pagerank)
+        suggestion = (row.get('suggest') or '').strip()
+        if suggestion:
+            suggestions[suggestion] = max(suggestions.get(suggestion, 0.0), 0.0 if math.isnan(pagerank) else pagerank)
+
+        for name, analyzer in ANALYZERS.items():
+            tokens = analyzer(row.get(name) or '')
+            term_ids, docs, positions = triples[name]
+            ids = vocab[name]
+            for position, token in enumerate(tokens):
+                term_id = ids.get(token)
+                if term_id is None:
+                    term_id = ids[token] = len(ids)
+                term_ids.append(term_id)
+            docs.extend([doc] * len(tokens))
+            positions.extend(range(len(tokens)))
+            doclens[name].append(len(tokens))
+    n_docs = len(pageranks)
+
+    sections = {}
+    meta = {'n_docs': n_docs, 'built': time.strftime('%Y%m%d%H%M%S'), 'fields': {},
+            '_meta': {SEGMENT_META: segment_dict} if segment_dict else {}}
+    for name in ANALYZERS:
+        terms = sorted(vocab[name])
+        rank = np.zeros(len(terms), dtype=np.int64)
+        rank[[vocab[name][term] for term in terms]] = np.arange(len(terms))
+        term_ids, docs, positions = (np.frombuffer(a, dtype=np.uint32) for a in triples[name])
+        term_ids = rank[term_ids] if len(term_ids) else term_ids.astype(np.int64)
+        order = np.lexsort((positions, docs, term_ids))
+        term_ids, docs, positions = term_ids[order], docs[order], positions[order]
+
+        # 每个 (词, 文档) 组合是一条倒排记录
+        keys = (term_ids << 32) | docs.astype(np.int64)
+        entry_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, np.int64)
+        entry_terms = term_ids[entry_starts]
+        pos_ptr = np.append(entry_starts, len(positions)).astype(np.uint64)
+        term_ptr = np.searchsorted(entry_terms, np.arange(len(terms) + 1)).astype(np.uint64)
+        term_offsets, term_blob = _pack_strings(terms)
+        doclen = np.frombuffer(doclens[name], dtype=np.uint32)
+        sections.update({
+            f"{name}.term_offsets": term_offsets,
+            f"{name}.terms": term_blob,
+            f"{name}.term_ptr": term_ptr,
+            f"{name}.docs": docs[entry_starts].astype(np.uint32),
+            f"{name}.tfs": np.diff(pos_ptr).astype(np.uint32),
+            f"{name}.pos_ptr": pos_ptr,
+            f"{name}.positions": positions.astype(np.uint32),
+            f"{name}.doclen": doclen,
+        })
+        meta['fields'][name] = {'avgdl': float(doclen.mean()) if n_docs else 0.0, 'terms': len(terms)}
+
+    for name in STORED_FIELDS:
+        offsets, blob = _pack_strings(stored[name])
+        sections[f"stored.{name}.offsets"] = offsets
+        sections[f"stored.{name}"] = blob
+    sections['pagerank'] = np.frombuffer(pageranks, dtype=np.float64)
+    sections['suggest'] = Suggester.build(suggestions).buffer if suggestions else b''
+
+    meta['sections'] = {}
+    position = 0
+    for name, data in sections.items():
+        dtype = data.dtype.str if isinstance(data, np.ndarray) else '|u1'
+        length = data.nbytes if isinstance(data, np.ndarray) else len(data)
+        meta['sections'][name] = [position, length, dtype]
+        position += length + (-length % ALIGN)
+    meta_bytes = json.dumps(meta).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(b'\0' * (-(HEADER.size + len(meta_bytes)) % ALIGN))
+        for data in sections.values():
+            raw = data.tobytes() if isinstance(data, np.ndarray) else data
+            f.write(raw)
+            f.write(b'\0' * (-len(raw) % ALIGN))
+    os.replace(tmp_path, path)
+    if verbose:
+        print(f"嵌入式索引已保存到 {path}：{n_docs} 篇文档，"
+              + "，".join(f"{name} {info['terms']} 个词" for name, info in meta['fields'].items())
+              + f"，{os.path.getsize(path) / 1024 / 1024:.1f} MB，用时 {time.perf_counter() - start:.2f}s")
+
+
+class EmbeddedBackend:
+    """
+    以 Elasticsearch 客户端的方式使用嵌入式索引，支持 SearchEngine 生成的查询：
+    match_phrase、term、prefix、wildcard（含 text.reversed / text.ngram 改写）、terms 过滤、
+    function_score（field_value_factor 与 filter + weight）、collapse 以及 completion 联想
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.indices = _Indices(self)
+
+    @classmethod
+    def load(cls, path=EMBEDDED_INDEX):
+        return cls(EmbeddedIndex.load(path))
+
+    def ping(self):
+        return True
+
+    def search(self, index=None, body=None, size=None, **kwargs):
+        start = time.perf_counter()
+        body = body or {}
+        size = size if size is not None else body.get('size', 10)
+        response = {'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []}}
+        if 'pit' in body:
+            # 索引文件不可变，point-in-time 即当前版本；版本变化后旧的 id 失效
+            if body['pit'].get('id') != self._pit_id():
+                raise ValueError("point-in-time 已失效")
+            response['pit_id'] = self._pit_id()
+        if 'query' in body:
+            docs, scores = self.evaluate(body['query'])
+            sort = body.get('sort')
+            if sort is not None and sort != SCORE_SORT and sort != ['_score']:
+                raise ValueError(f"嵌入式索引只支持按得分排序: {sort}")
+            total = len(docs)
+            if body.get('search_after'):
+                # 排序键为 (得分降序, 文档编号升序)，只保留排在 search_after 之后的文档
+                after_score, after_doc = body['search_after']
+                keep = (scores < after_score) | ((scores == after_score) & (docs > after_doc))
+                docs, scores = docs[keep], scores[keep]
+            response['hits'] = self._hits(docs, scores, body.get('from', 0), size, body.get('collapse'),
+                                          body.get('_source', True), body.get('highlight'), sort is not None)
+            response['hits']['total']['value'] = total
+        if 'suggest' in body:
+            response['suggest'] = self._suggest(body['suggest'])
+        response['took'] = int((time.perf_counter() - start) * 1000)
+        return response
+
+    def _pit_id(self):
+        return f"embedded_{self.index.version}"
+
+    def open_point_in_time(self, index=None, keep_alive=None, **kwargs):
+        return {'id': self._pit_id()}
+
+    def close_point_in_time(self, id=None, body=None, **kwargs):
+        return {'succeeded': True, 'num_freed': 1}
+
+    def msearch(self, body=None, searches=None, index=None, **kwargs):
+        """
+        与 ES 的 _msearch 相同：searches 为交替的 header / 查询体，单个查询出错不影响其他查询
+        """
+        start = time.perf_counter()
+        searches = searches if searches is not None else body
+        responses = []
+        for header, query in zip(searches[::2], searches[1::2]):
+            try:
+                response = self.search(index=header.get('index', index), body=query)
+                response['status'] = 200
+            except ValueError as e:
+                response = {'error': {'type': 'parsing_exception', 'reason': str(e)}, 'status': 400}
+            responses.append(response)
+        return {'took': int((time.perf_counter() - start) * 1000), 'responses': responses}
+
+    def _hits(self, docs, scores, offset, size, collapse, source_filter=True, highlight=None, sort_values=False):
+        order = np.argsort(-scores, kind='stable')
+        field = (collapse or {}).get('field')
+        stored = self.index.stored.get(field) if field else None
+        if field and stored is None:
+            raise ValueError(f"嵌入式索引中没有可折叠的字段 {field}")
+        hits, seen = [], set()
+        for i in order.tolist():
+            doc = int(docs[i])
+            if stored is not None:
+                key = stored[doc]
+                if key in seen:
+                    continue
+                seen.add(key)
+            if offset:
+                offset -= 1
+                continue
+            source = self.index.source(doc)
+            hit = {'_id': str(doc), '_score': float(scores[i]), '_source': filter_source(source, source_filter)}
+            if sort_values:
+                hit['sort'] = [float(scores[i]), doc]
+            if highlight:
+                fragments = highlight_fields(source, highlight)
+                if fragments:
+                    hit['highlight'] = fragments
+            hits.append(hit)
+            if len(hits) >= size:
+                break
+        return {'total': {'value': len(docs), 'relation': 'eq'}, 'hits': hits}
+
+    def _suggest(self, suggest):
+        result = {}
+        for name, spec in suggest.items():
+            completion = spec.get('completion', {})
+            options = []
+            if self.index.suggester is not None:
+                texts = self.index.suggester.suggest(spec.get('prefix', ''), k=completion.get('size', 5),
+                                                     fuzzy='fuzzy' in completion)
+                options = [{'text': text} for text in texts]
+            result[name] = [{'text': spec.get('prefix', ''), 'options': options}]
+        return result
+
+    def _field(self, name):
+        field = self.index.fields.get(name.split('.')[0])
+        if field is None:
+            raise ValueError(f"嵌入式索引中没有字段 {name}")
+        return field
+
+    @staticmethod
+    def _clause(spec, key):
+        field, value = next(iter(spec.items()))
+        if isinstance(value, dict):
+            return field, value.get(key), value.get('boost', 1.0)
+        return field, value, 1.0
+
+    def evaluate(self, query):
+        """
+        返回 (文档数组, 得分数组)，文档按编号升序排列
+        """
+        kind, spec = next(iter(query.items()))
+        if kind == 'match_all':
+            return _constant(np.arange(self.index.n_docs, dtype=np.uint32))
+        if kind == 'match_phrase':
+            name, text, boost = self._clause(spec, 'query')
+            field = self._field(name)
+            if name.endswith('.ngram'):
+                # 三元组短语即子串匹配：在单个词内部时按词典中缀匹配，跨词时按原字段短语匹配
+                tokens = analyze(text)
+                if len(tokens) > 1:
+                    docs, scores = field.phrase(tokens)
+                    return docs, scores * boost
+                return _constant(field.docs_for_terms(field.wildcard_terms(f"*{text.lower()}*")), boost)
+            docs, scores = field.phrase(ANALYZERS[field.name](text))
+            return docs, scores * boost
+        if kind == 'term':
+            name, value, boost = self._clause(spec, 'value')
+            docs, scores = self._field(name).term(str(value).lower())
+            return docs, scores * boost
+        if kind == 'prefix':
+            name, value, boost = self._clause(spec, 'value')
+            field = self._field(name)
+            value = value.lower()
+            if name.endswith('.reversed'):
+                # 反转字段上的前缀即原字段上的后缀
+                return _constant(field.docs_for_terms(field.wildcard_terms('*' + value[::-1])), boost)
+            return _constant(field.docs_for_terms(field.prefix_terms(value)), boost)
+        if kind == 'wildcard':
+            name, value, boost = self._clause(spec, 'value')
+            field = self._field(name)
+            value = value.lower()
+            if name.endswith('.reversed'):
+                value = value[::-1]
+            return _constant(field.docs_for_terms(field.wildcard_terms(value)), boost)
+        if kind == 'terms':
+            name, values = next((k, v) for k, v in spec.items() if k != 'boost')
+            field = self._field(name)
+            term_ids = [term_id for term_id in (field.term_id(str(v).lower()) for v in values) if term_id is not None]
+            return _constant(field.docs_for_terms(term_ids), spec.get('boost', 1.0))
+        if kind == 'function_score':
+            return self._function_score(spec)
+        raise ValueError(f"嵌入式索引不支持的查询: {kind}")
+
+    def _function_score(self, spec):
+        docs, scores = self.evaluate(spec.get('query', {'match_all': {}}))
+        factors = np.ones(len(docs))
+        score_mode = spec.get('score_mode', 'multiply')
+        if score_mode != 'multiply':
+            raise ValueError(f"嵌入式索引不支持的 score_mode: {score_mode}")
+        for function in spec.get('functions', []):
+            value = np.full(len(docs), float(function.get('weight', 1.0)))
+            if 'field_value_factor' in function:
+                factor = function['field_value_factor']
+                if factor.get('field') != 'pagerank':
+                    raise ValueError("嵌入式索引的 field_value_factor 只支持 pagerank 字段")
+                values = self.index.pagerank[docs].astype(np.float64)
+                values = np.where(np.isnan(values), factor.get('missing', 1.0), values) * factor.get('factor', 1.0)
+                modifier = factor.get('modifier', 'none')
+                if modifier == 'sqrt':
+                    values = np.sqrt(values)
+                elif modifier == 'log1p':
+                    values = np.log10(1 + values)
+                elif modifier != 'none':
+                    raise ValueError(f"嵌入式索引不支持的 modifier: {modifier}")
+                value *= values
+            if 'filter' in function:
+                matched, _ = self.evaluate(function['filter'])
+                value = np.where(np.isin(docs, matched, assume_unique=True), value, 1.0)
+            factors *= value
+        boost_mode = spec.get('boost_mode', 'multiply')
+        if boost_mode == 'multiply':
+            return docs, scores * factors
+        if boost_mode == 'replace':
+            return docs, factors
+        if boost_mode == 'sum':
+            return docs, scores + factors
+        raise ValueError(f"嵌入式索引不支持的 boost_mode: {boost_mode}")
+
+
+class _Indices:
+    """
+    indices.get_alias：返回以构建时间命名的版本，供查询缓存判断索引是否变化；
+    indices.get_mapping：只返回构建时记录的 _meta
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_alias(self, name=None, **kwargs):
+        return {f"embedded_{self.backend.index.version}": {'aliases': {name: {}}}}
+
+    def get_mapping(self, index=None, **kwargs):
+        return {f"embedded_{self.backend.index.version}": {'mappings': {'_meta': self.backend.index.meta.get('_meta', {})}}}
+
+
+def read_rows(csv_file_path):
+    # CSV 文件或语料目录
+    return read_records(csv_file_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="嵌入式搜索索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="从 finaloutput.csv 或语料目录构建嵌入式索引")
+    build_parser.add_argument("csv_file_path", nargs="?", default="finaloutput.csv")
+    build_parser.add_argument("--output", default=EMBEDDED_INDEX)
+    build_parser.add_argument("--segment-dict", help="输入中的 text_seg 由该分词词典生成（pipeline.py --segment），记录到索引中")
+
+    query_parser = subparsers.add_parser("query", help="短语查询")
+    query_parser.add_argument("phrase")
+    query_parser.add_argument("--index", default=EMBEDDED_INDEX)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        segment_dict = None
+        if args.segment_dict:
+            segmenter = load_segmenter(args.segment_dict)
+            if segmenter is None:
+                parser.error(f"分词词典 '{args.segment_dict}' 不存在")
+            segment_dict = segmenter.fingerprint
+        build_index(read_rows(args.csv_file_path), args.output, segment_dict=segment_dict)
+    elif args.command == "query":
+        backend = EmbeddedBackend.load(args.index)
+        response = backend.search(body={"query": {"match_phrase": {"text": args.phrase}}}, size=10)
+        for hit in response['hits']['hits']:
+            print(f"{hit['_score']:.4f}  {hit['_source']['title']}  {hit['_source']['url']}")
+        print(f"命中 {response['hits']['total']['value']} 篇，用时 {response['took']}ms")
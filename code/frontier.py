@@ -0,0 +1,591 @@
+import csv
+import logging
+import math
+import os
+import socket
+import sqlite3
+import sys
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from scrapy import Request, signals
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.task import deferLater
+
+logger = logging.getLogger(__name__)
+
+# 多个爬虫进程共享的持久化爬取队列（SQLite）：
+#   - URL 按主机分队列，每个主机一个请求间隔，由所有进程共同遵守：领取 URL 时按间隔预约发送时间
+#   - 间隔随主机的响应时间调整（与 AutoThrottle 相同的思路，但在进程之间共享），出错或 429/503 时加倍
+#   - 同一主机内按优先级出队：入链数越多、深度越浅越靠前，有上一轮的 PageRank 时按其得分加权
+#   - 领取的 URL 带租约，进程崩溃后租约到期自动重新入队；下载完成的页面先标记为 fetched（出链已入队），
+#     写入输出文件后才提交为 done，崩溃时 fetched 的页面同样重新入队；进程运行期间（领取或 flush 时）
+#     每 lease_seconds / 4 秒续约一次 fetched 的页面，输出缓冲很久才写出时它们也不会被其他进程当作过期租约重新爬取。
+#     续约只在进程运行时进行：一次停顿（如一次写出输出文件）超过 3/4 的 lease_seconds，其他进程就可能重新爬取
+#     这些页面，因此写出一批输出的耗时必须远小于租约时长（FRONTIER_LEASE_SECONDS）
+FRONTIER_DB = 'frontier.db'
+LEASE_BATCH = 32            # 每次最多领取的 URL 数（调度器按下载器的空闲并发数领取）
+LEASE_HORIZON = 5.0         # 只领取预约发送时间在该时间之内的 URL（不小于 Scrapy 引擎 5 秒的心跳间隔）
+LEASE_SECONDS = 600         # 租约时长：领取后这么久没有提交完成，视为进程已退出，重新入队
+MAX_ATTEMPTS = 3            # 每个 URL 最多领取的次数
+START_DELAY = 0.5           # 新主机的初始请求间隔（秒）
+MIN_DELAY = 0.02
+MAX_DELAY = 10.0
+TARGET_CONCURRENCY = 2.0    # 每个主机期望同时进行的请求数（所有进程合计），间隔 = 响应时间 / 该值
+HOST_UPDATE_SECONDS = 1.0   # 各进程至少每隔这么久把观测到的响应时间写入共享的主机状态
+COMMIT_EVERY = 500          # 没有输出文件负责提交时，每完成多少个页面提交一次
+DEPTH_WEIGHT = 1.0          # 优先级 = ln(1 + 入链数) - DEPTH_WEIGHT * 深度 + PAGERANK_WEIGHT * ln(PageRank * 页面数)
+PAGERANK_WEIGHT = 1.0
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+BACKOFF_STATUS = {429, 503}
+
+QUEUED, LEASED, DONE, FAILED, FETCHED = 0, 1, 2, 3, 4
+
+# 下载器中间件在请求不再重试时发出（request, error），调度器据此记录失败
+download_failed = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    host TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    inlinks INTEGER NOT NULL DEFAULT 1,
+    priority REAL NOT NULL,
+    state INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_urls_queue ON urls (host, state, priority DESC);
+CREATE INDEX IF NOT EXISTS idx_urls_lease ON urls (state, lease_until);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    queued INTEGER NOT NULL DEFAULT 0,
+    next_time REAL NOT NULL DEFAULT 0,
+    delay REAL NOT NULL,
+    latency REAL,
+    fetched INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_hosts_ready ON hosts (next_time) WHERE queued > 0;
+CREATE TABLE IF NOT EXISTS scores (
+    key TEXT PRIMARY KEY,
+    score REAL NOT NULL
+);
+"""
+
+
+def url_key(url):
+    """
+    去重用的键：忽略 http/https 的区别（URL 已由爬虫规范化）
+    """
+    return url.split('://', 1)[-1]
+
+
+def url_host(url):
+    return urlsplit(url).netloc.lower()
+
+
+class Lease:
+    __slots__ = ('key', 'url', 'host', 'depth', 'not_before')
+
+    def __init__(self, key, url, host, depth, not_before):
+        self.key = key
+        self.url = url
+        self.host = host
+        self.depth = depth
+        self.not_before = not_before
+
+
+class Frontier:
+    """
+    一个进程对共享爬取队列的连接。新发现的 URL、下载结果和主机的响应时间先在内存中累积，
+    领取或 flush 时写入，commit 时才把页面提交为 done（崩溃时没有提交的页面会被重新爬取）
+    """
+
+    def __init__(self, db_path=FRONTIER_DB, worker=None, target_concurrency=TARGET_CONCURRENCY,
+                 min_delay=MIN_DELAY, max_delay=MAX_DELAY, lease_seconds=LEASE_SECONDS):
+        self.db_path = db_path
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.target_concurrency = target_concurrency
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.create_function('priority', 3, self._priority, deterministic=True)
+        self.score_scale = self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+        self.resumed = False
+        self.commit_with_output = False   # 为 True 时只在输出文件写出后（commit）提交完成状态
+        self._added = {}       # key -> [url, host, depth, 出现次数]
+        self._results = []     # 还没写入的下载结果 (key, status, error)
+        self._fetched = []     # 已标记为 fetched、等待 commit 的 key
+        self._samples = []     # (host, 响应时间, 是否出错)
+        self._host_update = 0.0
+        self._renewed = 0.0    # 上次为 fetched 的页面续约的时间
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def _priority(self, inlinks, depth, score):
+        priority = math.log1p(inlinks) - DEPTH_WEIGHT * depth
+        if score and self.score_scale:
+            priority += PAGERANK_WEIGHT * math.log(score * self.score_scale)
+        return priority
+
+    def _transaction(self):
+        # 写事务一开始就拿写锁，避免多个进程同时升级读锁时死锁
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def start(self):
+        """
+        进程启动时调用：上一轮已经爬完（没有待爬的 URL）时清空 URL 开始新一轮，
+        否则从断点继续，并把本进程（同一 worker 名）上次崩溃时持有的租约重新入队。
+        返回是否在继续上一轮
+        """
+        self._transaction()
+        try:
+            pending = self.conn.execute("SELECT 1 FROM urls WHERE state IN (0, 1, 4) LIMIT 1").fetchone()
+            if pending is None:
+                # 主机的请求间隔和响应时间保留，新一轮直接使用
+                self.conn.execute("DELETE FROM urls")
+                self.conn.execute("UPDATE hosts SET queued = 0, next_time = 0")
+            else:
+                self._requeue("worker = ?", (self.worker,))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.resumed = pending is not None
+        return self.resumed
+
+    def load_pagerank(self, state_path):
+        """
+        读取 pagerank.py 保存的上一轮得分，作为新 URL 优先级的一部分
+        """
+        import numpy as np
+
+        with np.load(state_path) as state:
+            urls = state['urls'].tobytes().decode('utf-8')
+            scores = state['scores']
+        urls = urls.split("\n") if urls else []
+        self._transaction()
+        self.conn.execute("DELETE FROM scores")
+        self.conn.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)",
+                              ((url_key(url), float(score)) for url, score in zip(urls, scores)))
+        self.conn.execute("COMMIT")
+        self.score_scale = len(urls)
+        return self.score_scale
+
+    def add(self, url, depth=0):
+        key = url_key(url)
+        entry = self._added.get(key)
+        if entry is None:
+            self._added[key] = [url, url_host(url), depth, 1]
+        else:
+            entry[2] = min(entry[2], depth)
+            entry[3] += 1
+
+    def _write_added(self):
+        if not self._added:
+            return
+        new_hosts = {}
+        for key, (url, host, depth, count) in self._added.items():
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO urls (key, url, host, depth, inlinks, priority)"
+                " VALUES (?, ?, ?, ?, ?, priority(?, ?, (SELECT score FROM scores WHERE key = ?)))",
+                (key, url, host, depth, count, count, depth, key))
+            if cursor.rowcount:
+                new_hosts[host] = new_hosts.get(host, 0) + 1
+            else:
+                # 已在队列中：入链数增加，优先级随之提高
+                self.conn.execute(
+                    "UPDATE urls SET inlinks = inlinks + ?, depth = MIN(depth, ?),"
+                    " priority = priority(inlinks + ?, MIN(depth, ?), (SELECT score FROM scores WHERE key = ?))"
+                    " WHERE key = ? AND state = 0", (count, depth, count, depth, key, key))
+        self.conn.executemany(
+            "INSERT INTO hosts (host, queued, delay) VALUES (?, ?, ?)"
+            " ON CONFLICT (host) DO UPDATE SET queued = queued + excluded.queued",
+            ((host, count, START_DELAY) for host, count in new_hosts.items()))
+        self._added = {}
+
+    def _requeue(self, where, params):
+        """
+        把符合条件的已领取 URL 重新入队，领取次数用完的标记为失败
+        """
+        counts = self.conn.execute(
+            f"SELECT host, COUNT(*) FROM urls WHERE state IN (1, 4) AND attempts < ? AND {where} GROUP BY host",
+            (MAX_ATTEMPTS, *params)).fetchall()
+        self.conn.execute(
+            f"UPDATE urls SET state = CASE WHEN attempts < ? THEN 0 ELSE 3 END, worker = NULL, lease_until = NULL"
+            f" WHERE state IN (1, 4) AND {where}", (MAX_ATTEMPTS, *params))
+        self.conn.executemany("UPDATE hosts SET queued = queued + ? WHERE host = ?",
+                              ((count, host) for host, count in counts))
+
+    def _adapt(self, delay, latency, sample, error):
+        """
+        与 AutoThrottle 相同：间隔向 响应时间 / 目标并发数 靠拢，出错时加倍；不会因为出错的响应而缩短
+        """
+        if error:
+            return latency, min(self.max_delay, max(delay, self.min_delay) * 2)
+        latency = sample if latency is None else 0.7 * latency + 0.3 * sample
+        target = latency / self.target_concurrency
+        new_delay = (delay + target) / 2
+        return latency, min(self.max_delay, max(self.min_delay, new_delay))
+
+    def _write_samples(self):
+        if not self._samples:
+            return
+        by_host = {}
+        for host, sample, error in self._samples:
+            by_host.setdefault(host, []).append((sample, error))
+        for host, samples in by_host.items():
+            row = self.conn.execute("SELECT delay, latency FROM hosts WHERE host = ?", (host,)).fetchone()
+            if row is None:
+                continue
+            delay, latency = row
+            for sample, error in samples:
+                latency, delay = self._adapt(delay, latency, sample, error)
+            self.conn.execute(
+                "UPDATE hosts SET delay = ?, latency = ?, fetched = fetched + ?, errors = errors + ? WHERE host = ?",
+                (delay, latency, len(samples), sum(error for _, error in samples), host))
+        self._samples = []
+        self._host_update = time.time()
+
+    def _write_results(self):
+        """
+        下载成功的页面标记为 fetched（不再算作其他进程要等待的租约），失败的重新入队
+        """
+        fetched = [key for key, status, error in self._results if not error and status not in RETRY_STATUS]
+        lease_until = time.time() + self.lease_seconds
+        self.conn.executemany("UPDATE urls SET state = 4, lease_until = ? WHERE key = ? AND state = 1",
+                              ((lease_until, key) for key in fetched))
+        for key, status, error in self._results:
+            if error or status in RETRY_STATUS:
+                self._requeue("key = ?", (key,))
+        self._fetched.extend(fetched)
+        self._results = []
+
+    def _renew_due(self):
+        return time.time() - self._renewed >= self.lease_seconds / 4
+
+    def _renew_fetched(self):
+        """
+        为本进程 fetched 但还没写入输出（未提交为 done）的页面续约，每 lease_seconds / 4 秒一次
+        """
+        if not self._renew_due():
+            return
+        now = time.time()
+        self.conn.execute("UPDATE urls SET lease_until = ? WHERE state = 4 AND worker = ?",
+                          (now + self.lease_seconds, self.worker))
+        self._renewed = now
+
+    def _write_done(self):
+        self.conn.executemany("UPDATE urls SET state = 2, worker = NULL, lease_until = NULL WHERE key = ? AND state = 4",
+                              ((key,) for key in self._fetched))
+        self._fetched = []
+
+    def lease(self, limit=LEASE_BATCH, horizon=LEASE_HORIZON):
+        """
+        领取最多 limit 个 URL。每个主机按当前间隔依次预约发送时间（Lease.not_before），
+        只领取预约时间在 horizon 秒内的；多个进程领取同一主机时预约时间顺延，合计速率不超过该主机的间隔
+        """
+        self._transaction()
+        try:
+            now = time.time()
+            self._write_added()
+            self._write_samples()
+            self._write_results()
+            self._renew_fetched()
+            self._requeue("lease_until < ?", (now,))
+            hosts = self.conn.execute(
+                "SELECT host, next_time, delay, queued FROM hosts WHERE queued > 0 AND next_time <= ?"
+                " ORDER BY next_time LIMIT ?", (now + horizon, limit)).fetchall()
+            leases = []
+            per_host = max(1, -(-limit // max(1, len(hosts))))
+            for host, next_time, delay, queued in hosts:
+                start = max(next_time, now)
+                slots = int((now + horizon - start) / delay) + 1
+                count = min(slots, queued, per_host, limit - len(leases))
+                if count <= 0:
+                    break
+                rows = self.conn.execute(
+                    "SELECT key, url, depth FROM urls WHERE host = ? AND state = 0 ORDER BY priority DESC LIMIT ?",
+                    (host, count)).fetchall()
+                batch = [Lease(key, url, host, depth, start + i * delay) for i, (key, url, depth) in enumerate(rows)]
+                self.conn.executemany(
+                    "UPDATE urls SET state = 1, attempts = attempts + 1, worker = ?, lease_until = ? WHERE key = ?",
+                    ((self.worker, lease.not_before + self.lease_seconds, lease.key) for lease in batch))
+                self.conn.execute("UPDATE hosts SET next_time = ?, queued = queued - ? WHERE host = ?",
+                                  (start + len(batch) * delay, len(batch), host))
+                leases.extend(batch)
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return leases
+
+    def complete(self, lease_key, host, latency=None, status=200, error=None):
+        """
+        记录一个已领取 URL 的结果：latency 为下载耗时，error 为异常类名（下载失败时）。
+        失败或状态码为 429/5xx 的 URL 重新入队
+        """
+        self._results.append((lease_key, status, error))
+        backoff = error is not None or status in BACKOFF_STATUS
+        if latency is not None or backoff:
+            self._samples.append((host, latency or 0.0, backoff))
+        if time.time() - self._host_update >= HOST_UPDATE_SECONDS:
+            self.flush()
+        if not self.commit_with_output and len(self._fetched) + len(self._results) >= COMMIT_EVERY:
+            self.commit()
+
+    def flush(self):
+        """
+        写入新发现的 URL、下载结果和主机的响应时间（不提交为 done），其他进程随即可以看到
+        """
+        if not self._added and not self._samples and not self._results and not self._renew_due():
+            return
+        self._transaction()
+        try:
+            self._write_added()
+            self._write_samples()
+            self._write_results()
+            self._renew_fetched()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def commit(self):
+        """
+        提交完成状态。输出文件写出之后调用，保证提交为完成的页面都已经写入文件
+        """
+        self._transaction()
+        try:
+            self._write_added()
+            self._write_samples()
+            self._write_results()
+            self._write_done()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def pending(self):
+        """
+        是否还有待爬的 URL，或其他进程还在下载的 URL（它们可能还会发现新的 URL）
+        """
+        return self.conn.execute(
+            "SELECT 1 FROM urls WHERE state = 0 OR (state = 1 AND worker != ?) LIMIT 1",
+            (self.worker,)).fetchone() is not None
+
+    def stats(self):
+        counts = dict(self.conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+        return {name: counts.get(state, 0) for name, state in
+                (('queued', QUEUED), ('leased', LEASED), ('fetched', FETCHED), ('done', DONE), ('failed', FAILED))}
+
+    def host_stats(self):
+        return self.conn.execute(
+            "SELECT host, queued, delay, latency, fetched, errors FROM hosts ORDER BY fetched DESC").fetchall()
+
+
+def enable_frontier(settings):
+    """
+    在 Spider.update_settings 中调用：换用共享队列的调度器，并由它负责限速
+    （Scrapy 自带的 DOWNLOAD_DELAY 与 AUTOTHROTTLE 只在单个进程内生效，关闭）
+    """
+    settings.set('SCHEDULER', f'{__name__}.FrontierScheduler', priority='spider')
+    settings.set('DOWNLOAD_DELAY', 0, priority='spider')
+    settings.set('AUTOTHROTTLE_ENABLED', False, priority='spider')
+    middlewares = dict(settings.getdict('DOWNLOADER_MIDDLEWARES'))
+    # 排在 RetryMiddleware（550）之前：process_exception 只在不再重试时才会传到这里
+    middlewares[f'{__name__}.FrontierThrottleMiddleware'] = 50
+    settings.set('DOWNLOADER_MIDDLEWARES', middlewares, priority='spider')
+
+
+class FrontierScheduler:
+    """
+    Scrapy 调度器：请求写入共享队列，按主机限速和优先级领取后交给引擎。
+    只保存 URL 和深度，领取后通过 spider.make_request(url) 重新生成请求
+    """
+
+    def __init__(self, crawler, frontier, batch=LEASE_BATCH, pagerank_state=None):
+        self.crawler = crawler
+        self.frontier = frontier
+        self.batch = batch
+        self.pagerank_state = pagerank_state
+        self.queue = deque()       # 已领取、还没交给引擎的 URL
+        self.retries = deque()     # 已领取 URL 的重试和重定向请求，不再经过共享队列
+        self.outstanding = set()   # 已交给引擎、还没有结果的 URL
+        self.spider = None
+        self._next_lease = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        frontier = Frontier(settings.get('FRONTIER_DB', FRONTIER_DB), settings.get('FRONTIER_WORKER'),
+                            settings.getfloat('FRONTIER_TARGET_CONCURRENCY', TARGET_CONCURRENCY),
+                            settings.getfloat('FRONTIER_MIN_DELAY', MIN_DELAY),
+                            settings.getfloat('FRONTIER_MAX_DELAY', MAX_DELAY),
+                            settings.getfloat('FRONTIER_LEASE_SECONDS', LEASE_SECONDS))
+        scheduler = cls(crawler, frontier, settings.getint('FRONTIER_LEASE_BATCH', LEASE_BATCH),
+                        settings.get('FRONTIER_PAGERANK_STATE'))
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        crawler.signals.connect(scheduler.download_failed, signal=download_failed)
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        # 输出管道（BufferedCsvPipeline）通过 spider.frontier 在写出文件后提交完成状态
+        spider.frontier = self.frontier
+        if self.frontier.start():
+            logger.info("从断点继续爬取：%s", self.frontier.stats())
+        elif self.pagerank_state and os.path.exists(self.pagerank_state):
+            logger.info("按上一轮的 PageRank 设置优先级，共 %d 个页面", self.frontier.load_pagerank(self.pagerank_state))
+
+    def close(self, reason):
+        self.frontier.commit()
+        stats = self.frontier.stats()
+        self.frontier.close()
+        for name, value in stats.items():
+            self.crawler.stats.set_value(f'frontier/{name}', value)
+        logger.info("共享队列：%s", stats)
+
+    def has_pending_requests(self):
+        if self.queue or self.retries or self.outstanding:
+            return True
+        self.frontier.flush()
+        return self.frontier.pending()
+
+    def enqueue_request(self, request):
+        lease = request.meta.get('frontier_lease')
+        if lease is not None and lease.key in self.outstanding:
+            # 已领取 URL 的重试或重定向，在本进程内完成
+            self.retries.append(request)
+        else:
+            self.frontier.add(request.url, request.meta.get('depth', 0))
+            self._next_lease = 0.0
+        self.crawler.stats.inc_value('frontier/enqueued')
+        return True
+
+    def next_request(self):
+        if self.retries:
+            return self.retries.popleft()
+        if not self.queue:
+            now = time.time()
+            if now < self._next_lease:
+                return None
+            # 只领取马上能发出的数量：领取后在本地排队会让预约的发送时间失效，同一主机的请求挤在一起
+            downloader = self.crawler.engine.downloader
+            free = downloader.total_concurrency - len(downloader.active)
+            self.queue.extend(self.frontier.lease(max(1, min(self.batch, free))))
+            if not self.queue:
+                # 暂时没有可领取的 URL，稍后再查，避免引擎每次调度都访问数据库
+                self._next_lease = now + 0.2
+                return None
+            self.crawler.stats.inc_value('frontier/leased', len(self.queue))
+        lease = self.queue.popleft()
+        make_request = getattr(self.spider, 'make_request', None)
+        request = make_request(lease.url) if make_request else Request(lease.url)
+        request.dont_filter = True
+        request.meta['depth'] = lease.depth
+        request.meta['frontier_lease'] = lease
+        self.outstanding.add(lease.key)
+        return request
+
+    def finish(self, request, status=200, error=None):
+        lease = request.meta.get('frontier_lease')
+        if lease is None or lease.key not in self.outstanding:
+            return
+        self.outstanding.discard(lease.key)
+        self.frontier.complete(lease.key, lease.host, request.meta.get('download_latency'), status, error)
+
+    def response_received(self, response, request, spider):
+        self.finish(request, response.status)
+
+    def download_failed(self, request, error):
+        self.finish(request, None, error)
+
+
+class FrontierThrottleMiddleware:
+    """
+    下载器中间件：等到领取时预约的发送时间再发出请求；不再重试的下载异常交给调度器记录
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    async def process_request(self, request, spider=None):
+        lease = request.meta.get('frontier_lease')
+        if lease is not None and request.meta.get('retry_times') is None:
+            wait = lease.not_before - time.time()
+            if wait > 0:
+                # 在模块顶层导入 reactor 会安装默认的 reactor，与 Scrapy 设置的 asyncio reactor 冲突
+                from twisted.internet import reactor
+
+                await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        return None
+
+    def process_exception(self, request, exception, spider=None):
+        # 被其他中间件忽略的请求（站外链接等）视为已完成，不再重试
+        error = None if isinstance(exception, IgnoreRequest) else type(exception).__name__
+        self.crawler.signals.send_catch_log(download_failed, request=request, error=error)
+        return None
+
+
+def merge_outputs(output_file, input_files):
+    """
+    合并多个爬虫进程的 CSV 输出，同一 URL 只保留最后一次（崩溃后重新爬取的页面可能写入两次）
+    """
+    csv.field_size_limit(sys.maxsize)
+    rows = {}
+    fields = None
+    for input_file in input_files:
+        with open(input_file, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            fields = fields or reader.fieldnames
+            for row in reader:
+                rows[row['url']] = row
+    with open(output_file, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows.values())
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多进程共享的爬取队列")
+    parser.add_argument("--db", default=FRONTIER_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("stats", help="各状态的 URL 数和各主机的请求间隔")
+    subparsers.add_parser("reset", help="清空 URL，下次运行开始新一轮爬取（保留各主机的请求间隔）")
+    merge_parser = subparsers.add_parser("merge", help="合并多个爬虫进程的 CSV 输出")
+    merge_parser.add_argument("output")
+    merge_parser.add_argument("inputs", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        print(f"共 {merge_outputs(args.output, args.inputs)} 个页面，已保存到 {args.output}")
+    else:
+        frontier = Frontier(args.db)
+        if args.command == "reset":
+            with frontier.conn:
+                frontier.conn.execute("DELETE FROM urls")
+                frontier.conn.execute("UPDATE hosts SET queued = 0, next_time = 0")
+        print(frontier.stats())
+        print(f"{'主机':<40} {'待爬':>8} {'间隔(s)':>8} {'响应(s)':>8} {'已爬':>8} {'出错':>6}")
+        for host, queued, delay, latency, fetched, errors in frontier.host_stats():
+            print(f"{host:<40} {queued:>8} {delay:>8.3f} {latency or 0:>8.3f} {fetched:>8} {errors:>6}")
+        frontier.conn.close()
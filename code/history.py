@@ -0,0 +1,335 @@
+import argparse
+import hashlib
+import heapq
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+HISTORY_DB = 'history.db'        # 查询历史数据库
+HISTORY_FILE = 'history.txt'     # 旧版文本格式的查询历史
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+PROFILE_TERMS = 10               # 个性化排序使用的词数：每个用户画像中权重最高的前 k 个
+PROFILE_CAPACITY = 100           # 每个用户画像保留的候选词数，超出时淘汰权重最低的
+PROFILE_HALF_LIFE_DAYS = 30      # 查询词权重的半衰期（天）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    query TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queries_user ON queries (user, id);
+CREATE TABLE IF NOT EXISTS results (
+    query_id INTEGER NOT NULL REFERENCES queries (id) ON DELETE CASCADE,
+    rank INTEGER NOT NULL,
+    title TEXT,
+    url TEXT,
+    snippet TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_query ON results (query_id);
+CREATE TABLE IF NOT EXISTS profile_terms (
+    user TEXT NOT NULL,
+    term TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (user, term)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS profile_users (
+    user TEXT PRIMARY KEY
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS migrations (
+    digest TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    queries INTEGER NOT NULL,
+    timestamp TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def query_terms(query):
+    """
+    查询中用于个性化的词：按空白切分，去掉含通配符的词，同一查询中的重复词只计一次
+    """
+    return list(dict.fromkeys(word for word in query.split() if '*' not in word and '?' not in word))
+
+
+def decay_score(timestamp, half_life_days=PROFILE_HALF_LIFE_DAYS):
+    """
+    一次出现在时间 timestamp 的得分，取 log2：(t - 纪元) / 半衰期。所有词的权重随时间按同一比例衰减，
+    因此只需在出现时累加，比较和归一化时不必按当前时间重算
+    """
+    seconds = datetime.strptime(timestamp, TIME_FORMAT).timestamp()
+    return seconds / (half_life_days * 86400)
+
+
+def _log2_add(a, b):
+    # log2(2^a + 2^b)，避免直接求幂溢出
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def top_terms(scores, k=PROFILE_TERMS):
+    """
+    得分最高的 k 个词及其归一化权重（和为 1），按权重从高到低排列
+    """
+    top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+    if not top:
+        return []
+    weights = [2 ** (score - top[0][1]) for _, score in top]
+    total = sum(weights)
+    return [(term, weight / total) for (term, _), weight in zip(top, weights)]
+
+
+class HistoryStore:
+    """
+    按用户建立索引的查询历史（SQLite），读取某个用户的历史只与该用户的记录数有关。
+    每个用户另有一个大小固定的画像：查询词按时间衰减累加的得分，最多保留 profile_capacity 个词，
+    记录新查询时增量更新，个性化排序只使用其中得分最高的 profile_terms 个词
+    """
+
+    def __init__(self, db_path=HISTORY_DB, profile_terms=PROFILE_TERMS, profile_capacity=PROFILE_CAPACITY,
+                 half_life_days=PROFILE_HALF_LIFE_DAYS):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self.profile_terms = profile_terms
+        self.profile_capacity = profile_capacity
+        self.half_life_days = half_life_days
+        self._lock = threading.Lock()
+        self._profiles = {}  # 用户 -> {词: 得分}
+        self._top = {}       # 用户 -> 画像中前 profile_terms 个 (词, 权重)
+
+    def close(self):
+        self.conn.close()
+
+    def log_query(self, user, query, results, timestamp=None):
+        timestamp = timestamp or datetime.now().strftime(TIME_FORMAT)
+        with self._lock:
+            scores = self._profile(user)
+            with self.conn:
+                cursor = self.conn.execute(
+                    "INSERT INTO queries (user, timestamp, query) VALUES (?, ?, ?)", (user, timestamp, query))
+                self.conn.executemany(
+                    "INSERT INTO results (query_id, rank, title, url, snippet) VALUES (?, ?, ?, ?, ?)",
+                    [(cursor.lastrowid, rank, res['title'], res['url'],
+                      res['text'].replace('\n', ' ').replace('\r', ' ')[:100])
+                     for rank, res in enumerate(results, start=1)])
+                terms = query_terms(query)
+                evicted = self._add_terms(scores, terms, decay_score(timestamp, self.half_life_days))
+                self.conn.executemany("INSERT OR REPLACE INTO profile_terms (user, term, score) VALUES (?, ?, ?)",
+                                      [(user, term, scores[term]) for term in terms if term in scores])
+                self.conn.executemany("DELETE FROM profile_terms WHERE user = ? AND term = ?",
+                                      [(user, term) for term in evicted])
+            self._top.pop(user, None)
+
+    def _add_terms(self, scores, terms, score):
+        """
+        把一次查询的词累加到画像中，超出容量时淘汰得分最低的词，返回被淘汰的词
+        """
+        for term in terms:
+            old = scores.get(term)
+            scores[term] = score if old is None else _log2_add(old, score)
+        if len(scores) <= self.profile_capacity:
+            return []
+        evicted = heapq.nsmallest(len(scores) - self.profile_capacity, scores, key=scores.get)
+        for term in evicted:
+            del scores[term]
+        return evicted
+
+    def _profile(self, user):
+        """
+        用户画像 {词: 得分}（调用时持有 self._lock）。旧版历史库中还没有画像的用户，第一次访问时从其全部历史建立
+        """
+        scores = self._profiles.get(user)
+        if scores is not None:
+            return scores
+        if self.conn.execute("SELECT 1 FROM profile_users WHERE user = ?", (user,)).fetchone():
+            scores = dict(self.conn.execute("SELECT term, score FROM profile_terms WHERE user = ?", (user,)))
+        else:
+            scores = {}
+            rows = self.conn.execute("SELECT timestamp, query FROM queries WHERE user = ? ORDER BY id", (user,))
+            for timestamp, query in rows.fetchall():
+                self._add_terms(scores, query_terms(query), decay_score(timestamp, self.half_life_days))
+            with self.conn:
+                self.conn.execute("INSERT INTO profile_users (user) VALUES (?)", (user,))
+                self.conn.executemany("INSERT INTO profile_terms (user, term, score) VALUES (?, ?, ?)",
+                                      [(user, term, score) for term, score in scores.items()])
+        self._profiles[user] = scores
+        return scores
+
+    def user_profile(self, user):
+        """
+        返回用户画像中得分最高的 profile_terms 个 (词, 权重)，权重和为 1，按权重从高到低排列。
+        结果只与画像大小有关，不随历史记录数增长
+        """
+        with self._lock:
+            top = self._top.get(user)
+            if top is None:
+                top = self._top[user] = top_terms(self._profile(user), self.profile_terms)
+            return top
+
+    def user_terms(self, user):
+        """
+        返回用户画像中得分最高的词（来自历史查询，不包含结果的标题和 URL）
+        """
+        return [term for term, _ in self.user_profile(user)]
+
+    def reset_profiles(self):
+        """
+        删除所有用户画像，之后第一次访问时按当前的半衰期和容量从历史重新建立
+        """
+        with self._lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM profile_terms")
+                self.conn.execute("DELETE FROM profile_users")
+            self._profiles.clear()
+            self._top.clear()
+
+    def user_queries(self, user, limit=None):
+        """
+        返回用户的 (时间, 查询) 列表，按时间先后排列
+        """
+        sql = "SELECT timestamp, query FROM queries WHERE user = ? ORDER BY id DESC"
+        params = (user,)
+        if limit:
+            sql += " LIMIT ?"
+            params = (user, limit)
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return rows[::-1]
+
+    def query_counts(self, limit=100):
+        """
+        返回所有用户中出现次数最多的 (查询, 次数)
+        """
+        with self._lock:
+            return self.conn.execute(
+                "SELECT query, COUNT(*) AS n FROM queries GROUP BY query ORDER BY n DESC LIMIT ?", (limit,)).fetchall()
+
+    def top_queries(self, limit=100):
+        return [query for query, _ in self.query_counts(limit)]
+
+    def migrated(self, digest):
+        """
+        内容摘要为 digest 的旧版历史文件是否已经导入过
+        """
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM migrations WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def mark_migrated(self, digest, source, queries):
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO migrations (digest, source, queries, timestamp) VALUES (?, ?, ?, ?)",
+                    (digest, source, queries, datetime.now().strftime(TIME_FORMAT)))
+
+    def compact(self, max_age_days=None, max_queries_per_user=None):
+        """
+        删除超过保留期限或超出每个用户条数上限的历史记录，并回收空间
+        """
+        with self._lock:
+            with self.conn:
+                if max_age_days is not None:
+                    cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime(TIME_FORMAT)
+                    self.conn.execute("DELETE FROM queries WHERE timestamp < ?", (cutoff,))
+                if max_queries_per_user is not None:
+                    self.conn.execute(
+                        "DELETE FROM queries WHERE id IN ("
+                        " SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user ORDER BY id DESC) AS n"
+                        " FROM queries) WHERE n > ?)", (max_queries_per_user,))
+                # 画像从保留下来的历史重新建立，删除的记录不再影响个性化
+                self.conn.execute("DELETE FROM profile_terms")
+                self.conn.execute("DELETE FROM profile_users")
+            self.conn.execute("VACUUM")
+            self._profiles.clear()
+            self._top.clear()
+
+
+def migrate_history_file(store, history_file=HISTORY_FILE):
+    """
+    导入旧版 history.txt：
+    查询行为 "时间 | 用户 | 查询"，结果行为 "时间 | 用户 | 标题 | URL | 摘要"。
+    导入完成后按文件内容的摘要记录在 store 中，同一文件再次导入时直接跳过（返回 None），
+    避免重复的查询抬高画像得分
+    """
+    digest = hashlib.sha1()
+    with open(history_file, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    digest = digest.hexdigest()
+    if store.migrated(digest):
+        return None
+
+    pending = {}  # 用户 -> (时间, 查询, 结果列表)
+
+    def flush(user):
+        if user in pending:
+            timestamp, query, results = pending.pop(user)
+            store.log_query(user, query, results, timestamp)
+
+    count = 0
+    with open(history_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = [part.strip() for part in line.rstrip('\n').split(' | ')]
+            if len(parts) < 3:
+                continue
+            timestamp, user = parts[0], parts[1]
+            # 标题本身可能含 " | "（如 "学院新闻 | 南开大学"），URL 取标题之后第一个以 http 开头的字段
+            url_field = next((i for i in range(3, len(parts)) if parts[i].startswith('http') and ' ' not in parts[i]),
+                             None)
+            if url_field is not None:
+                if user in pending and pending[user][0] == timestamp:
+                    pending[user][2].append({'title': ' | '.join(parts[2:url_field]), 'url': parts[url_field],
+                                             'text': ' | '.join(parts[url_field + 1:])})
+                continue
+            flush(user)
+            pending[user] = (timestamp, ' | '.join(parts[2:]), [])
+            count += 1
+    for user in list(pending):
+        flush(user)
+    store.mark_migrated(digest, os.path.abspath(history_file), count)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查询历史管理")
+    parser.add_argument("--db", default=HISTORY_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="导入旧版 history.txt")
+    migrate_parser.add_argument("history_file", nargs="?", default=HISTORY_FILE)
+
+    compact_parser = subparsers.add_parser("compact", help="按保留策略清理历史记录")
+    compact_parser.add_argument("--days", type=int, help="只保留最近若干天的记录")
+    compact_parser.add_argument("--per-user", type=int, help="每个用户最多保留的查询数")
+
+    profile_parser = subparsers.add_parser("profile", help="查看用户画像（个性化排序使用的词及权重）")
+    profile_parser.add_argument("user", nargs="?")
+    profile_parser.add_argument("--reset", action="store_true", help="删除所有画像，下次访问时从历史重新建立")
+
+    args = parser.parse_args()
+    store = HistoryStore(args.db)
+    if args.command == "migrate":
+        if not os.path.exists(args.history_file):
+            print(f"文件 '{args.history_file}' 不存在。")
+        else:
+            count = migrate_history_file(store, args.history_file)
+            if count is None:
+                print(f"'{args.history_file}' 已经导入过 {args.db}，跳过。")
+            else:
+                print(f"已导入 {count} 条查询记录到 {args.db}。")
+    elif args.command == "compact":
+        store.compact(args.days, args.per_user)
+        print("历史记录清理完成。")
+    elif args.command == "profile":
+        if args.reset:
+            store.reset_profiles()
+            print("已删除所有用户画像。")
+        if args.user:
+            for term, weight in store.user_profile(args.user):
+                print(f"{weight:.3f}  {term}")
+    store.close()
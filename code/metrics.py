@@ -0,0 +1,330 @@
+# 进程内的性能指标：计数器、耗时直方图和分阶段计时（span），可以导出为 Prometheus 文本或 JSON lines。
+#
+#   with metrics.span('es'):            # 记录到 stage_duration_seconds{stage="es"}
+#       response = es.search(...)
+#   metrics.counter('search_errors_total', stage='es').inc()
+#
+# 同一线程中嵌套的 span 组成一次追踪，最外层 span 结束时若超过慢查询阈值，
+# 各阶段耗时（以及开启采样时的调用栈）记录到慢查询日志。
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter as _Counter, deque
+
+SLOW_QUERY_SECONDS = 1.0      # 最外层 span 超过该耗时记为慢查询
+SLOW_QUERY_KEEP = 100         # 内存中保留的慢查询条数
+PROFILE_INTERVAL = None       # 采样调用栈的间隔（秒），None 表示不采样
+PROFILE_DEPTH = 30            # 每个样本保留的栈深度
+PROFILE_TOP = 20              # 慢查询日志中保留的调用栈数
+
+# 直方图的桶：10us 到约 100s，相邻桶上界相差 √2 倍
+BUCKETS = tuple(1e-5 * 2 ** (i / 2) for i in range(47))
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class CounterMetric:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {'value': self.value}
+
+
+class GaugeMetric(CounterMetric):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramMetric:
+    """
+    固定桶的直方图，分位数在桶内线性插值估计（误差不超过一个桶宽）
+    """
+    kind = 'histogram'
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        # 桶是等比数列，直接算出下标
+        i = 0 if value <= self.buckets[0] else min(len(self.buckets),
+                                                   math.ceil(2 * math.log2(value / self.buckets[0]) - 1e-9))
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        with self._lock:
+            counts, total, top = list(self.counts), self.count, self.max
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else top
+                return min(top, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return top
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+class StackSampler:
+    """
+    后台线程按固定间隔采样正在追踪的线程的调用栈，追踪结束时返回各调用栈出现的次数
+    （"文件:函数;文件:函数" 格式，可直接生成火焰图）
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._samples = {}  # 线程 id -> Counter
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = _Counter()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, None) or _Counter()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None and len(stack) < PROFILE_DEPTH:
+                        code = frame.f_code
+                        stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                        frame = frame.f_back
+                    if stack:
+                        samples[';'.join(reversed(stack))] += 1
+
+
+class _Trace:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.spans = []
+        self.attrs = {}
+        self.depth = 0
+
+
+class _Span:
+    __slots__ = ('registry', 'stage', 'labels', 'trace', 'root', 'record', 'start')
+
+    def __init__(self, registry, stage, labels):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        local = self.registry._local
+        trace = getattr(local, 'trace', None)
+        self.root = trace is None
+        if self.root:
+            trace = local.trace = _Trace(self.stage, self.labels)
+            if self.registry.sampler is not None:
+                self.registry.sampler.start(threading.get_ident())
+        self.trace = trace
+        self.record = [trace.depth, self.stage, None]
+        trace.depth += 1
+        trace.spans.append(self.record)
+        self.start = time.perf_counter()
+        return trace.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        registry, trace = self.registry, self.trace
+        trace.depth = self.record[0]
+        self.record[2] = elapsed
+        registry.histogram('stage_duration_seconds', '各阶段耗时', stage=self.stage, **self.labels).observe(elapsed)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            registry.counter('stage_errors_total', '各阶段抛出的异常数', stage=self.stage, error=exc_type.__name__).inc()
+        if self.root:
+            registry._local.trace = None
+            samples = registry.sampler.stop(threading.get_ident()) if registry.sampler is not None else None
+            registry._finish(trace, elapsed, samples)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+        self.slow_query_seconds = SLOW_QUERY_SECONDS
+        self.slow_query_log = None
+        self.sampler = None
+
+    def configure(self, slow_query_seconds=None, slow_query_log=None, profile_interval=None):
+        """
+        slow_query_log 为文件路径时慢查询同时追加写入该文件（JSON lines）；
+        profile_interval 不为空时开启调用栈采样，只在慢查询中输出
+        """
+        if slow_query_seconds is not None:
+            self.slow_query_seconds = slow_query_seconds
+        if slow_query_log is not None:
+            self.slow_query_log = slow_query_log
+        if profile_interval and self.sampler is None:
+            self.sampler = StackSampler(profile_interval)
+
+    def _get(self, cls, name, labels, help_text):
+        key = _key(name, labels)
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls()
+                    if help_text:
+                        self._help[name] = help_text
+        return metric
+
+    def counter(self, name, help_text=None, **labels):
+        return self._get(CounterMetric, name, labels, help_text)
+
+    def gauge(self, name, help_text=None, **labels):
+        return self._get(GaugeMetric, name, labels, help_text)
+
+    def histogram(self, name, help_text=None, **labels):
+        return self._get(HistogramMetric, name, labels, help_text)
+
+    def span(self, stage, **labels):
+        """
+        计时一个阶段（with 语句），耗时记录到 stage_duration_seconds{stage=...}；
+        阶段抛出异常时 stage_errors_total 加一后继续抛出
+        """
+        return _Span(self, stage, labels)
+
+    def _finish(self, trace, elapsed, samples):
+        if elapsed >= self.slow_query_seconds:
+            self._record_slow(trace, elapsed, samples)
+
+    def annotate(self, **attrs):
+        """
+        给当前追踪附加信息（查询文本、ES 的 took 等），只在慢查询日志中输出；不在追踪中时忽略
+        """
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.attrs.update(attrs)
+
+    def _record_slow(self, trace, elapsed, samples):
+        self.counter('slow_queries_total', '超过慢查询阈值的请求数', stage=trace.name).inc()
+        entry = {
+            'time': time.time(), 'stage': trace.name, 'labels': trace.labels, 'seconds': elapsed,
+            # 按开始顺序排列，depth 为嵌套层数
+            'spans': [{'stage': stage, 'depth': depth, 'seconds': seconds} for depth, stage, seconds in trace.spans],
+            'attrs': trace.attrs,
+        }
+        if samples:
+            entry['stacks'] = dict(samples.most_common(PROFILE_TOP))
+        self.slow_queries.append(entry)
+        if self.slow_query_log:
+            with self._lock, open(self.slow_query_log, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._metrics.items(), key=lambda item: item[0])
+
+    def prometheus(self):
+        lines, described = [], set()
+        for (name, labels), metric in self._items():
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                continue
+            with metric._lock:
+                counts, total, count = list(metric.counts), metric.sum, metric.count
+            cumulative = 0
+            for bound, bucket in zip(metric.buckets, counts):
+                cumulative += bucket
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:.6g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def json_lines(self):
+        now = time.time()
+        return ''.join(json.dumps({'time': now, 'name': name, 'type': metric.kind, 'labels': dict(labels),
+                                   **metric.snapshot()}, ensure_ascii=False) + '\n'
+                       for (name, labels), metric in self._items())
+
+    def dump(self, path):
+        """
+        写出所有指标：.prom 结尾为 Prometheus 文本格式，否则为 JSON lines
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus() if path.endswith('.prom') else self.json_lines())
+
+    def report(self, prefix=''):
+        """
+        各阶段耗时的简要报告（命令行工具结束时打印）
+        """
+        lines = []
+        for (name, labels), metric in self._items():
+            labels = dict(labels)
+            stage = labels.pop('stage', '')
+            if name == 'stage_duration_seconds' and stage.startswith(prefix):
+                snapshot = metric.snapshot()
+                stage += _format_labels(labels.items())
+                lines.append(f"{stage:<20} {snapshot['count']:>8} 次  合计 {snapshot['sum']:.3f}s  "
+                             f"p50 {snapshot['p50'] * 1e3:.2f}ms  p95 {snapshot['p95'] * 1e3:.2f}ms  "
+                             f"p99 {snapshot['p99'] * 1e3:.2f}ms")
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+configure = REGISTRY.configure
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+span = REGISTRY.span
+annotate = REGISTRY.annotate
@@ -0,0 +1,328 @@
+import argparse
+import fnmatch
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# 本地模拟的 Elasticsearch 服务，实现上传数据需要的接口（ping、索引与别名管理、_bulk），
+# 用于在没有 ES 的环境下测试 dataup.py 的并发上传、限流重试、断点续传和别名切换；
+# _search / _msearch 由嵌入式索引（embedded.py）在已上传的文档上执行。
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockElasticsearch:
+    def __init__(self, host='127.0.0.1', port=0, reject_rate=0.0, latency=0.0, seed=0, search_latency=0.0):
+        self.reject_rate = reject_rate        # 以 429 拒绝 _bulk 请求的比例
+        self.latency = latency                # 每个 _bulk 请求的模拟耗时（秒）
+        self.search_latency = search_latency  # 每个 _search / _msearch 请求的模拟耗时（秒）
+        self.indices = {}               # 索引名 -> {_id: _source}
+        self.settings = {}              # 索引名 -> settings
+        self.mappings = {}              # 索引名 -> mappings（只保存，不影响查询）
+        self.aliases = {}               # 别名 -> 索引名集合
+        self.bulk_requests = 0
+        self.search_requests = 0
+        self.rejected = 0
+        self.generation = 0             # 文档每次变化加一，查询时据此重建嵌入式索引
+        self._backends = {}             # 索引名 -> (generation, EmbeddedBackend, 文档列表)
+        self._pits = {}                 # point-in-time id -> (EmbeddedBackend, 文档列表)
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.server = _Server((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._tmp_dir.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def resolve(self, name):
+        """
+        将索引名、别名或通配符解析为具体的索引名列表
+        """
+        if name in self.aliases:
+            return sorted(self.aliases[name])
+        return sorted(index for index in self.indices if fnmatch.fnmatch(index, name))
+
+    def update_aliases(self, actions):
+        with self.lock:
+            for action in actions:
+                op, args = next(iter(action.items()))
+                if op == 'add':
+                    self.aliases.setdefault(args['alias'], set()).add(args['index'])
+                elif op == 'remove':
+                    self.aliases.get(args['alias'], set()).discard(args['index'])
+                elif op == 'remove_index':
+                    self.delete_index(args['index'])
+            self.aliases = {alias: indices for alias, indices in self.aliases.items() if indices}
+
+    def delete_index(self, index):
+        self.generation += 1
+        self.indices.pop(index, None)
+        self.settings.pop(index, None)
+        self.mappings.pop(index, None)
+        for indices in self.aliases.values():
+            indices.discard(index)
+
+    def bulk(self, body):
+        with self.lock:
+            self.bulk_requests += 1
+            if self.random.random() < self.reject_rate:
+                self.rejected += 1
+                return 429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429}
+        if self.latency:
+            time.sleep(self.latency)
+        lines = body.decode('utf-8').splitlines()
+        items = []
+        i = 0
+        with self.lock:
+            while i < len(lines):
+                if not lines[i].strip():
+                    i += 1
+                    continue
+                op, meta = next(iter(json.loads(lines[i]).items()))
+                source = json.loads(lines[i + 1]) if op != 'delete' else None
+                i += 2 if op != 'delete' else 1
+                index = (self.resolve(meta['_index']) or [meta['_index']])[0]
+                docs = self.indices.setdefault(index, {})
+                doc_id = meta.get('_id') or str(len(docs))
+                if op == 'update':
+                    if doc_id not in docs:
+                        items.append({op: {"_id": doc_id, "status": 404,
+                                           "error": {"type": "document_missing_exception", "reason": "document missing"}}})
+                        continue
+                    docs[doc_id].update(source.get('doc', {}))
+                elif op == 'delete':
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = source
+                items.append({op: {"_index": index, "_id": doc_id, "status": 200}})
+            self.generation += 1
+        return 200, {"took": 1, "errors": any('error' in next(iter(it.values())) for it in items), "items": items}
+
+    def backend(self, index):
+        """
+        索引内容变化后第一次查询时，用当前文档重新构建嵌入式索引。
+        返回 (EmbeddedBackend, 文档列表)，文档在列表中的下标即其在嵌入式索引中的编号
+        """
+        from embedded import EmbeddedBackend, build_index
+
+        with self.lock:
+            cached = self._backends.get(index)
+            if cached is None or cached[0] != self.generation:
+                path = os.path.join(self._tmp_dir.name, f"{index}.idx")
+                docs = list(self.indices.get(index, {}).values())
+                build_index(docs, path, verbose=False)
+                cached = self._backends[index] = (self.generation, EmbeddedBackend.load(path), docs)
+            return cached[1], cached[2]
+
+    def open_pit(self, name):
+        """
+        point-in-time：固定当前的嵌入式索引和文档列表，之后的写入对它不可见
+        """
+        indices = self.resolve(name)
+        if not indices:
+            return 404, {"error": {"type": "index_not_found_exception"}, "status": 404}
+        snapshot = self.backend(indices[0])
+        with self.lock:
+            pit_id = f"pit_{len(self._pits)}_{indices[0]}"
+            self._pits[pit_id] = snapshot
+        return 200, {"id": pit_id}
+
+    def close_pit(self, pit_id):
+        with self.lock:
+            found = self._pits.pop(pit_id, None) is not None
+        return 200 if found else 404, {"succeeded": found, "num_freed": int(found)}
+
+    def search(self, name, body):
+        if 'pit' in body:
+            pit_id = body['pit'].get('id')
+            snapshot = self._pits.get(pit_id)
+            if snapshot is None:
+                return 404, {"error": {"type": "search_context_missing_exception",
+                                       "reason": f"No search context found for id [{pit_id}]"}, "status": 404}
+            body = {key: value for key, value in body.items() if key != 'pit'}
+        else:
+            indices = self.resolve(name)
+            if not indices:
+                return 404, {"error": {"type": "index_not_found_exception", "reason": f"no such index [{name}]"},
+                             "status": 404}
+            pit_id, snapshot = None, self.backend(indices[0])
+        try:
+            from embedded import filter_source
+
+            backend, docs = snapshot
+            response = backend.search(body=dict(body, _source=False))
+            # 嵌入式索引只保存部分字段，_source 按上传的完整文档返回
+            for hit in response['hits']['hits']:
+                hit['_source'] = filter_source(docs[int(hit['_id'])], body.get('_source', True))
+            if pit_id is not None:
+                response['pit_id'] = pit_id
+            return 200, response
+        except ValueError as e:
+            return 400, {"error": {"type": "parsing_exception", "reason": str(e)}, "status": 400}
+
+    def handle_search(self, name, body):
+        with self.lock:
+            self.search_requests += 1
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        return self.search(name, json.loads(body or b'{}'))
+
+    def handle_msearch(self, name, body):
+        """
+        多个查询共用一次请求：请求体为成对的 header / body 行
+        """
+        with self.lock:
+            self.search_requests += 1
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        lines = [line for line in body.decode('utf-8').splitlines() if line.strip()]
+        responses = []
+        for header, query in zip(lines[::2], lines[1::2]):
+            status, response = self.search(json.loads(header).get('index', name), json.loads(query))
+            response.setdefault('status', status)
+            responses.append(response)
+        return 200, {"took": sum(r.get('took', 0) for r in responses), "responses": responses}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload=None):
+                body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('X-Elastic-Product', 'Elasticsearch')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length)
+
+            def _path(self):
+                return [p for p in urlparse(self.path).path.split('/') if p]
+
+            def do_HEAD(self):
+                path = self._path()
+                if not path:
+                    self._reply(200)
+                elif path[0] == '_alias':
+                    self._reply(200 if path[1] in mock.aliases else 404)
+                else:
+                    self._reply(200 if mock.resolve(path[0]) else 404)
+
+            def do_GET(self):
+                path = self._path()
+                if not path:
+                    self._reply(200, {"name": "mock", "cluster_name": "mock",
+                                      "version": {"number": "8.0.0"}, "tagline": "You Know, for Search"})
+                elif path[0] == '_alias':
+                    indices = sorted(mock.aliases.get(path[1], ()))
+                    if indices:
+                        self._reply(200, {index: {"aliases": {path[1]: {}}} for index in indices})
+                    else:
+                        self._reply(404, {"error": f"alias [{path[1]}] missing", "status": 404})
+                elif len(path) == 2 and path[1] == '_mapping' and mock.resolve(path[0]):
+                    self._reply(200, {index: {"mappings": mock.mappings.get(index, {})} for index in mock.resolve(path[0])})
+                elif mock.resolve(path[0]):
+                    self._reply(200, {index: {"settings": mock.settings.get(index, {})} for index in mock.resolve(path[0])})
+                else:
+                    self._reply(404, {"error": {"type": "index_not_found_exception"}, "status": 404})
+
+            def do_PUT(self):
+                path = self._path()
+                body = self._body()
+                if path and path[-1] == '_bulk':
+                    self._reply(*mock.bulk(body))
+                elif len(path) == 2 and path[1] == '_settings':
+                    for index in mock.resolve(path[0]):
+                        mock.settings.setdefault(index, {}).update(json.loads(body or b'{}'))
+                    self._reply(200, {"acknowledged": True})
+                elif path and path[0] not in mock.indices:
+                    mock.indices[path[0]] = {}
+                    mock.settings[path[0]] = json.loads(body or b'{}').get('settings', {})
+                    mock.mappings[path[0]] = json.loads(body or b'{}').get('mappings', {})
+                    self._reply(200, {"acknowledged": True, "index": path[0]})
+                else:
+                    self._reply(400, {"error": {"type": "resource_already_exists_exception"}, "status": 400})
+
+            def do_POST(self):
+                path = self._path()
+                body = self._body()
+                if path and path[-1] == '_bulk':
+                    self._reply(*mock.bulk(body))
+                elif path and path[-1] == '_search':
+                    self._reply(*mock.handle_search(path[0] if len(path) > 1 else '*', body))
+                elif len(path) == 2 and path[1] == '_pit':
+                    self._reply(*mock.open_pit(path[0]))
+                elif path and path[-1] == '_msearch':
+                    self._reply(*mock.handle_msearch(path[0] if len(path) > 1 else '*', body))
+                elif path == ['_aliases']:
+                    mock.update_aliases(json.loads(body)['actions'])
+                    self._reply(200, {"acknowledged": True})
+                elif len(path) == 2 and path[1] in ('_refresh', '_forcemerge'):
+                    self._reply(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+                else:
+                    self._reply(404, {"error": {"type": "unsupported"}, "status": 404})
+
+            def do_DELETE(self):
+                path = self._path()
+                if path == ['_pit']:
+                    self._reply(*mock.close_pit(json.loads(self._body() or b'{}').get('id')))
+                    return
+                indices = mock.resolve(path[0]) if path else []
+                with mock.lock:
+                    for index in indices:
+                        mock.delete_index(index)
+                self._reply(200 if indices else 404, {"acknowledged": bool(indices)})
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地模拟 Elasticsearch")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="以 429 拒绝 _bulk 请求的比例")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个 _bulk 请求的模拟耗时（秒）")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="每个 _search / _msearch 请求的模拟耗时（秒）")
+    args = parser.parse_args()
+
+    mock = MockElasticsearch(port=args.port, reject_rate=args.reject_rate, latency=args.latency,
+                             search_latency=args.search_latency)
+    print(f"模拟 Elasticsearch 运行在 {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
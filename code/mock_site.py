@@ -0,0 +1,139 @@
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 本地模拟的多主机网站，用于测试多进程共享爬取队列（frontier.py）的吞吐和按主机限速：
+# 每个主机是 127.0.0.1 上一个单独端口的 HTTP 服务（对爬虫来说端口不同即为不同主机），
+# 可以设置每个主机的响应时间，记录每个主机收到请求的时间，用于检查请求间隔和同时进行的请求数。
+
+WORDS = ["南开", "大学", "学院", "新闻", "通知", "学术", "讲座", "招生", "研究", "教学", "校园", "科研"]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # 爬虫进程被强制结束时留下的断开连接，不打印
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockSite:
+    def __init__(self, hosts=16, pages=1000, latency=0.05, slow_hosts=0, slow_latency=1.0, links=10,
+                 error_rate=0.0, seed=0):
+        self.num_hosts = hosts
+        self.num_pages = pages
+        self.latencies = [slow_latency if h < slow_hosts else latency for h in range(hosts)]
+        self.error_rate = error_rate      # 以 503 拒绝请求的比例
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = [[] for _ in range(hosts)]   # 每个主机的 (开始时间, 结束时间, 页面)
+        self.servers = [_Server(('127.0.0.1', 0), self._handler(h)) for h in range(hosts)]
+        self.links = self._generate_links(links, seed)
+        self.threads = []
+
+    def _generate_links(self, links, seed):
+        """
+        页面 i 属于主机 i % hosts；每个页面链接到下一个页面（保证从首页可以到达所有页面）
+        和同一主机上的后一个页面，其余链接七成指向同一主机
+        """
+        rng = random.Random(seed)
+        out = []
+        for i in range(self.num_pages):
+            targets = {(i + 1) % self.num_pages, (i + self.num_hosts) % self.num_pages}
+            while len(targets) < min(links, self.num_pages):
+                j = rng.randrange(self.num_pages)
+                if rng.random() < 0.7:
+                    j = j - j % self.num_hosts + i % self.num_hosts
+                    if j >= self.num_pages:
+                        continue
+                targets.add(j)
+            out.append(sorted(targets))
+        return out
+
+    def url(self, page):
+        host, port = self.servers[page % self.num_hosts].server_address[:2]
+        return f"http://{host}:{port}/p/{page}.htm"
+
+    @property
+    def start_url(self):
+        return self.url(0)
+
+    def start(self):
+        for server in self.servers:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def page(self, page):
+        rng = random.Random(page)
+        text = " ".join(rng.choice(WORDS) for _ in range(50))
+        anchors = "".join(f'<a href="{self.url(j)}">页面 {j}</a> ' for j in self.links[page])
+        return (f"<html><head><title>页面 {page}</title></head>"
+                f"<body><p>{text}</p><div>{anchors}</div></body></html>").encode('utf-8')
+
+    def host_stats(self, host):
+        """
+        返回 (请求数, 不同页面数, 最小请求间隔, 最多同时进行的请求数)
+        """
+        with self.lock:
+            requests = sorted(self.requests[host])
+        starts = [start for start, _, _ in requests]
+        gaps = [b - a for a, b in zip(starts, starts[1:])]
+        events = sorted([(start, 1) for start, _, _ in requests] + [(end, -1) for _, end, _ in requests])
+        active = peak = 0
+        for _, delta in events:
+            active += delta
+            peak = max(peak, active)
+        return len(requests), len({page for _, _, page in requests}), min(gaps, default=None), peak
+
+    def _handler(self, host):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                start = time.time()
+                try:
+                    page = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+                except ValueError:
+                    page = -1
+                if not 0 <= page < site.num_pages or page % site.num_hosts != host:
+                    self._reply(404, b'not found')
+                    return
+                time.sleep(site.latencies[host])
+                with site.lock:
+                    rejected = site.error_rate and site.random.random() < site.error_rate
+                    site.requests[host].append((start, time.time(), page))
+                if rejected:
+                    self._reply(503, b'busy')
+                else:
+                    self._reply(200, site.page(page))
+
+            def _reply(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
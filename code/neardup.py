@@ -0,0 +1,233 @@
+# 近似重复页面检测：正文按字符 shingle 计算 MinHash 签名，分段 LSH 找出候选对，
+# 签名相似度超过阈值的页面用并查集合并成簇，每簇保留 PageRank 最高的页面。
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from corpus import read_records
+
+NUM_PERM = 128               # MinHash 签名长度
+BANDS = 16                   # LSH 分段数，每段 NUM_PERM // BANDS 行
+SIMILARITY_THRESHOLD = 0.8   # 签名估计的 Jaccard 相似度超过该值才算近似重复
+SHINGLE_SIZE = 5             # 字符 shingle 长度
+MIN_TEXT_LENGTH = 50         # 正文过短的页面不参与去重
+WORKERS = os.cpu_count() or 1
+BATCH_SIZE = 256             # 每个进程任务处理的页面数
+SEED = 1
+
+_BLOCK = 4096                # 计算签名时每次处理的 shingle 数，限制临时矩阵大小
+_SHINGLE_BASE = np.uint64(1000003)
+_SHINGLE_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def permutations(num_perm=NUM_PERM, seed=SEED):
+    """
+    num_perm 个 multiply-shift 哈希函数的参数，同一 seed 在各进程中得到相同的结果
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hashes(text, k=SHINGLE_SIZE):
+    """
+    长度为 k 的字符窗口按码点做多项式哈希（向量化，取高 32 位），返回去重后的哈希值
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    k = min(k, len(codes))
+    n = len(codes) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        hashes *= _SHINGLE_BASE
+        hashes += codes[j:j + n]
+    hashes *= _SHINGLE_MIX
+    return np.unique(hashes >> np.uint64(32))
+
+
+def minhash(text, a, b, k=SHINGLE_SIZE):
+    """
+    返回 uint32 签名；正文过短时返回 None
+    """
+    if len(text) < MIN_TEXT_LENGTH:
+        return None
+    hashes = shingle_hashes(text, k)
+    signature = np.full(len(a), np.iinfo(np.uint32).max, dtype=np.uint64)
+    block = np.empty((min(len(hashes), _BLOCK), len(a)), dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        chunk = hashes[start:start + _BLOCK, None]
+        out = block[:len(chunk)]
+        np.multiply(chunk, a, out=out)   # uint64 溢出即取模 2^64
+        out += b
+        out >>= np.uint64(32)
+        np.minimum(signature, out.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def _signature_batch(texts, num_perm=NUM_PERM, seed=SEED):
+    a, b = permutations(num_perm, seed)
+    signatures = np.zeros((len(texts), num_perm), dtype=np.uint32)
+    valid = np.zeros(len(texts), dtype=bool)
+    for i, text in enumerate(texts):
+        signature = minhash(text, a, b)
+        if signature is not None:
+            signatures[i] = signature
+            valid[i] = True
+    return signatures, valid
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def lsh_clusters(signatures, valid, bands=BANDS, threshold=SIMILARITY_THRESHOLD):
+    """
+    分段 LSH：任意一段签名完全相同的页面成为候选，与桶内第一个页面比较签名相似度，
+    超过阈值则合并。返回每个页面所属簇的代表下标
+    """
+    n, num_perm = signatures.shape
+    rows = num_perm // bands
+    parent = list(range(n))
+    candidates = np.flatnonzero(valid)
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[candidates, band * rows:(band + 1) * rows])
+        keys = block.view(np.dtype((np.void, rows * 4))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        shared = np.flatnonzero(counts[inverse] > 1)
+        if not len(shared):
+            continue
+        order = shared[np.argsort(inverse[shared], kind='stable')]
+        buckets = inverse[order]
+        starts = np.r_[True, buckets[1:] != buckets[:-1]]
+        leaders = order[np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))]
+        members, leaders = candidates[order[~starts]], candidates[leaders[~starts]]
+        similarity = (signatures[members] == signatures[leaders]).mean(axis=1)
+        for i, j in zip(members[similarity >= threshold].tolist(), leaders[similarity >= threshold].tolist()):
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i != root_j:
+                parent[root_i] = root_j
+    return np.array([_find(parent, i) for i in range(n)], dtype=np.int64)
+
+
+class NearDupDetector:
+    """
+    边读取语料边计算签名：正文按批提交到进程池，在途批次数有上限，
+    全部加入后调用 clusters() 得到每个页面所属簇的规范 URL
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=SIMILARITY_THRESHOLD,
+                 workers=WORKERS, batch_size=BATCH_SIZE):
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.workers = workers
+        self.batch_size = batch_size
+        self.urls = []
+        self.text_bytes = []
+        self._batch = []
+        self._pending = deque()
+        self._results = []
+        self._executor = None
+
+    def add(self, url, text):
+        self.urls.append(url)
+        self.text_bytes.append(len(text.encode('utf-8')))
+        self._batch.append(text)
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        if self.workers <= 1:
+            self._results.append(_signature_batch(batch, self.num_perm))
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._pending.append(self._executor.submit(_signature_batch, batch, self.num_perm))
+        while len(self._pending) > self.workers * 2:
+            self._results.append(self._pending.popleft().result())
+
+    def signatures(self):
+        self._submit()
+        while self._pending:
+            self._results.append(self._pending.popleft().result())
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if not self._results:
+            return np.zeros((0, self.num_perm), dtype=np.uint32), np.zeros(0, dtype=bool)
+        return (np.concatenate([signatures for signatures, _ in self._results]),
+                np.concatenate([valid for _, valid in self._results]))
+
+    def clusters(self, pagerank_data=None):
+        """
+        返回 URL -> 所在簇的规范 URL（PageRank 最高者，相同时取先出现的），并打印压缩比
+        """
+        start = time.perf_counter()
+        signatures, valid = self.signatures()
+        roots = lsh_clusters(signatures, valid, self.bands, self.threshold)
+        pagerank_data = pagerank_data or {}
+        best = {}
+        for i, root in enumerate(roots.tolist()):
+            current = best.get(root)
+            if current is None or pagerank_data.get(self.urls[i], 0.0) > pagerank_data.get(self.urls[current], 0.0):
+                best[root] = i
+        canonical = {url: self.urls[best[root]] for url, root in zip(self.urls, roots.tolist())}
+
+        kept_bytes = sum(self.text_bytes[i] for i in best.values())
+        total_bytes = sum(self.text_bytes) or 1
+        duplicates = len(self.urls) - len(best)
+        print(f"近似重复检测：{len(self.urls)} 个页面，{len(best)} 个簇，可去掉 {duplicates} 个重复页面，"
+              f"文档压缩比 {len(self.urls) / max(1, len(best)):.3f}，正文压缩比 {total_bytes / max(1, kept_bytes):.3f}，"
+              f"用时 {time.perf_counter() - start:.2f}s")
+        return canonical
+
+
+def dedup_stage(canonical, keep_duplicates=False):
+    """
+    为每条记录写入 cluster（所在簇的规范 URL），默认只保留规范页面
+    """
+    def stage(records):
+        for row in records:
+            cluster = canonical.get(row['url'], row['url'])
+            if cluster != row['url'] and not keep_duplicates:
+                continue
+            row['cluster'] = cluster
+            yield row
+    return stage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="近似重复页面检测")
+    parser.add_argument("csv_file_path", nargs="?", default="finaloutput.csv")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="计算签名的进程数")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--top", type=int, default=10, help="显示最大的若干个簇")
+    args = parser.parse_args()
+
+    detector = NearDupDetector(threshold=args.threshold, workers=args.workers)
+    pageranks = {}
+    for row in read_records(args.csv_file_path, ('url', 'text', 'pagerank')):
+        detector.add(row['url'], row.get('text') or '')
+        try:
+            pageranks[row['url']] = float(row.get('pagerank') or 0)
+        except ValueError:
+            pass
+    canonical = detector.clusters(pageranks)
+
+    sizes = {}
+    for cluster in canonical.values():
+        sizes[cluster] = sizes.get(cluster, 0) + 1
+    for cluster, size in sorted(sizes.items(), key=lambda item: -item[1])[:args.top]:
+        if size > 1:
+            print(f"{size:6d}  {cluster}")
@@ -1,21 +1,59 @@
 import scrapy
 import re
-import csv
+
+from nk_search.crawlstate import CRAWL_STATE_DB, CrawlState, content_hash
+from nk_search.dupefilter import canonical_url, canonicalize_url, in_domain
+from nk_search.frontier import enable_frontier
 
 class NKUSpider(scrapy.Spider):
     name = "nku"
     allowed_domains = ["nankai.edu.cn"]
     start_urls = ["http://www.nankai.edu.cn/"]#http://www.nankai.edu.cn/
+    # 增量爬取时条件请求可能返回 304，需要交给 parse 处理
+    handle_httpstatus_list = [304]
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # FRONTIER_ENABLED 开启时使用多进程共享的爬取队列，由它按主机限速
+        if settings.getbool("FRONTIER_ENABLED"):
+            enable_frontier(settings)
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # INCREMENTAL_CRAWL 开启时记录每个页面的状态，只输出新增、变化和删除的页面
+        spider.crawl_state = None
+        if crawler.settings.getbool("INCREMENTAL_CRAWL"):
+            spider.crawl_state = CrawlState(crawler.settings.get("CRAWL_STATE_DB", CRAWL_STATE_DB))
+            spider.crawl_state.start_run()
+        return spider
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
 
-    def __init__(self, *args, **kwargs):
-        super(NKUSpider, self).__init__(*args, **kwargs)
-        self.output_file = "nku_output.csv"  # CSV 文件名
-        # 初始化 CSV 文件，写入标题行
-        with open(self.output_file, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow(["title", "url", "text", "linksurl"])
+    def start_requests(self):
+        for url in self.start_urls:
+            # 起始页不经过去重：从 JOBDIR 继续时它已在保存的过滤器中
+            yield self.make_request(url, dont_filter=True)
+
+    def make_request(self, url, dont_filter=False):
+        headers = self.crawl_state.conditional_headers(canonical_url(url) or url) if self.crawl_state else None
+        return scrapy.Request(url, headers=headers, callback=self.parse, dont_filter=dont_filter)
 
     def parse(self, response):
+        # 输出的 URL 不区分 http/https，同一页面在链接图中只有一个节点
+        url = canonical_url(response.url) or response.url
+        if response.status == 304:
+            # 页面未修改，沿用上次记录的出链继续爬取
+            self.crawler.stats.inc_value("incremental/not_modified")
+            page = self.crawl_state.get(url)
+            self.crawl_state.touch(url)
+            for link in (page[4].split("; ") if page and page[4] else []):
+                yield self.make_request(link)
+            return
+
         # 提取网页标题
         title = response.xpath("//title/text()").get(default="Untitled")
         
@@ -23,30 +61,47 @@ class NKUSpider(scrapy.Spider):
         raw_text = response.xpath("//body//*[not(self::script or self::style)]/text()").getall()
         clean_content = self.clean_text(" ".join(raw_text))
 
-        # 提取链接
+        # 提取链接：补全相对路径、规范化，并按主机名限制在允许的域内；
+        # 按原协议请求，linksurl 中写与 url 相同的规范形式
         links = response.xpath("//a[@href]/@href").extract()
         full_links = []
+        seen = set()
         for link in links:
-            if link.startswith("/"):  # 处理相对路径
-                link = response.urljoin(link)
-            if self.allowed_domains[0] in link:  # 确保只抓取允许的域
-                full_links.append(link)
-        linksurl = "; ".join(full_links)  # 用分号分隔所有链接
+            link = canonicalize_url(response.urljoin(link))
+            if link and in_domain(link, self.allowed_domains[0]):
+                key = canonical_url(link)
+                if key not in seen:
+                    seen.add(key)
+                    full_links.append(link)
+        linksurl = "; ".join(canonical_url(link) for link in full_links)  # 用分号分隔所有链接
 
-        # 保存数据到 CSV
-        self.save_to_csv(title, response.url, clean_content, linksurl)
+        # 交给 BufferedCsvPipeline 批量写入 CSV
+        item = {
+            "title": title,
+            "url": url,
+            "text": clean_content,
+            "linksurl": linksurl,
+        }
+        if self.crawl_state is None:
+            yield item
+        else:
+            # 内容指纹与上次相同的页面不输出
+            change = self.crawl_state.update(
+                url, self.header(response, b"ETag"), self.header(response, b"Last-Modified"),
+                content_hash(title, clean_content, linksurl), title, linksurl)
+            self.crawler.stats.inc_value(f"incremental/{change or 'unchanged'}")
+            if change:
+                item["change"] = change
+                yield item
 
-        # 继续爬取链接
+        # 继续爬取链接，重复的 URL 由 BloomDupeFilter 过滤
         for link in full_links:
-            yield scrapy.Request(link, callback=self.parse)
+            yield self.make_request(link)
 
-    def save_to_csv(self, title, url, text, linksurl):
-        """
-        保存爬取到的数据到 CSV 文件
-        """
-        with open(self.output_file, "a", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow([title, url, text, linksurl])
+    @staticmethod
+    def header(response, name):
+        value = response.headers.get(name)
+        return value.decode("latin-1") if value else None
 
     def clean_text(self, text):
         """
@@ -1,47 +1,203 @@
 import os
 import csv
-import networkx as nx
+import json
+import argparse
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+
+import metrics
+from corpus import Corpus, is_corpus, read_records
 
 # 增加字段大小限制
 csv.field_size_limit(204857600)  # 1MB，或者更大
 
+STATE_PATH = "pagerank_state.npz"   # 增量计算所需的链接图和得分
+DELTA_PATH = "pagerank_delta.json"  # 增量计算中得分变化的页面
 
-# 第一步：计算 PageRank
-def compute_pagerank(csv_file_path):
-    G = nx.DiGraph()    # 创建有向图
 
-    # 读取 CSV 数据
-    with open(csv_file_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+class LinkGraph:
+    """
+    网页链接图：URL 映射为整数 id，边以 CSR 稀疏矩阵存储
+    """
+
+    def __init__(self):
+        self.url_to_id = {}     # URL -> 整数 id
+        self.urls = []          # 整数 id -> URL
+        self._src = array('i')  # 边的起点 id
+        self._dst = array('i')  # 边的终点 id
+        self._matrix = None
+
+    def __len__(self):
+        return len(self.urls)
+
+    def intern(self, url):
+        """
+        返回 URL 对应的整数 id，不存在时分配新 id
+        """
+        node_id = self.url_to_id.get(url)
+        if node_id is None:
+            node_id = len(self.urls)
+            self.url_to_id[url] = node_id
+            self.urls.append(url)
+        return node_id
+
+    def add_links(self, url, links):
+        """
+        添加 url -> links 的出链，空链接会被忽略
+        """
+        src = None
+        for link in links:
+            link = link.strip()
+            if not link:
+                continue
+            if src is None:
+                src = self.intern(url)
+            self._src.append(src)
+            self._dst.append(self.intern(link))
+        self._matrix = None
+
+    @classmethod
+    def from_csv(cls, csv_file_path):
+        """
+        流式读取 CSV 或语料目录，逐行构建链接图（语料目录只读取 url 和 linksurl 两列）
+        """
+        graph = cls()
+        with metrics.span('pagerank_read'):
+            for row in read_records(csv_file_path, ('url', 'linksurl')):
+                graph.add_links(row['url'], row['linksurl'].split(';'))  # 链接是以分号分隔的
+        return graph
+
+    def to_csr(self):
+        """
+        构建邻接矩阵（行为起点，列为终点），重复边只计一次
+        """
+        if self._matrix is None:
+            n = len(self.urls)
+            src = np.frombuffer(self._src, dtype=np.int32)
+            dst = np.frombuffer(self._dst, dtype=np.int32)
+            data = np.ones(len(src), dtype=np.float64)
+            matrix = sp.csr_matrix((data, (src, dst)), shape=(n, n))
+            matrix.sum_duplicates()
+            matrix.data[:] = 1.0
+            self._matrix = matrix
+        return self._matrix
 
-        for row in reader:
-            url = row['url']
-            links = row['linksurl'].split(';')  # 链接是以分号分隔的
-            # 将每个网页与其链接添加到图中
-            for link in links:
-                link = link.strip()
-                if link:  # 确保链接不为空
-                    G.add_edge(url, link)
+    def pagerank(self, alpha=0.85, max_iter=100, tol=1.0e-6, nstart=None):
+        """
+        幂迭代计算 PageRank，语义与 networkx.pagerank 一致：
+        悬挂节点的得分均匀分配给所有节点，当 L1 误差小于 N * tol 时收敛。
+        返回按 id 排列的得分向量
+        """
+        with metrics.span('pagerank_iterate'):
+            return self._pagerank(alpha, max_iter, tol, nstart)
 
-    pagerank = nx.pagerank(G, alpha=0.85)   # 计算 PageRank 值
-    return pagerank
+    def _pagerank(self, alpha, max_iter, tol, nstart):
+        n = len(self.urls)
+        if n == 0:
+            return np.zeros(0)
+
+        matrix = self.to_csr()
+        out_degree = np.asarray(matrix.sum(axis=1)).ravel()
+        dangling = out_degree == 0
+        inv_degree = np.zeros(n)
+        inv_degree[~dangling] = 1.0 / out_degree[~dangling]
+        transposed = matrix.T.tocsr()
+
+        if nstart is None:
+            x = np.full(n, 1.0 / n)
+        else:
+            x = np.asarray(nstart, dtype=np.float64)
+            x = x / x.sum()
+
+        for iteration in range(1, max_iter + 1):
+            x_last = x
+            x = alpha * (transposed @ (x_last * inv_degree))
+            x += (alpha * x_last[dangling].sum() + (1 - alpha)) / n
+            if np.abs(x - x_last).sum() < n * tol:
+                metrics.counter('pagerank_iterations_total', 'PageRank 幂迭代次数').inc(iteration)
+                return x
+        metrics.counter('pagerank_iterations_total', 'PageRank 幂迭代次数').inc(max_iter)
+        print(f"PageRank 在 {max_iter} 次迭代内未收敛。")
+        return x
+
+    def scores_to_dict(self, scores):
+        return dict(zip(self.urls, scores.tolist()))
+
+    def outlinks(self, url):
+        """
+        返回 url 的出链集合，不在图中时返回空集合
+        """
+        node_id = self.url_to_id.get(url)
+        if node_id is None:
+            return set()
+        matrix = self.to_csr()
+        start, end = matrix.indptr[node_id], matrix.indptr[node_id + 1]
+        return {self.urls[i] for i in matrix.indices[start:end]}
+
+    def sources(self):
+        """
+        返回至少有一条出链的 URL（即作为 CSV 行出现过的页面）
+        """
+        out_degree = np.diff(self.to_csr().indptr)
+        return [self.urls[i] for i in np.flatnonzero(out_degree)]
+
+    def save(self, state_path, scores):
+        """
+        将链接图和得分向量保存到 .npz 文件，供增量计算使用
+        """
+        matrix = self.to_csr()
+        urls = np.frombuffer("\n".join(self.urls).encode('utf-8'), dtype=np.uint8)
+        np.savez(state_path, urls=urls, indptr=matrix.indptr, indices=matrix.indices, scores=scores)
+
+    @classmethod
+    def load(cls, state_path):
+        """
+        读取 save 保存的链接图，返回 (graph, scores)
+        """
+        with np.load(state_path) as state:
+            graph = cls()
+            urls = state['urls'].tobytes().decode('utf-8')
+            graph.urls = urls.split("\n") if urls else []
+            graph.url_to_id = {url: i for i, url in enumerate(graph.urls)}
+            indptr = state['indptr']
+            src = np.repeat(np.arange(len(graph.urls), dtype=np.int32), np.diff(indptr))
+            graph._src.frombytes(src.tobytes())
+            graph._dst.frombytes(state['indices'].astype(np.int32).tobytes())
+            scores = state['scores']
+        return graph, scores
+
+
+# 第一步：计算 PageRank
+def compute_pagerank(csv_file_path, alpha=0.85, tol=1.0e-6):
+    graph = LinkGraph.from_csv(csv_file_path)     # 创建有向图
+    scores = graph.pagerank(alpha=alpha, tol=tol)  # 计算 PageRank 值
+    return graph.scores_to_dict(scores)
 
 
 # 第二步：更新 CSV 文件
+def join_pagerank(rows, pagerank_data):
+    """
+    逐行添加 PageRank 字段，不在内存中保留整份数据
+    """
+    for row in rows:
+        # 获取该 URL 对应的 PageRank 值，若没有该值则设为 0.0
+        row['pagerank'] = pagerank_data.get(row['url'], 0.0)
+        yield row
+
+
 def update_csv_with_pagerank(csv_file_path, pagerank_data):
-    updated_rows = []
+    with metrics.span('pagerank_write'):
+        return _update_csv_with_pagerank(csv_file_path, pagerank_data)
 
-    # 读取原 CSV 数据并添加 PageRank 列
-    with open(csv_file_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames + ['pagerank']  # 添加 PageRank 字段
 
-        for row in reader:
-            url = row['url']
-            # 获取该 URL 对应的 PageRank 值，若没有该值则设为 0.0
-            pr_value = pagerank_data.get(url, 0.0)
-            row['pagerank'] = pr_value
-            updated_rows.append(row)
+def _update_csv_with_pagerank(csv_file_path, pagerank_data):
+    # 语料目录只写入 pagerank 一列，不重写正文
+    if is_corpus(csv_file_path):
+        corpus = Corpus(csv_file_path)
+        corpus.add_column('pagerank', (pagerank_data.get(url, 0.0) for url in corpus.column('url')))
+        return csv_file_path
 
     # 确保目录存在
     output_dir = 'pangerankedData'
@@ -51,21 +207,128 @@ def update_csv_with_pagerank(csv_file_path, pagerank_data):
     # 定义更新后的文件路径
     updated_csv_file_path = os.path.join(output_dir, 'pangerankedoutput.csv')
 
-    # 将更新后的数据写回到新的 CSV 文件
-    with open(updated_csv_file_path, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+    # 读取原 CSV 数据，边读边写入添加了 PageRank 列的新文件
+    with open(csv_file_path, 'r', encoding='utf-8') as f, \
+            open(updated_csv_file_path, 'w', encoding='utf-8', newline='') as out:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames + ['pagerank']  # 添加 PageRank 字段
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(updated_rows)
+        writer.writerows(join_pagerank(reader, pagerank_data))
 
     return updated_csv_file_path
 
 
+# 增量计算：读取新一轮爬取结果
+def read_page_links(csv_file_path):
+    """
+    返回 URL -> 出链集合；增量爬取的 delta 文件中标记为 deleted 的页面映射为 None
+    """
+    page_links = {}
+    for row in read_records(csv_file_path, ('url', 'linksurl', 'change')):
+        if row.get('change') == 'deleted':
+            page_links[row['url']] = None
+            continue
+        links = (link.strip() for link in row['linksurl'].split(';'))
+        page_links[row['url']] = {link for link in links if link}
+    return page_links
+
+
+def crawl_delta(graph, page_links, full_crawl=True):
+    """
+    对比旧链接图与新爬取结果，返回 (新增, 删除, 出链变化) 的 URL 列表。
+    full_crawl 为 False 时表示只重新爬取了部分页面，只有明确标记删除的页面才算删除
+    """
+    old_sources = set(graph.sources())
+    added, changed = [], []
+    for url, links in page_links.items():
+        if links is None:
+            continue
+        if url not in old_sources:
+            if links:
+                added.append(url)
+        elif graph.outlinks(url) != links:
+            changed.append(url)
+    # 只作为链接目标出现过（没有出链）的页面被删除时也要从图中去掉
+    removed = [url for url, links in page_links.items() if links is None and url in graph.url_to_id]
+    if full_crawl:
+        removed += [url for url in old_sources if url not in page_links]
+    return added, removed, changed
+
+
+def merge_graph(graph, page_links, removed):
+    """
+    用新爬取的页面替换旧图中对应页面的出链，并去掉已删除的页面。
+    指向已删除页面的链接一并去掉，否则它会作为链接目标留在图中继续获得得分并写入状态
+    """
+    removed = set(removed)
+    skipped = set(page_links) | removed
+    merged = LinkGraph()
+    for url in graph.sources():
+        if url not in skipped:
+            merged.add_links(url, graph.outlinks(url) - removed)
+    for url, links in page_links.items():
+        if links:
+            merged.add_links(url, links - removed)
+    return merged
+
+
+def incremental_pagerank(csv_file_path, state_path, threshold=0.01, full_crawl=True, alpha=0.85, tol=1.0e-6):
+    """
+    以上次的得分为初值做幂迭代，只返回得分相对变化超过 threshold 的页面。
+    保存的得分向量即为已写入索引的值，未越过阈值的页面保持旧值
+    """
+    graph, old_scores = LinkGraph.load(state_path)
+    published = graph.scores_to_dict(old_scores)
+    page_links = read_page_links(csv_file_path)
+    added, removed, changed = crawl_delta(graph, page_links, full_crawl)
+    print(f"新增 {len(added)} 个页面，删除 {len(removed)} 个页面，出链变化 {len(changed)} 个页面。")
+    if not (added or removed or changed):
+        return {}
+
+    merged = merge_graph(graph, page_links, removed)
+    n = len(merged)
+    nstart = np.array([published.get(url, 1.0 / n) for url in merged.urls])
+    scores = merged.pagerank(alpha=alpha, tol=tol, nstart=nstart)
+
+    moved = {}
+    for url, score in zip(merged.urls, scores.tolist()):
+        old = published.get(url)
+        if old is None or abs(score - old) > threshold * old:
+            moved[url] = score
+    final_scores = np.array([moved.get(url, published.get(url, 0.0)) for url in merged.urls])
+    merged.save(state_path, final_scores)
+    return moved
+
+
 # 第三步：执行完整流程
 if __name__ == "__main__":
-    # 计算 PageRank
-    csv_file_path = "cleanednkuoutput.csv"  # 你的原始 CSV 文件路径
-    pagerank_data = compute_pagerank(csv_file_path)
+    parser = argparse.ArgumentParser(description="计算 PageRank")
+    parser.add_argument("csv_file_path", nargs="?", default="cleanednkuoutput.csv", help="爬取数据文件路径")
+    parser.add_argument("--state", default=STATE_PATH, help="保存链接图和得分的文件")
+    parser.add_argument("--incremental", action="store_true", help="基于上次的结果增量计算")
+    parser.add_argument("--partial", action="store_true", help="CSV 只包含重新爬取的部分页面")
+    parser.add_argument("--threshold", type=float, default=0.01, help="得分相对变化超过该值才写回")
+    parser.add_argument("--metrics", help="结束时把各阶段耗时写入该文件（.prom 为 Prometheus 格式，否则为 JSON lines）")
+    args = parser.parse_args()
+
+    if args.incremental:
+        moved = incremental_pagerank(args.csv_file_path, args.state, args.threshold, full_crawl=not args.partial)
+        # 只把变化的得分交给 dataup.py --pagerank-delta 做局部更新
+        with open(DELTA_PATH, 'w', encoding='utf-8') as f:
+            json.dump(moved, f, ensure_ascii=False)
+        print(f"{len(moved)} 个页面的 PageRank 发生变化，已保存到: {DELTA_PATH}")
+    else:
+        # 计算 PageRank
+        graph = LinkGraph.from_csv(args.csv_file_path)
+        scores = graph.pagerank()
+        graph.save(args.state, scores)
+        pagerank_data = graph.scores_to_dict(scores)
+
+        # 更新 CSV 文件，将 PageRank 数据添加到文件中
+        updated_csv_file_path = update_csv_with_pagerank(args.csv_file_path, pagerank_data)
+        print(f"Updated CSV saved at: {updated_csv_file_path}")
 
-    # 更新 CSV 文件，将 PageRank 数据添加到文件中
-    updated_csv_file_path = update_csv_with_pagerank(csv_file_path, pagerank_data)
-    print(f"Updated CSV saved at: {updated_csv_file_path}")
+    if args.metrics:
+        metrics.REGISTRY.dump(args.metrics)
+        print(metrics.REGISTRY.report('pagerank'))
@@ -0,0 +1,255 @@
+# 单次流式处理：爬取结果依次经过 清洗 →（模板去除）→ PageRank → 联想建议 →（近似去重）→（分词）→ 索引/输出。
+# 每个阶段都是接收记录迭代器、返回记录迭代器的生成器，内存中只保留
+# 链接图与 URL → PageRank 的映射，不再写出中间 CSV 文件。
+import argparse
+import csv
+import re
+import time
+
+from corpus import CORPUS_DIR, CorpusWriter, read_records
+import metrics
+from boilerplate import TEMPLATE_CACHE, BoilerplateStripper, strip_stage
+from neardup import WORKERS as DEDUP_WORKERS, NearDupDetector, dedup_stage
+from segmenter import SEGMENT_DICT, indexed_dictionary, load_segmenter, segment_stage
+from pagerank import STATE_PATH, LinkGraph, incremental_pagerank, join_pagerank
+from suggest import generate_suggestion
+
+# 增加字段大小限制
+csv.field_size_limit(2**31 - 1)
+
+INPUT_FILE = 'cleanednkuoutput.csv'  # 爬取数据文件路径
+OUTPUT_FILE = 'finaloutput.csv'      # 输出到 CSV 时的文件路径
+FIELDNAMES = ['title', 'url', 'text', 'linksurl', 'pagerank', 'suggest', 'cluster', 'title_seg', 'text_seg']
+
+
+def clean_text(text):
+    """
+    清理无效换行、缩进和多余空格的文本内容
+    """
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def clean_stage(records):
+    """
+    清洗：规范空白字符，跳过没有 URL 的记录和重复的 URL
+    """
+    seen = set()
+    for row in records:
+        url = (row.get('url') or '').strip()
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        row['url'] = url
+        row['title'] = clean_text(row.get('title') or '') or 'Untitled'
+        row['text'] = clean_text(row.get('text') or '')
+        row['linksurl'] = row.get('linksurl') or ''
+        yield row
+
+
+def pagerank_stage(pagerank_data):
+    def stage(records):
+        return join_pagerank(records, pagerank_data)
+    return stage
+
+
+def suggest_stage(records):
+    for row in records:
+        # 为每一行数据生成联想建议
+        row['suggest'] = generate_suggestion(row['title'])
+        yield row
+
+
+def csv_sink(records, output_file=OUTPUT_FILE):
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction='ignore')
+        writer.writeheader()
+        for row in records:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def corpus_sink(records, output_path=CORPUS_DIR):
+    """
+    写入列式语料目录，之后的阶段（dataup.py、embedded.py build 等）可以只读取需要的列
+    """
+    with CorpusWriter(output_path, FIELDNAMES) as writer:
+        for row in records:
+            writer.append({name: row.get(name) for name in FIELDNAMES})
+    return writer.rows
+
+
+def es_sink(records, index_name=None, workers=None, segment_dict=None):
+    """
+    将记录直接并发写入新版本索引，完成后切换别名；segment_dict 为分词阶段所用词典的指纹
+    """
+    import dataup
+
+    alias = index_name or dataup.INDEX_NAME
+    es = dataup.connect()
+    index_name = dataup.create_versioned_index(es, alias, segment_dict)
+    actions = ((offset, dataup.build_action(row, index_name)) for offset, row in enumerate(records))
+    ingestor = dataup.BulkIngestor(es, workers=workers or dataup.WORKERS)
+    dataup.report_failures(ingestor.run(actions))
+    if ingestor.failed_batches:
+        print(f"有 {ingestor.failed_batches} 个批次未能提交，别名 '{alias}' 未切换。")
+    else:
+        dataup.publish_index(es, index_name, alias)
+    return ingestor.indexed
+
+
+def apply_delta(delta_file, state_path=STATE_PATH, threshold=0.01, index_name=None, workers=None, stripper=None,
+                segmenter=None):
+    """
+    处理增量爬取输出的 delta 文件，直接修改别名指向的当前索引：
+    新增和变化的页面重新索引，删除的页面从索引中删除，
+    其余页面只更新 PageRank 变化超过 threshold 的文档。
+    stripper 只使用缓存中已学习的模板；segmenter 必须与建索引时使用的词典一致
+    """
+    import dataup
+
+    alias = index_name or dataup.INDEX_NAME
+    es = dataup.connect()
+    indexed = indexed_dictionary(es, alias)
+    if indexed != (segmenter.fingerprint if segmenter is not None else None):
+        # 否则重新索引的页面与其余页面的预分词字段不一致（或缺失），短语查询会漏掉它们
+        raise ValueError(f"索引 '{alias}' 的分词词典指纹为 {indexed}，与本次 --segment 设置不一致。")
+    moved = incremental_pagerank(delta_file, state_path, threshold, full_crawl=False)
+    graph, scores = LinkGraph.load(state_path)
+    published = graph.scores_to_dict(scores)
+
+    records = clean_stage(read_records(delta_file))
+    if stripper is not None:
+        records = strip_stage(stripper)(records)
+    records = suggest_stage(pagerank_stage(published)(records))
+    if segmenter is not None:
+        records = segment_stage(segmenter)(records)
+    reindexed = set()
+
+    def actions():
+        for offset, row in enumerate(records):
+            reindexed.add(row['url'])
+            if row.get('change') == 'deleted':
+                yield offset, dataup.build_delete_action(row['url'], alias)
+            else:
+                yield offset, dataup.build_action(row, alias)
+
+    ingestor = dataup.BulkIngestor(es, workers=workers or dataup.WORKERS)
+    failed_documents = ingestor.run(actions())
+    rest = {url: score for url, score in moved.items() if url not in reindexed}
+    failed_documents += dataup.update_pagerank(es, rest, alias)
+    dataup.report_failures(failed_documents)
+    return len(reindexed)
+
+
+def build_graph(csv_file_path, detector=None, stripper=None):
+    """
+    第一遍只读取 url 和 linksurl 两列构建链接图（输入为语料目录时不解析正文）；
+    传入 BoilerplateStripper 时同时学习各主机的模板，
+    传入 NearDupDetector 时把（去除模板后的）正文交给它计算签名
+    """
+    graph = LinkGraph()
+    seen = set()
+    pending = {}  # 主机 -> 等待模板学习完成的 (url, 正文)
+    columns = ('url', 'linksurl') if detector is None and stripper is None else ('url', 'linksurl', 'text')
+    for row in read_records(csv_file_path, columns):
+        url = (row.get('url') or '').strip()
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        graph.add_links(url, (row.get('linksurl') or '').split(';'))
+        if detector is None and stripper is None:
+            continue
+        text = clean_text(row.get('text') or '')
+        if stripper is None:
+            detector.add(url, text)
+            continue
+        host = stripper.observe(url, text)
+        if detector is not None:
+            pending.setdefault(host, []).append((url, text))
+            if stripper.learned(host):
+                for page_url, page_text in pending.pop(host):
+                    detector.add(page_url, stripper.strip(page_url, page_text))
+    if stripper is not None:
+        stripper.finish()
+        for pages in pending.values():
+            for page_url, page_text in pages:
+                detector.add(page_url, stripper.strip(page_url, page_text))
+    return graph
+
+
+def run_pipeline(csv_file_path, stages, sink):
+    # 各阶段是串联的生成器，只能整体计时
+    with metrics.span('pipeline_stream'):
+        records = read_records(csv_file_path)
+        for stage in stages:
+            records = stage(records)
+        return sink(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="单次流式处理爬取结果")
+    parser.add_argument("csv_file_path", nargs="?", default=INPUT_FILE)
+    parser.add_argument("--sink", choices=["csv", "corpus", "es"], default="csv",
+                        help="输出到 finaloutput.csv、列式语料目录或直接写入 Elasticsearch")
+    parser.add_argument("--output", help=f"输出路径，默认 {OUTPUT_FILE}（csv）或 {CORPUS_DIR}（corpus）")
+    parser.add_argument("--strip-boilerplate", action="store_true", help="去除各主机页面共用的模板文本（导航、页脚等）")
+    parser.add_argument("--templates", default=TEMPLATE_CACHE, help="模板缓存文件，已学习的主机不再重新学习")
+    parser.add_argument("--dedup", action="store_true", help="近似重复的页面每组只保留 PageRank 最高的一个（不支持 --delta）")
+    parser.add_argument("--keep-duplicates", action="store_true", help="与 --dedup 同用：保留重复页面，只标记 cluster")
+    parser.add_argument("--dedup-workers", type=int, default=DEDUP_WORKERS, help="计算 MinHash 签名的进程数")
+    parser.add_argument("--segment", action="store_true", help="用分词词典生成预分词字段 title_seg、text_seg")
+    parser.add_argument("--segment-dict", default=SEGMENT_DICT, help="分词词典（segmenter.py build 生成）")
+    parser.add_argument("--delta", action="store_true", help="输入为增量爬取的 delta 文件，只更新变化的文档")
+    parser.add_argument("--state", default=STATE_PATH, help="链接图和得分：全量运行时写入，--delta 时读取并更新")
+    parser.add_argument("--threshold", type=float, default=0.01, help="PageRank 相对变化超过该值才写回")
+    parser.add_argument("--metrics", help="结束时把各阶段耗时写入该文件（.prom 为 Prometheus 格式，否则为 JSON lines）")
+    args = parser.parse_args()
+
+    if args.delta and (args.dedup or args.keep_duplicates):
+        # 全量运行不保存 MinHash 签名，增量的页面无法与已索引的页面比较，近似重复会重新进入索引
+        parser.error("--dedup 不支持 --delta：增量运行无法与已索引的页面比较，请用全量运行去重")
+
+    segmenter = None
+    if args.segment:
+        segmenter = load_segmenter(args.segment_dict)
+        if segmenter is None:
+            parser.error(f"分词词典 '{args.segment_dict}' 不存在，请先运行 python segmenter.py build")
+
+    start = time.perf_counter()
+    if args.delta:
+        stripper = BoilerplateStripper(args.templates) if args.strip_boilerplate else None
+        count = apply_delta(args.csv_file_path, args.state, args.threshold, stripper=stripper, segmenter=segmenter)
+        print(f"共处理 {count} 条变化记录，用时 {time.perf_counter() - start:.2f}s")
+    else:
+        stripper = BoilerplateStripper(args.templates) if args.strip_boilerplate else None
+        detector = NearDupDetector(workers=args.dedup_workers) if args.dedup else None
+        with metrics.span('pipeline_graph'):
+            graph = build_graph(args.csv_file_path, detector, stripper)
+        scores = graph.pagerank()
+        # 保存链接图和得分，之后的 --delta 运行在此基础上增量计算
+        graph.save(args.state, scores)
+        pagerank_data = graph.scores_to_dict(scores)
+        print(f"PageRank 计算完成，共 {len(graph)} 个节点，用时 {time.perf_counter() - start:.2f}s")
+
+        stages = [clean_stage]
+        if stripper is not None:
+            stages.append(strip_stage(stripper))
+        stages += [pagerank_stage(pagerank_data), suggest_stage]
+        if detector is not None:
+            stages.append(dedup_stage(detector.clusters(pagerank_data), args.keep_duplicates))
+        if segmenter is not None:
+            stages.append(segment_stage(segmenter))
+        if args.sink == "es":
+            segment_dict = segmenter.fingerprint if segmenter is not None else None
+            count = run_pipeline(args.csv_file_path, stages, lambda records: es_sink(records, segment_dict=segment_dict))
+        elif args.sink == "corpus":
+            count = run_pipeline(args.csv_file_path, stages, lambda records: corpus_sink(records, args.output or CORPUS_DIR))
+        else:
+            count = run_pipeline(args.csv_file_path, stages, lambda records: csv_sink(records, args.output or OUTPUT_FILE))
+        print(f"共处理 {count} 条记录，用时 {time.perf_counter() - start:.2f}s")
+
+    if args.metrics:
+        metrics.REGISTRY.dump(args.metrics)
+        print(metrics.REGISTRY.report())
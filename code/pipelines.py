@@ -0,0 +1,142 @@
+import csv
+import logging
+import os
+import time
+
+from scrapy import signals
+
+logger = logging.getLogger(__name__)
+
+CSV_BUFFER_SIZE = 1000          # 每攒够多少条记录写一次文件
+FIELDS = ["title", "url", "text", "linksurl"]
+DELTA_FIELDS = FIELDS + ["change"]  # change 为 new、changed 或 deleted
+WRITTEN_URLS_FILE = 'written_urls.txt'  # JOBDIR 中记录已写出的 URL，每行一个，只追加
+
+
+class BufferedCsvPipeline:
+    """
+    将爬取结果攒批写入 CSV：文件在整个爬取过程中只打开一次，
+    每 CSV_BUFFER_SIZE 条记录调用一次 writerows。
+    增量爬取时只写出变化的页面到 DELTA_OUTPUT_FILE，爬取完整结束后追加已删除的页面。
+    使用共享爬取队列（spider.frontier）时，每次写出文件后才提交已完成的页面；
+    从断点继续（共享队列或 JOBDIR 中保存了上次的进度）时追加到原文件
+    """
+
+    def __init__(self, output_file, buffer_size=CSV_BUFFER_SIZE, incremental=False, seen_filter=None):
+        self.output_file = output_file
+        self.buffer_size = buffer_size
+        self.incremental = incremental
+        self.fields = DELTA_FIELDS if incremental else FIELDS
+        self.buffer = []
+        self.file = None
+        self.writer = None
+        self.items = 0
+        self.flushes = 0
+        self.frontier = None
+        self.seen_filter = seen_filter   # JOBDIR 中的去重过滤器，存在时表示从上次中断处继续
+        self.written = None              # 设置 JOBDIR 时已写出的 URL
+        self.written_file = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if settings.getbool('INCREMENTAL_CRAWL'):
+            pipeline = cls(settings.get('DELTA_OUTPUT_FILE', 'nku_delta.csv'),
+                           settings.getint('CSV_BUFFER_SIZE', CSV_BUFFER_SIZE), incremental=True)
+            # 关闭原因只有 spider_closed 信号才能拿到，该信号在 close_spider 之后发出
+            crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+            return pipeline
+        return cls(settings.get('CSV_OUTPUT_FILE', 'nku_output.csv'),
+                   settings.getint('CSV_BUFFER_SIZE', CSV_BUFFER_SIZE), seen_filter=cls.seen_filter_path(settings))
+
+    @staticmethod
+    def seen_filter_path(settings):
+        # 与 BloomDupeFilter 相同：只有设置了 JOBDIR 时才保存去重过滤器
+        jobdir = settings.get('JOBDIR')
+        return os.path.join(jobdir, settings.get('SEEN_FILTER_FILE', 'seen_urls.bloom')) if jobdir else None
+
+    def open_spider(self, spider=None):
+        self.frontier = getattr(spider, 'frontier', None)
+        if self.frontier is not None:
+            self.frontier.commit_with_output = True
+            resumed = self.frontier.resumed
+        else:
+            resumed = self.seen_filter is not None and os.path.exists(self.seen_filter)
+        append = resumed and os.path.exists(self.output_file)
+        if self.frontier is None and self.seen_filter is not None:
+            self.open_written(os.path.join(os.path.dirname(self.seen_filter), WRITTEN_URLS_FILE), append)
+        if append:
+            self.file = open(self.output_file, "a", newline="", encoding="utf-8", buffering=1024 * 1024)
+            self.writer = csv.writer(self.file)
+            return
+        # 初始化 CSV 文件，写入标题行
+        self.file = open(self.output_file, "w", newline="", encoding="utf-8-sig", buffering=1024 * 1024)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fields)
+
+    def open_written(self, path, append):
+        """
+        起始页不经过去重，每次从 JOBDIR 继续都会重新抓取；已写出的 URL 记录在 JOBDIR 中，
+        继续时读入，不再重复写入（不必重新解析整个输出文件）
+        """
+        self.written = set()
+        if append and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.written.update(line.rstrip("\n") for line in f)
+        self.written_file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def process_item(self, item, spider=None):
+        if self.written is not None:
+            if item.get('url') in self.written:
+                return item
+            self.written.add(item.get('url'))
+        self.buffer.append([item.get(field, '') for field in self.fields])
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        start = time.monotonic()
+        if self.buffer:
+            self.writer.writerows(self.buffer)
+            self.file.flush()
+            if self.written_file is not None:
+                # 先写输出文件再记录 URL：中途崩溃最多重复写入一批，不会漏掉页面
+                url_index = self.fields.index('url')
+                self.written_file.writelines(row[url_index] + "\n" for row in self.buffer)
+                self.written_file.flush()
+            self.items += len(self.buffer)
+            self.flushes += 1
+            self.buffer = []
+        if self.frontier is not None:
+            elapsed = time.monotonic() - start
+            if elapsed > self.frontier.lease_seconds / 4:
+                # 写出期间无法续约，停顿接近租约时长时其他进程会重新爬取这些页面
+                logger.warning("写出输出文件用时 %.1fs，接近共享队列的租约时长 %ss，"
+                               "请减小 CSV_BUFFER_SIZE 或增大 FRONTIER_LEASE_SECONDS", elapsed, self.frontier.lease_seconds)
+            self.frontier.commit()
+
+    def close_spider(self, spider=None):
+        self.flush()
+        if not self.incremental:
+            self.close()
+
+    def spider_closed(self, spider, reason):
+        state = spider.crawl_state
+        if reason == 'finished':
+            # 本轮没有访问到的页面视为已删除；中途停止的爬取无法判断，不输出删除记录
+            deleted = state.deleted()
+            self.buffer.extend([title, url, '', '', 'deleted'] for url, title in deleted)
+            self.flush()
+            state.finish_run()
+            spider.crawler.stats.set_value('incremental/deleted', len(deleted))
+        else:
+            logger.warning("爬取未完整结束（%s），本轮不输出已删除的页面", reason)
+        state.close()
+        self.close()
+
+    def close(self):
+        self.file.close()
+        if self.written_file is not None:
+            self.written_file.close()
+        logger.info("共写入 %d 条记录到 %s，写文件 %d 次", self.items, self.output_file, self.flushes)
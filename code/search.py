@@ -1,42 +1,53 @@
-import pandas as pd
-from elasticsearch import Elasticsearch
-from getpass import getpass
-import hashlib
+# 命令行批量模式要求冷启动快：Elasticsearch 客户端、numpy、asyncio 和嵌入式后端都在第一次用到时才导入，
+# 联想索引、分词词典和后端连接也在第一次查询时才加载
+import argparse
+import contextlib
 import json
 import os
-from datetime import datetime
-from tqdm import tqdm
 import sys
+import threading
+import time
+from getpass import getpass
+import metrics
+from history import HistoryStore, HISTORY_DB
+from cache import QueryCache
+from suggester import Suggester, SUGGEST_INDEX
+from segmenter import SEGMENT_DICT, indexed_dictionary, load_segmenter
+from users import USERS_DB, USERS_FILE, UserStore
+
+VERSION_CHECK_INTERVAL = 5   # 检查别名指向的索引是否变化的间隔（秒）
+PREWARM_QUERIES = 50         # 启动时预热缓存的高频查询数
+RESULT_SIZE = 4              # 每页的结果数
+RERANK_WINDOW = 100          # 按 TF-IDF 与 PageRank 混合得分重排的结果数，翻页在这个窗口内进行
+WINDOW_CHUNK = 100           # 窗口大于该值时用 point-in-time + search_after 分批拉取
+PIT_KEEP_ALIVE = '1m'        # 分批拉取期间 point-in-time 的保持时间
+WINDOW_SORT = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+TFIDF_WEIGHT = 0.7
+PAGERANK_WEIGHT = 0.3
+MSEARCH_BATCH_SIZE = 50      # 批量查询时每个 _msearch 请求包含的查询数
+ASYNC_CONCURRENCY = 8        # 异步批量查询同时在途的请求数
+SOURCE_FIELDS = ["title", "url", "pagerank", "cluster"]   # 查询结果返回的字段
+SNIPPET_SIZE = 200           # 摘要长度（字符）
+HIGHLIGHT_TAGS = ("【", "】")  # 摘要中命中词的标记
+PROFILE_BOOST = 1.5          # 个性化：文档命中用户画像中全部词时得分的提升倍数
+ES_CONNECTIONS = 10          # 到 ES 的连接池大小（每个节点），多线程共用一个 SearchEngine 时调大
+EMBEDDED_INDEX = 'embedded.idx'          # 与 embedded.EMBEDDED_INDEX 相同，嵌入式后端依赖 numpy，不在启动时导入
+SEARCH_SERVER = 'http://127.0.0.1:8000'  # 命令行模式优先复用的 server.py 服务
+SERVER_PROBE_TIMEOUT = 0.2               # 探测服务是否在运行的超时（秒）
+SERVER_TIMEOUT = 30                      # 通过服务查询时每个请求的超时（秒）
+QUERY_TYPES = ('phrase', 'wildcard', 'suggest')
 
 class User:
-    def __init__(self, users_file='users.json'):
-        self.users_file = users_file
-        self.users = self.load_users()
+    def __init__(self, users_db=USERS_DB, users_file=USERS_FILE):
+        # 账号保存在 SQLite 中，旧版 users.json 首次运行时自动导入
+        self.store = UserStore(users_db, users_file)
         self.current_user = None
     
-    def load_users(self):
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump({}, f)
-        with open(self.users_file, 'r') as f:
-            try:
-                users = json.load(f)
-            except json.JSONDecodeError:
-                users = {}
-        return users
-    
-    def save_users(self):
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f)
-    
-    def hash_password(self, password, salt='random_salt'):
-        return hashlib.sha256((password + salt).encode()).hexdigest()
-    
     def register(self):
         print("\n===== 注册 =====")
         while True:
             username = input("请输入用户名: ").strip()
-            if username in self.users:
+            if username in self.store:
                 print("用户名已存在，请选择其他用户名。")
             else:
                 break
@@ -49,20 +60,19 @@ class User:
                 print("密码不能为空，请重新输入。")
             else:
                 break
-        hashed_password = self.hash_password(password)
-        self.users[username] = hashed_password
-        self.save_users()
+        if not self.store.add(username, password):
+            print("用户名已存在，请选择其他用户名。")
+            return
         print(f"用户 '{username}' 注册成功！")
     
     def login(self):
         print("\n===== 登录 =====")
         username = input("请输入用户名: ").strip()
-        if username not in self.users:
+        if username not in self.store:
             print("用户名不存在。")
             return False
         password = getpass("请输入密码: ")
-        hashed_password = self.hash_password(password)
-        if hashed_password == self.users[username]:
+        if self.store.verify(username, password):
             print(f"用户 '{username}' 登录成功！")
             self.current_user = username
             return True
@@ -75,42 +85,142 @@ class User:
             print(f"用户 '{self.current_user}' 已登出。")
             self.current_user = None
 
+_UNLOADED = object()
+
+
+def rewrite_wildcard(pattern):
+    """
+    将通配符查询改写为代价最低的查询，返回 (策略, 查询子句)：
+    abc* 用前缀索引，*abc 用反转字段上的前缀查询，*abc* 用三元组短语查询，
+    其余模式退回 wildcard（前导通配时改在反转字段上执行）
+    """
+    value = pattern.lower()
+    core = value.strip('*')
+    leading, trailing = value.startswith('*'), value.endswith('*')
+    if core and not any(c in core for c in '*?'):
+        if not leading and not trailing:
+            return 'term', {"term": {"text": {"value": core, "case_insensitive": True}}}
+        if not leading:
+            return 'prefix', {"prefix": {"text": {"value": core, "case_insensitive": True}}}
+        if not trailing:
+            return 'suffix', {"prefix": {"text.reversed": {"value": core[::-1]}}}
+        if len(core) >= 3:
+            return 'infix', {"match_phrase": {"text.ngram": {"query": core}}}
+    if leading and not trailing:
+        return 'reversed_wildcard', {"wildcard": {"text.reversed": {"value": value[::-1]}}}
+    return 'wildcard', {"wildcard": {"text": {"value": value, "case_insensitive": True}}}
+
+
 class SearchEngine:
-    def __init__(self, es_host='http://localhost:9200', index_name='xxjs'):
-        self.es = Elasticsearch([es_host])
+    def __init__(self, es_host='http://localhost:9200', index_name='xxjs', history_db=HISTORY_DB, cache=None,
+                 suggest_index=SUGGEST_INDEX, segment_dict=SEGMENT_DICT, backend=None, embedded_index=EMBEDDED_INDEX,
+                 connections=ES_CONNECTIONS, rerank_window=RERANK_WINDOW, page_size=RESULT_SIZE):
+        self.history = HistoryStore(history_db)
+        self.cache = cache if cache is not None else QueryCache()
+        self.suggest_index = suggest_index
+        self.segment_dict = segment_dict
+        self._version_checked = float('-inf')
+        self._index_version = None
+        # 只通过别名查询，dataup.py 重建索引后原子切换别名，查询不受影响
         self.index = index_name
-        if not self.es.ping():
-            print("无法连接到Elasticsearch。请检查ES_HOST配置。")
-            exit(1)
-        else:
+        self.es_host = es_host
+        self.rerank_window = rerank_window
+        self.page_size = page_size
+        # 后端在第一次查询时才连接
+        self._connect_args = (backend, es_host, embedded_index, connections)
+        self._es = None
+        self._connect_lock = threading.Lock()
+        self._suggester = self._segmenter = self._dictionary = _UNLOADED
+
+    @property
+    def es(self):
+        if self._es is None:
+            with self._connect_lock:
+                if self._es is None:
+                    with metrics.span('connect'):
+                        self._es = self.connect(*self._connect_args)
+        return self._es
+
+    @property
+    def suggester(self):
+        # 有本地联想索引时在进程内完成联想，否则使用 ES 的 completion suggester
+        if self._suggester is _UNLOADED:
+            path = self.suggest_index
+            self._suggester = Suggester.load(path) if path and os.path.exists(path) else None
+        return self._suggester
+
+    @property
+    def segmenter(self):
+        # 索引记录的分词词典与本地词典一致时，短语查询和个性化词项走入库时预分词的 text_seg 字段，
+        # 否则（索引没有预分词字段、词典在建索引后变化）退回 text
+        if self._segmenter is _UNLOADED:
+            self._segmenter = self.load_segmenter()
+        return self._segmenter
+
+    def load_segmenter(self):
+        indexed = indexed_dictionary(self.es, self.index)
+        if indexed is None:
+            return None
+        if self._dictionary is _UNLOADED:
+            self._dictionary = load_segmenter(self.segment_dict)
+        if self._dictionary is None or self._dictionary.fingerprint != indexed:
+            print(f"索引 '{self.index}' 的预分词字段与分词词典 {self.segment_dict} 不一致，短语查询使用 text 字段。")
+            return None
+        return self._dictionary
+
+    @staticmethod
+    def connect(backend, es_host, embedded_index, connections=ES_CONNECTIONS):
+        """
+        选择搜索后端：backend 为 "es" 或 "embedded"，也可以直接传入实现了 ping/search/indices.get_alias 的对象；
+        为 None 时优先连接 ES，连接不上且存在嵌入式索引时退回嵌入式后端
+        """
+        if backend is not None and not isinstance(backend, str):
+            return backend
+        if backend == 'embedded':
+            from embedded import EmbeddedBackend
+            print(f"使用嵌入式索引 {embedded_index}。")
+            return EmbeddedBackend.load(embedded_index)
+        from elasticsearch import Elasticsearch
+        es = Elasticsearch([es_host], connections_per_node=connections)
+        if es.ping():
             print("成功连接到Elasticsearch。")
+            return es
+        if backend is None and embedded_index and os.path.exists(embedded_index):
+            from embedded import EmbeddedBackend
+            print(f"无法连接到Elasticsearch，改用嵌入式索引 {embedded_index}。")
+            return EmbeddedBackend.load(embedded_index)
+        print("无法连接到Elasticsearch。请检查ES_HOST配置。")
+        exit(1)
     
-    def search_phrase(self, phrase, user=None):
-        query = {
+    def phrase_query(self, phrase):
+        # 摘要总是按原文字段上的短语高亮，与实际检索的字段无关
+        highlight_query = {"match_phrase": {"text": {"query": phrase}}}
+        if self.segmenter is not None:
+            return {"query": {"match_phrase": {"text_seg": {"query": self.segmenter.segment(phrase)}}},
+                    "highlight_query": highlight_query}
+        return {
             "query": {
                 "match_phrase": {
                     "text": {
                         "query": phrase
                     }
                 }
-            }
+            },
+            "highlight_query": highlight_query
         }
-        return self.execute_query(query, user)
-    
-    def search_wildcard(self, wildcard_query, user=None):
-        query = {
-            "query": {
-                "wildcard": {
-                    "text": {
-                        "value": wildcard_query.lower(),
-                        "case_insensitive": True
-                    }
-                }
-            }
-        }
-        return self.execute_query(query, user)
+
+    def wildcard_query(self, wildcard_query):
+        _, clause = rewrite_wildcard(wildcard_query)
+        return {"query": clause,
+                "highlight_query": {"wildcard": {"text": {"value": wildcard_query.lower(), "case_insensitive": True}}}}
+
+    def search_phrase(self, phrase, user=None, page=1):
+        return self.execute_query(self.phrase_query(phrase), user, page)
     
-    def execute_query(self, query, user=None):
+    def search_wildcard(self, wildcard_query, user=None, page=1):
+        return self.execute_query(self.wildcard_query(wildcard_query), user, page)
+
+    def build_body(self, query, user=None):
         # Incorporate pagerank with function_score
         function_score_query = {
             "query": {
@@ -128,93 +238,313 @@ class SearchEngine:
                     ],
                     "boost_mode": "multiply"
                 }
-            }
+            },
+            # 只取结果需要的字段，正文和出链不随结果返回，摘要由高亮生成
+            "_source": SOURCE_FIELDS,
+            # 一次取回整个重排窗口；同一近似重复簇只保留得分最高的页面，在本地折叠（collapse 不能与 search_after 同用）
+            "size": self.rerank_window
         }
+        if "highlight_query" in query:
+            function_score_query["highlight"] = {
+                "fields": {"text": {}},
+                "highlight_query": query["highlight_query"],
+                "fragment_size": SNIPPET_SIZE,
+                "number_of_fragments": 1,
+                "no_match_size": SNIPPET_SIZE,
+                "pre_tags": [HIGHLIGHT_TAGS[0]],
+                "post_tags": [HIGHLIGHT_TAGS[1]]
+            }
         if user:
-            # Load user history to adjust scoring
-            history_terms = self.load_user_history(user)
-            if history_terms:
-                # Boost documents containing these terms
-                function_score_query["query"]["function_score"]["functions"].append({
-                    "filter": {
-                        "terms": {
-                            "text": history_terms
-                        }
-                    },
-                    "weight": 1.5
-                })
+            # 用户画像中权重最高的几个词各加一个 filter + weight 函数，查询体大小与历史记录数无关
+            function_score_query["query"]["function_score"]["functions"].extend(
+                self.profile_functions(self.load_user_history(user)))
+        return function_score_query
+    
+    def profile_functions(self, profile):
+        """
+        把 (词, 权重) 画像转成 function_score 函数：命中词的文档得分乘以 PROFILE_BOOST ** 权重，
+        权重和为 1，命中全部画像词时总共提升 PROFILE_BOOST 倍。权重取四位小数，画像不变时查询体（缓存键）不变
+        """
+        field = "text" if self.segmenter is None else "text_seg"
+        functions = []
+        for term, weight in profile:
+            words = [term] if self.segmenter is None else self.segmenter.cut(term)
+            functions.append({"filter": {"terms": {field: words}}, "weight": round(PROFILE_BOOST ** weight, 4)})
+        return functions
+
+    def execute_query(self, query, user=None, page=1):
+        with metrics.span('query'):
+            return self.page(self.build_body(query, user), page)
+
+    def page(self, body, page=1):
+        """
+        返回查询体 body 第 page 页（从 1 开始）的结果：整个重排窗口按混合得分排序后缓存，
+        翻页直接从缓存的窗口中切片。翻页时应传入同一个 body（记录历史后个性化词会变化）
+        """
+        start = (page - 1) * self.page_size
+        return self.ranked_window(body)[start:start + self.page_size]
+
+    def ranked_window(self, body):
+        # 查询体已包含用户的个性化词和窗口大小，直接作为缓存键
+        cache_key = QueryCache.make_key(body)
+        self.refresh_index_version()
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         try:
-            response = self.es.search(index=self.index, body=function_score_query, size=4)
-            hits = response['hits']['hits']
-            
-            if not hits:
-                return []
-            
-            # Extract scores and pagerank for normalization
-            scores = [hit['_score'] for hit in hits]
-            pageranks = [hit['_source'].get('pagerank', 0) for hit in hits]
-            
-            # Normalize scores and pageranks with handling of zero variance
-            normalized_scores = self.normalize_values(scores)
-            normalized_pageranks = self.normalize_values(pageranks)
-            
-            # Define weights
-            TFIDF_WEIGHT = 0.7
-            PAGERANK_WEIGHT = 0.3
-            
-            # Calculate the final score based on weighted normalization
-            results = []
-            for idx, hit in enumerate(hits):
-                source = hit['_source']
-                final_score = TFIDF_WEIGHT * normalized_scores[idx] + PAGERANK_WEIGHT * normalized_pageranks[idx]
-                results.append({
-                    'title': source.get('title', ''),
-                    'url': source.get('url', ''),
-                    'text': source.get('text', '')[:200],  # snippet
-                    'pagerank': source.get('pagerank', 0),
-                    'final_score': final_score
-                })
-            
-            # Sort results by the final_score in descending order
-            results.sort(key=lambda x: x['final_score'], reverse=True)
-            
-            return results
+            results = self.rank_hits(self.fetch_window(body))
         except Exception as e:
+            metrics.counter('search_errors_total', '查询失败次数', error=type(e).__name__).inc()
             print(f"查询时发生错误: {e}")
             return []
+        if not results:
+            metrics.counter('search_empty_results_total', '没有结果的查询数').inc()
+        self.cache.put(cache_key, results)
+        return results
+
+    def fetch_window(self, body):
+        """
+        取回按相关度排序的前 rerank_window 个结果。窗口不大时一次请求；
+        否则在 point-in-time 快照上用 search_after 分批取回，各批次看到的是同一份索引
+        """
+        with metrics.span('es'):
+            if self.rerank_window <= WINDOW_CHUNK:
+                response = self.es.search(index=self.index, body=body)
+                self.record_took(response)
+                return response['hits']['hits']
+            return self._fetch_window_pit(body)
+
+    def _fetch_window_pit(self, body):
+        pit = self.es.open_point_in_time(index=self.index, keep_alive=PIT_KEEP_ALIVE)['id']
+        hits, search_after = [], None
+        try:
+            while len(hits) < self.rerank_window:
+                size = min(WINDOW_CHUNK, self.rerank_window - len(hits))
+                page = dict(body, size=size, sort=WINDOW_SORT, pit={"id": pit, "keep_alive": PIT_KEEP_ALIVE})
+                if search_after is not None:
+                    page["search_after"] = search_after
+                response = self.es.search(body=page)
+                self.record_took(response)
+                pit = response.get('pit_id', pit)
+                batch = response['hits']['hits']
+                hits.extend(batch)
+                if len(batch) < size:
+                    break
+                search_after = batch[-1]['sort']
+        finally:
+            self.es.close_point_in_time(id=pit)
+        return hits
+
+    @staticmethod
+    def record_took(response):
+        """
+        记录服务端的查询耗时 took（毫秒），与 es 阶段的耗时对比可以区分服务端处理与网络、序列化的开销
+        """
+        took = response.get('took')
+        if took is not None:
+            metrics.histogram('es_took_seconds', 'ES 返回的服务端耗时').observe(took / 1000)
+            metrics.annotate(took_ms=took)
+
+    def rank_hits(self, hits):
+        """
+        对窗口内的全部结果计算 0.7 * 归一化得分 + 0.3 * 归一化 PageRank 并排序
+        """
+        with metrics.span('rank'):
+            return self._rank_hits(hits)
+
+    def _rank_hits(self, hits):
+        # 按相关度顺序，每个近似重复簇只保留第一个页面
+        seen, unique = set(), []
+        for hit in hits:
+            cluster = hit['_source'].get('cluster') or hit['_source'].get('url')
+            if cluster not in seen:
+                seen.add(cluster)
+                unique.append(hit)
+        hits = unique
+        if not hits:
+            return []
+        import numpy as np
+
+        scores = np.array([hit['_score'] for hit in hits], dtype=np.float64)
+        pageranks = np.array([hit['_source'].get('pagerank') or 0 for hit in hits], dtype=np.float64)
+        final_scores = (TFIDF_WEIGHT * self.normalize_values(scores)
+                        + PAGERANK_WEIGHT * self.normalize_values(pageranks))
+
+        results = []
+        for idx in np.argsort(-final_scores, kind='stable').tolist():
+            source = hits[idx]['_source']
+            highlight = hits[idx].get('highlight', {}).get('text')
+            results.append({
+                'title': source.get('title', ''),
+                'url': source.get('url', ''),
+                'text': highlight[0] if highlight else source.get('text', '')[:SNIPPET_SIZE],  # snippet
+                'pagerank': source.get('pagerank') or 0,
+                'final_score': float(final_scores[idx])
+            })
+        return results
+
+    def _plan_batch(self, requests, batch_size):
+        """
+        批量查询的准备：命中缓存的直接填入结果，其余按缓存键去重后分成若干个 _msearch 批次。
+        返回 (结果列表, 批次列表)，每个批次是 [(缓存键, 查询体, 结果下标列表)]
+        """
+        builders = {'phrase': self.phrase_query, 'wildcard': self.wildcard_query}
+        self.refresh_index_version()
+        results = [None] * len(requests)
+        pending = {}
+        for i, (query_type, text, user) in enumerate(requests):
+            if query_type not in builders:
+                raise ValueError(f"未知的查询类型: {query_type}")
+            body = self.build_body(builders[query_type](text), user)
+            cache_key = QueryCache.make_key(body)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                results[i] = cached[:self.page_size]
+            else:
+                pending.setdefault(cache_key, (body, []))[1].append(i)
+        items = [(key, body, indices) for key, (body, indices) in pending.items()]
+        return results, [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+
+    def _msearch_body(self, batch):
+        searches = []
+        for _, body, _ in batch:
+            searches.append({"index": self.index})
+            searches.append(body)
+        return searches
+
+    def _fill_batch(self, batch, response, results):
+        """
+        把一个 _msearch 响应中的各个结果做与 execute_query 相同的处理，写回对应的下标
+        """
+        responses = response['responses'] if response is not None else [None] * len(batch)
+        for (cache_key, _, indices), item in zip(batch, responses):
+            if item is None:
+                ranked = []
+            elif 'error' in item:
+                metrics.counter('search_errors_total', '查询失败次数', error='msearch_item').inc()
+                print(f"查询时发生错误: {item['error']}")
+                ranked = []
+            else:
+                self.record_took(item)
+                ranked = self.rank_hits(item['hits']['hits'])
+                if not ranked:
+                    metrics.counter('search_empty_results_total', '没有结果的查询数').inc()
+                self.cache.put(cache_key, ranked)
+            for i in indices:
+                results[i] = ranked[:self.page_size]
+
+    def search_batch(self, requests, batch_size=MSEARCH_BATCH_SIZE):
+        """
+        批量执行 (查询类型, 文本, 用户) 请求，类型为 "phrase" 或 "wildcard"，用户可以为 None。
+        每 batch_size 个查询合并为一次 _msearch 请求（每个查询一次取回整个重排窗口），
+        按输入顺序返回各自第一页的结果
+        """
+        results, batches = self._plan_batch(requests, batch_size)
+        for batch in batches:
+            try:
+                with metrics.span('msearch'):
+                    response = self.es.msearch(searches=self._msearch_body(batch))
+            except Exception as e:
+                metrics.counter('search_errors_total', '查询失败次数', error=type(e).__name__).inc()
+                print(f"批量查询时发生错误: {e}")
+                response = None
+            self._fill_batch(batch, response, results)
+        return results
+
+    async def search_batch_async(self, requests, batch_size=MSEARCH_BATCH_SIZE, concurrency=ASYNC_CONCURRENCY):
+        """
+        search_batch 的异步版本：各 _msearch 批次通过连接池并发发送，最多 concurrency 个请求同时在途。
+        batch_size=1 时即逐条查询并发执行。嵌入式后端在线程中执行
+        """
+        import asyncio
+        from elasticsearch import AsyncElasticsearch, Elasticsearch
+        results, batches = self._plan_batch(requests, batch_size)
+        semaphore = asyncio.Semaphore(concurrency)
+        client = None
+        if isinstance(self.es, Elasticsearch):
+            client = AsyncElasticsearch([self.es_host], connections_per_node=concurrency)
+
+        async def run(batch):
+            async with semaphore:
+                # 多个协程在同一线程中交替执行，不能使用按线程记录的 span，直接记录耗时
+                start = time.perf_counter()
+                try:
+                    if client is not None:
+                        response = await client.msearch(searches=self._msearch_body(batch))
+                    else:
+                        response = await asyncio.to_thread(self.es.msearch, searches=self._msearch_body(batch))
+                except Exception as e:
+                    metrics.counter('search_errors_total', '查询失败次数', error=type(e).__name__).inc()
+                    print(f"批量查询时发生错误: {e}")
+                    response = None
+                metrics.histogram('stage_duration_seconds', '各阶段耗时', stage='msearch').observe(
+                    time.perf_counter() - start)
+            self._fill_batch(batch, response, results)
+
+        try:
+            await asyncio.gather(*(run(batch) for batch in batches))
+        finally:
+            if client is not None:
+                await client.close()
+        return results
     
+    def refresh_index_version(self):
+        """
+        定期检查别名指向的索引，重建索引后自动清空查询缓存
+        """
+        now = time.monotonic()
+        if now - self._version_checked < VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked = now
+        try:
+            version = ','.join(sorted(self.es.indices.get_alias(name=self.index)))
+        except Exception:
+            version = self.index
+        if self._index_version is not None and version != self._index_version:
+            # 别名切换到新索引后重新检查它的分词词典
+            self._segmenter = _UNLOADED
+        self._index_version = version
+        self.cache.set_version(version)
+
+    def prewarm_cache(self, limit=PREWARM_QUERIES):
+        """
+        用历史记录中最常见的查询预热缓存
+        """
+        queries = self.history.top_queries(limit)
+        self.search_batch([('wildcard' if '*' in query or '?' in query else 'phrase', query, None)
+                           for query in queries])
+        return len(queries)
+
     def normalize_values(self, values):
-        min_val = min(values)
-        max_val = max(values)
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        min_val = values.min()
+        max_val = values.max()
         if max_val == min_val:
             # Avoid division by zero; assign all normalized values as 1
-            return [1.0 for _ in values]
-        else:
-            # Shift normalization to avoid zero: map min to 0.1 and max to 1.0
-            return [0.1 + 0.9 * (v - min_val) / (max_val - min_val) for v in values]
-    
-    def load_user_history(self, user, history_file='history.txt'):
-        # Read history.txt and extract terms from user's previous queries
-        # Assuming history.txt stores lines in format: timestamp | username | query | title | url | snippet
-        terms = []
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    parts = line.strip().split('|')
-                    if len(parts) >=3 and parts[1].strip() == user:
-                        query = parts[2].strip()
-                        terms += query.split()
-        return list(set(terms))
-    
-    def log_query(self, user, query, results, history_file='history.txt'):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(history_file, 'a', encoding='utf-8') as f:
-            f.write(f"{timestamp} | {user} | {query}\n")
-            for res in results:
-                snippet = res['text'].replace('\n', ' ').replace('\r', ' ')[:100]
-                f.write(f"{timestamp} | {user} | {res['title']} | {res['url']} | {snippet}\n")
+            return np.ones_like(values)
+        # Shift normalization to avoid zero: map min to 0.1 and max to 1.0
+        return 0.1 + 0.9 * (values - min_val) / (max_val - min_val)
     
+    def load_user_history(self, user):
+        # 该用户画像中权重最高的 (词, 权重)，记录查询时增量更新（已缓存在内存中）
+        with metrics.span('history'):
+            return self.history.user_profile(user)
+
+    def log_query(self, user, query, results):
+        with metrics.span('log_query'):
+            self.history.log_query(user, query, results)
+
     def wildcard_suggest(self, prefix):
+        # 空前缀或只有空白的前缀没有建议，不发出查询
+        if not prefix or not prefix.strip():
+            return []
+        with metrics.span('suggest'):
+            if self.suggester is not None:
+                return self.suggester.suggest(prefix, k=5, fuzzy=True)
+            return self.es_suggest(prefix)
+
+    def es_suggest(self, prefix):
         # 使用 Elasticsearch 的 completion suggester
         suggest = {
             "suggest": {
@@ -241,12 +571,12 @@ class SearchEngine:
             print(f"获取建议时发生错误: {e}")
             return []
 
-def display_results(results):
+def display_results(results, start=1):
     if not results:
         print("没有找到匹配的文档。")
         return
     print("\n===== 搜索结果 =====")
-    for idx, res in enumerate(results, start=1):
+    for idx, res in enumerate(results, start=start):
         print(f"\nRank {idx}:")
         print(f"Title: {res['title']}")
         print(f"URL: {res['url']}")
@@ -255,13 +585,34 @@ def display_results(results):
         print(f"Snippet: {res['text']}...")
     print("======================")
 
+def browse_pages(search, results, page_size=RESULT_SIZE):
+    """
+    显示第一页结果，之后按 n 翻页（后续页从缓存的重排窗口中取出）
+    """
+    display_results(results)
+    page = 1
+    while len(results) == page_size:
+        if input("输入 n 查看下一页，直接回车返回: ").strip().lower() != 'n':
+            break
+        page += 1
+        results = search(page)
+        if not results:
+            print("没有更多结果了。")
+            break
+        display_results(results, start=(page - 1) * page_size + 1)
+
+
 def main():
     # 配置Elasticsearch主机和索引名称
     ES_HOST = 'http://localhost:9200'   # 替换为你的Elasticsearch主机地址
-    INDEX_NAME = 'xxjs'                  # 替换为你的Elasticsearch索引名称
+    INDEX_NAME = 'xxjs'                  # 替换为你的Elasticsearch索引别名
+    BACKEND = None                       # "es"、"embedded"，None 表示 ES 不可用时自动使用嵌入式索引
+    SLOW_QUERY_LOG = 'slow_queries.jsonl'  # 超过 metrics.SLOW_QUERY_SECONDS 的查询及各阶段耗时
     
+    metrics.configure(slow_query_log=SLOW_QUERY_LOG)
     user_system = User()
-    search_engine = SearchEngine(es_host=ES_HOST, index_name=INDEX_NAME)
+    search_engine = SearchEngine(es_host=ES_HOST, index_name=INDEX_NAME, backend=BACKEND)
+    search_engine.prewarm_cache()
     
     print("\n===== 欢迎使用南开大学搜索引擎 =====")
     while True:
@@ -291,17 +642,23 @@ def main():
                         if not phrase:
                             print("查询不能为空。")
                             continue
-                        results = search_engine.search_phrase(phrase, user=user_system.current_user)
-                        display_results(results)
-                        search_engine.log_query(user_system.current_user, phrase, results)
+                        with metrics.span('query'):
+                            metrics.annotate(query=phrase, type='phrase')
+                            body = search_engine.build_body(search_engine.phrase_query(phrase), user_system.current_user)
+                            results = search_engine.page(body)
+                            search_engine.log_query(user_system.current_user, phrase, results)
+                        browse_pages(lambda page: search_engine.page(body, page), results, search_engine.page_size)
                     elif sub_choice == '2':
                         wildcard = input("请输入通配符查询: ").strip()
                         if not wildcard:
                             print("查询不能为空。")
                             continue
-                        results = search_engine.search_wildcard(wildcard, user=user_system.current_user)
-                        display_results(results)
-                        search_engine.log_query(user_system.current_user, wildcard, results)
+                        with metrics.span('query'):
+                            metrics.annotate(query=wildcard, type='wildcard')
+                            body = search_engine.build_body(search_engine.wildcard_query(wildcard), user_system.current_user)
+                            results = search_engine.page(body)
+                            search_engine.log_query(user_system.current_user, wildcard, results)
+                        browse_pages(lambda page: search_engine.page(body, page), results, search_engine.page_size)
                     elif sub_choice == '3':
                         prefix = input("请输入查询前缀：").strip()
                         if not prefix:
@@ -317,22 +674,12 @@ def main():
                             print("没有找到相关的建议。")
                     elif sub_choice == '4':
                         print("\n===== 查询历史 =====")
-                        history_file='history.txt'
-                        if not os.path.exists(history_file):
+                        user_history = search_engine.history.user_queries(user_system.current_user)
+                        if not user_history:
                             print("查询历史为空。")
                         else:
-                            with open(history_file, 'r', encoding='utf-8') as f:
-                                lines = f.readlines()
-                            user_history = [line.strip() for line in lines if len(line.strip().split('|'))>=3 and line.strip().split('|')[1].strip() == user_system.current_user]
-                            if not user_history:
-                                print("查询历史为空。")
-                            else:
-                                for entry in user_history:
-                                    parts = entry.split('|')
-                                    if len(parts) >=3:
-                                        timestamp, user, query = parts[:3]
-                                        if query.strip():
-                                            print(f"{timestamp} | {query.strip()}")
+                            for timestamp, query in user_history:
+                                print(f"{timestamp} | {query}")
                     elif sub_choice == '5':
                         user_system.logout()
                         break
@@ -346,5 +693,154 @@ def main():
         else:
             print("无效的选择，请重新输入。")
 
+def parse_query_line(line, default_type='phrase'):
+    """
+    标准输入中的一行查询："类型<TAB>查询"，或只有查询（使用默认类型）
+    """
+    query_type, sep, text = line.rstrip('\r\n').partition('\t')
+    if sep and query_type in QUERY_TYPES:
+        return query_type, text.strip()
+    return default_type, line.strip()
+
+
+class LocalRunner:
+    """
+    在当前进程中查询；指定用户时按其历史个性化排序，并把第一页的查询记入历史
+    """
+
+    def __init__(self, engine, user=None):
+        self.engine = engine
+        self.user = user
+
+    def run(self, query_type, text, page=1):
+        if query_type == 'suggest':
+            return {'prefix': text, 'suggestions': self.engine.wildcard_suggest(text)}
+        builder = self.engine.phrase_query if query_type == 'phrase' else self.engine.wildcard_query
+        with metrics.span('query'):
+            metrics.annotate(query=text, type=query_type, page=page)
+            body = self.engine.build_body(builder(text), self.user)
+            results = self.engine.page(body, page)
+            if self.user and page == 1:
+                self.engine.log_query(self.user, text, results)
+        return {'query': text, 'type': query_type, 'page': page, 'results': results}
+
+
+class RemoteRunner:
+    """
+    通过正在运行的 server.py 查询（已加载索引、缓存是热的），所有查询复用同一个 keep-alive 连接
+    """
+
+    def __init__(self, url, token=None, timeout=SERVER_TIMEOUT):
+        from http.client import HTTPConnection
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        self.url = url
+        self.connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    @classmethod
+    def probe(cls, url, token=None, timeout=SERVER_PROBE_TIMEOUT):
+        """
+        服务在运行时返回连接好的 RemoteRunner，否则返回 None
+        """
+        runner = cls(url, token, timeout)
+        try:
+            status, _ = runner.get('/health', {})
+        except (OSError, ValueError):
+            runner.connection.close()
+            return None
+        if status != 200:
+            runner.connection.close()
+            return None
+        runner.connection.timeout = SERVER_TIMEOUT
+        if runner.connection.sock is not None:
+            runner.connection.sock.settimeout(SERVER_TIMEOUT)
+        return runner
+
+    def get(self, path, params):
+        from urllib.parse import urlencode
+        self.connection.request('GET', f"{path}?{urlencode(params)}", headers=self.headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def run(self, query_type, text, page=1):
+        if query_type == 'suggest':
+            status, payload = self.get('/suggest', {'prefix': text})
+        else:
+            status, payload = self.get('/search', {'q': text, 'type': query_type, 'page': page})
+        if status != 200:
+            raise ValueError(payload.get('error') or f'HTTP {status}')
+        return payload
+
+
+def run_queries(runner, queries, page=1, out=None):
+    """
+    逐条执行 (类型, 查询)，每条结果立即以一行 JSON 写出；单条查询出错时写出 error 字段并继续
+    """
+    out = out or sys.stdout
+    count = 0
+    for query_type, text in queries:
+        if not text:
+            continue
+        try:
+            result = runner.run(query_type, text, page)
+        except Exception as e:
+            key = 'prefix' if query_type == 'suggest' else 'query'
+            result = {key: text, 'type': query_type, 'error': str(e)}
+        out.write(json.dumps(result, ensure_ascii=False) + '\n')
+        out.flush()
+        count += 1
+    return count
+
+
+def batch_main(argv=None):
+    parser = argparse.ArgumentParser(description="命令行查询：查询来自参数或标准输入（每行 \"类型<TAB>查询\" 或只有查询），"
+                                                 "结果逐行输出为 JSON lines。不带参数且在终端中运行时进入交互菜单")
+    parser.add_argument("queries", nargs="*", help="查询；为空时从标准输入读取")
+    parser.add_argument("--type", choices=QUERY_TYPES, default='phrase', help="没有指定类型的查询使用的类型")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--user", help="在本进程中按该用户的历史个性化排序并记录历史（不使用服务）")
+    parser.add_argument("--server", default='auto',
+                        help=f"auto（默认）：{SEARCH_SERVER} 在运行时通过它查询；none：总在本进程中查询；或服务地址")
+    parser.add_argument("--token", help="通过服务查询时使用的登录令牌")
+    parser.add_argument("--es-host", default='http://localhost:9200')
+    parser.add_argument("--index", default='xxjs')
+    parser.add_argument("--backend", choices=['es', 'embedded'], help="默认优先 ES，连接不上时使用嵌入式索引")
+    parser.add_argument("--embedded-index", default=EMBEDDED_INDEX)
+    parser.add_argument("--metrics", help="结束时把各阶段耗时等指标写入该文件（.prom 为 Prometheus 格式，否则为 JSON lines）")
+    args = parser.parse_args(argv)
+    if args.page < 1:
+        parser.error("--page 从 1 开始")
+
+    if args.queries:
+        queries = ((args.type, query.strip()) for query in args.queries)
+    else:
+        queries = (parse_query_line(line, args.type) for line in sys.stdin)
+
+    runner = None
+    if args.server != 'none' and args.user is None:
+        url = SEARCH_SERVER if args.server == 'auto' else args.server
+        runner = RemoteRunner.probe(url, args.token)
+        if runner is None and args.server != 'auto':
+            parser.error(f"无法连接到搜索服务 {url}")
+
+    # 连接信息和错误提示写到标准错误，标准输出只有结果
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        if runner is None:
+            engine = SearchEngine(es_host=args.es_host, index_name=args.index, backend=args.backend,
+                                  embedded_index=args.embedded_index)
+            runner = LocalRunner(engine, args.user)
+        else:
+            print(f"使用搜索服务 {runner.url}。")
+        run_queries(runner, queries, args.page, out)
+        if args.metrics:
+            metrics.REGISTRY.dump(args.metrics)
+            print(metrics.REGISTRY.report())
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) == 1 and sys.stdin.isatty():
+        main()
+    else:
+        batch_main()
@@ -0,0 +1,242 @@
+# 基于词典的中文分词：对每段连续汉字构建候选词 DAG，动态规划求词频概率最大的切分。
+# 词典可以从语料中统计得到（高频且内部凝固度高的 n-gram），也可以合并外部词典
+# （每行 "词 词频"，与 jieba 的 dict.txt 格式兼容）。
+import argparse
+import hashlib
+import math
+import os
+import re
+import time
+
+SEGMENT_DICT = 'segdict.txt'   # 分词词典
+SEGMENT_META = 'segment_dict'  # 索引 _meta 中记录分词词典指纹的键
+MAX_WORD_LENGTH = 4            # 从语料中学习的最长词长
+MIN_FREQ = 5                   # 学习词典时 n-gram 的最低出现次数
+MIN_COHESION = 2.0             # 最低凝固度：log(p(词) / max(p(左半) * p(右半)))
+MAX_DOMINANCE = 0.9            # 几乎总是作为更长词一部分出现的片段（如 "南开大"）不作为词
+SAMPLE_PAGES = 5000            # 学习词典时最多读取的页面数（标题全部读取）
+
+HAN = re.compile(r'[\u4e00-\u9fff]+')
+TOKENS = re.compile(r'[\u4e00-\u9fff]+|[a-z0-9]+(?:[._-][a-z0-9]+)*')
+
+
+class Segmenter:
+    """
+    最大概率切分：词的概率为 词频 / 总词频，不在词典中的单字按词频 1 计算
+    """
+
+    def __init__(self, freqs):
+        self.freqs = freqs
+        self.total = sum(freqs.values()) or 1
+        log_total = math.log(self.total)
+        self.unknown = -log_total
+        self.logp = {word: math.log(freq) - log_total for word, freq in freqs.items() if freq > 0}
+        # 所有词的前缀，不是任何词前缀的片段不必再向后延伸
+        self.prefixes = {word[:k] for word in self.logp for k in range(1, len(word))}
+        self._cache = {}
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self.freqs)
+
+    @classmethod
+    def load(cls, path=SEGMENT_DICT):
+        freqs = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    freqs[parts[0]] = freqs.get(parts[0], 0) + int(parts[1])
+        return cls(freqs)
+
+    @property
+    def fingerprint(self):
+        """
+        词典内容的指纹：建索引时写入 _meta，查询时与本地词典比较，不一致说明两边的切分不同
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for word, freq in sorted(self.freqs.items()):
+                digest.update(f"{word} {freq}\n".encode('utf-8'))
+            self._fingerprint = digest.hexdigest()[:16]
+        return self._fingerprint
+
+    def save(self, path=SEGMENT_DICT):
+        with open(path, 'w', encoding='utf-8') as f:
+            for word, freq in sorted(self.freqs.items(), key=lambda item: -item[1]):
+                f.write(f"{word} {freq}\n")
+
+    def _cut_han(self, text):
+        n = len(text)
+        logp, prefixes, unknown = self.logp, self.prefixes, self.unknown
+        # score[i] 为从 i 开始到结尾的最大对数概率，end[i] 为其第一个词的结束位置
+        score = [0.0] * (n + 1)
+        end = [n] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            char = text[i]
+            best, best_end = logp.get(char, unknown) + score[i + 1], i + 1
+            j = i + 1
+            fragment = char
+            while fragment in prefixes and j < n:
+                j += 1
+                fragment = text[i:j]
+                p = logp.get(fragment)
+                if p is not None and p + score[j] > best:
+                    best, best_end = p + score[j], j
+            score[i], end[i] = best, best_end
+        words, i = [], 0
+        while i < n:
+            j = end[i]
+            words.append(text[i:j])
+            i = j
+        return words
+
+    def cut(self, text):
+        """
+        返回词列表：汉字按词典切分，字母数字串整体作为一个词（转为小写），其余字符丢弃
+        """
+        words = []
+        for token in TOKENS.findall(text.lower()):
+            if HAN.match(token):
+                cached = self._cache.get(token)
+                if cached is None:
+                    cached = self._cut_han(token)
+                    if len(token) <= 16 and len(self._cache) < 100000:
+                        self._cache[token] = cached
+                words.extend(cached)
+            else:
+                words.append(token)
+        return words
+
+    def segment(self, text):
+        """
+        以空格连接的分词结果，写入索引的预分词字段
+        """
+        return ' '.join(self.cut(text))
+
+
+def ngram_counts(texts, max_length=MAX_WORD_LENGTH):
+    """
+    向量化统计汉字 1..max_length-gram：每个汉字占 16 位，n 个字拼成一个 64 位整数后用 np.unique 计数
+    """
+    # numpy 只在学习词典时需要，查询进程只加载词典
+    import numpy as np
+    codes = np.frombuffer('\0'.join(texts).encode('utf-16-le'), dtype=np.uint16)
+    han = (codes >= 0x4e00) & (codes <= 0x9fff)
+    counts = []
+    for n in range(1, max_length + 1):
+        m = len(codes) - n + 1
+        if m <= 0:
+            counts.append({})
+            continue
+        valid = han[:m].copy()
+        keys = codes[:m].astype(np.uint64)
+        for j in range(1, n):
+            valid &= han[j:j + m]
+            keys = (keys << np.uint64(16)) | codes[j:j + m]
+        keys, freqs = np.unique(keys[valid], return_counts=True)
+        chars = np.empty((len(keys), n), dtype=np.uint16)
+        for j in range(n):
+            chars[:, j] = keys >> np.uint64(16 * (n - 1 - j))
+        grams = chars.tobytes().decode('utf-16-le')
+        counts.append({grams[i * n:(i + 1) * n]: int(freq) for i, freq in enumerate(freqs.tolist())})
+    return counts
+
+
+def learn_dictionary(texts, max_length=MAX_WORD_LENGTH, min_freq=MIN_FREQ, min_cohesion=MIN_COHESION):
+    """
+    统计汉字 n-gram，保留出现次数够多且凝固度够高的作为词，单字全部保留
+    """
+    counts = [None] + ngram_counts(texts, max_length)
+
+    # 每个 n-gram 作为更长 n-gram 的前缀或后缀时，最常见的那个扩展的出现次数
+    extended = {}
+    for n in range(3, max_length + 1):
+        for gram, count in counts[n].items():
+            for part in (gram[:-1], gram[1:]):
+                if count > extended.get(part, 0):
+                    extended[part] = count
+
+    freqs = dict(counts[1])
+    totals = [0] + [sum(bucket.values()) or 1 for bucket in counts[1:]]
+    unigram = counts[1]
+    for n in range(2, max_length + 1):
+        for gram, count in counts[n].items():
+            if count < min_freq or extended.get(gram, 0) >= MAX_DOMINANCE * count:
+                continue
+            p = count / totals[n]
+            # 任意一种二分切法的概率乘积都远小于整体概率，说明这几个字经常一起出现
+            best_split = 0.0
+            for k in range(1, n):
+                left, right = gram[:k], gram[k:]
+                p_left = (counts[k].get(left) or unigram.get(left, 1)) / totals[k]
+                p_right = (counts[n - k].get(right) or unigram.get(right, 1)) / totals[n - k]
+                best_split = max(best_split, p_left * p_right)
+            if math.log(p / best_split) >= min_cohesion:
+                freqs[gram] = count
+    return freqs
+
+
+def corpus_texts(csv_file_path, sample_pages=SAMPLE_PAGES):
+    from corpus import read_records
+    for i, row in enumerate(read_records(csv_file_path, ('title', 'text'))):
+        yield row.get('title') or ''
+        if i < sample_pages:
+            yield row.get('text') or ''
+
+
+def segment_stage(segmenter):
+    """
+    为标题和正文生成以空格分隔的预分词字段 title_seg、text_seg
+    """
+    def stage(records):
+        for row in records:
+            row['title_seg'] = segmenter.segment(row.get('title') or '')
+            row['text_seg'] = segmenter.segment(row.get('text') or '')
+            yield row
+    return stage
+
+
+def load_segmenter(path=SEGMENT_DICT):
+    return Segmenter.load(path) if path and os.path.exists(path) else None
+
+
+def indexed_dictionary(es, index):
+    """
+    索引（或别名指向的索引）_meta 中记录的分词词典指纹，没有预分词字段或读取失败时返回 None
+    """
+    try:
+        mappings = es.indices.get_mapping(index=index)
+    except Exception:
+        return None
+    for info in mappings.values():
+        return ((info.get('mappings') or {}).get('_meta') or {}).get(SEGMENT_META)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="中文分词词典")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="从语料中学习分词词典")
+    build_parser.add_argument("csv_file_path", nargs="?", default="finaloutput.csv")
+    build_parser.add_argument("--extra", nargs="*", default=[], help="合并的外部词典（每行 \"词 词频\"）")
+    build_parser.add_argument("--output", default=SEGMENT_DICT)
+    build_parser.add_argument("--sample", type=int, default=SAMPLE_PAGES, help="读取正文的页面数")
+
+    cut_parser = subparsers.add_parser("cut", help="对文本分词")
+    cut_parser.add_argument("text")
+    cut_parser.add_argument("--dict", default=SEGMENT_DICT)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        start = time.perf_counter()
+        freqs = learn_dictionary(corpus_texts(args.csv_file_path, args.sample))
+        for path in args.extra:
+            for word, freq in Segmenter.load(path).freqs.items():
+                freqs[word] = freqs.get(word, 0) + freq
+        segmenter = Segmenter(freqs)
+        segmenter.save(args.output)
+        print(f"词典已保存到 {args.output}：{len(segmenter)} 个词，用时 {time.perf_counter() - start:.2f}s")
+    elif args.command == "cut":
+        print(" / ".join(Segmenter.load(args.dict).cut(args.text)))
@@ -0,0 +1,262 @@
+# HTTP 搜索服务：一个进程内的所有请求共用同一个 SearchEngine（共享连接池、查询缓存和联想索引），
+# 用户通过登录令牌区分，不再依赖进程内的 current_user。
+#
+#   POST /register  {"username", "password"}     注册
+#   POST /login     {"username", "password"}     登录，返回 {"token"}
+#   POST /logout                                 注销令牌
+#   GET  /search?q=...&type=phrase|wildcard&page=1   查询，携带令牌时个性化排序并记录历史
+#   GET  /suggest?prefix=...                     联想建议
+#   GET  /history?limit=...                      当前用户的查询历史
+#   GET  /health                                 服务状态与缓存统计
+#   GET  /metrics?format=prometheus|json         各阶段耗时直方图与计数器（Prometheus 文本或 JSON lines）
+#   GET  /slow                                   最近的慢请求及其各阶段耗时
+#
+# 令牌通过请求头 "Authorization: Bearer <token>" 传递。
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from search import ES_CONNECTIONS, SearchEngine
+from users import SESSION_TTL, USERS_DB, USERS_FILE, SessionStore, UserStore
+
+HOST = '127.0.0.1'
+PORT = 8000
+MAX_BODY = 64 * 1024         # 请求体大小上限
+MAX_PAGED_QUERIES = 10000    # 记录第一页查询体的查询数，供翻页复用
+
+
+class SearchService:
+    """
+    与传输层无关的服务逻辑：每个方法返回 (HTTP 状态码, JSON 对象)
+    """
+
+    def __init__(self, engine, users, sessions):
+        self.engine = engine
+        self.users = users
+        self.sessions = sessions
+        self.started = time.time()
+        self.requests = 0
+        self._bodies = OrderedDict()   # (用户, 查询类型, 查询) -> 第一页的查询体
+        self._lock = threading.Lock()
+
+    def register(self, body):
+        username = str(body.get('username') or '').strip()
+        password = str(body.get('password') or '')
+        if not username or not password:
+            return 400, {'error': '用户名和密码不能为空'}
+        if not self.users.add(username, password):
+            return 409, {'error': '用户名已存在'}
+        return 201, {'username': username}
+
+    def login(self, body):
+        username = str(body.get('username') or '').strip()
+        if not self.users.verify(username, str(body.get('password') or '')):
+            return 401, {'error': '用户名或密码错误'}
+        return 200, {'token': self.sessions.create(username), 'ttl': self.sessions.ttl}
+
+    def logout(self, token):
+        if not self.sessions.remove(token):
+            return 401, {'error': '未登录'}
+        return 200, {}
+
+    def search(self, params, token):
+        query = params.get('q', '').strip()
+        query_type = params.get('type', 'phrase')
+        if not query:
+            return 400, {'error': '查询不能为空'}
+        if query_type not in ('phrase', 'wildcard'):
+            return 400, {'error': f'未知的查询类型: {query_type}'}
+        try:
+            page = int(params.get('page') or 1)
+        except ValueError:
+            return 400, {'error': 'page 必须是整数'}
+        if page < 1:
+            return 400, {'error': 'page 从 1 开始'}
+        user = self.sessions.user(token)
+        metrics.annotate(query=query, type=query_type, page=page)
+        key = (user, query_type, query)
+        with self._lock:
+            body = self._bodies.get(key) if page > 1 else None
+        if body is None:
+            builder = self.engine.phrase_query if query_type == 'phrase' else self.engine.wildcard_query
+            body = self.engine.build_body(builder(query), user)
+        results = self.engine.page(body, page)
+        metrics.counter('search_requests_total', '查询请求数', type=query_type).inc()
+        if page == 1:
+            # 记录历史会改变个性化词，翻页时沿用第一页的查询体，直接命中缓存的重排窗口
+            with self._lock:
+                self._bodies[key] = body
+                self._bodies.move_to_end(key)
+                if len(self._bodies) > MAX_PAGED_QUERIES:
+                    self._bodies.popitem(last=False)
+            if user:
+                self.engine.log_query(user, query, results)
+        return 200, {'query': query, 'type': query_type, 'page': page, 'results': results}
+
+    def suggest(self, params):
+        prefix = params.get('prefix', '').strip()
+        if not prefix:
+            return 400, {'error': '前缀不能为空'}
+        return 200, {'prefix': prefix, 'suggestions': self.engine.wildcard_suggest(prefix)}
+
+    def history(self, params, token):
+        user = self.sessions.user(token)
+        if user is None:
+            return 401, {'error': '未登录'}
+        try:
+            limit = int(params.get('limit') or 0) or None
+        except ValueError:
+            return 400, {'error': 'limit 必须是整数'}
+        rows = self.engine.history.user_queries(user, limit)
+        return 200, {'user': user, 'history': [{'timestamp': ts, 'query': query} for ts, query in rows]}
+
+    def health(self):
+        return 200, {'status': 'ok', 'backend': type(self.engine.es).__name__, 'uptime': time.time() - self.started,
+                     'requests': self.requests, 'sessions': len(self.sessions), 'cache': self.engine.cache.stats()}
+
+    def metrics(self, params):
+        """
+        返回 (Content-Type, 文本)
+        """
+        for name, value in self.engine.cache.stats().items():
+            if isinstance(value, (int, float)):
+                metrics.gauge(f'query_cache_{name}', '查询缓存统计').set(value)
+        metrics.gauge('sessions', '有效的登录令牌数').set(len(self.sessions))
+        if params.get('format') == 'json':
+            return 'application/x-ndjson; charset=utf-8', metrics.REGISTRY.json_lines()
+        return 'text/plain; version=0.0.4; charset=utf-8', metrics.REGISTRY.prometheus()
+
+    def slow(self):
+        return 200, {'threshold': metrics.REGISTRY.slow_query_seconds, 'requests': list(metrics.REGISTRY.slow_queries)}
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        # 保持连接，客户端可以在一个连接上连续发送请求；响应头和响应体分两次写出，关闭 Nagle 避免等待 ACK
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, payload, content_type='application/json; charset=utf-8'):
+            body = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _token(self):
+            auth = self.headers.get('Authorization', '')
+            return auth[7:].strip() if auth.startswith('Bearer ') else None
+
+        def _json_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY:
+                raise ValueError('请求体过大')
+            raw = self.rfile.read(length) if length else b''
+            body = json.loads(raw) if raw else {}
+            if not isinstance(body, dict):
+                raise ValueError('请求体必须是 JSON 对象')
+            return body
+
+        def _dispatch(self, route, endpoint):
+            service.count()
+            with metrics.span('request', endpoint=endpoint):
+                try:
+                    status, payload = route()
+                except (ValueError, UnicodeDecodeError) as e:
+                    status, payload = 400, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f'服务器内部错误: {e}'}
+                metrics.counter('http_responses_total', 'HTTP 响应数', endpoint=endpoint, status=status).inc()
+            self._reply(status, payload)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            routes = {
+                '/search': lambda: service.search(params, self._token()),
+                '/suggest': lambda: service.suggest(params),
+                '/history': lambda: service.history(params, self._token()),
+                '/health': service.health,
+                '/slow': service.slow,
+            }
+            if url.path == '/metrics':
+                service.count()
+                content_type, text = service.metrics(params)
+                self._reply(200, text, content_type)
+                return
+            route = routes.get(url.path)
+            if route is None:
+                self._dispatch(lambda: (404, {'error': '未知的接口'}), 'unknown')
+            else:
+                self._dispatch(route, url.path.lstrip('/'))
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            routes = {
+                '/register': lambda: service.register(self._json_body()),
+                '/login': lambda: service.login(self._json_body()),
+                '/logout': lambda: service.logout(self._token()),
+            }
+            route = routes.get(path)
+            if route is None:
+                # 未读取的请求体会被当作下一个请求，直接关闭连接
+                self.close_connection = True
+                self._dispatch(lambda: (404, {'error': '未知的接口'}), 'unknown')
+            else:
+                self._dispatch(route, path.lstrip('/'))
+
+    return Handler
+
+
+class SearchHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(service, host=HOST, port=PORT):
+    return SearchHTTPServer((host, port), make_handler(service))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP 搜索服务")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--es-host", default='http://localhost:9200')
+    parser.add_argument("--index", default='xxjs')
+    parser.add_argument("--backend", choices=['es', 'embedded'], help="默认优先 ES，连接不上时使用嵌入式索引")
+    parser.add_argument("--connections", type=int, default=ES_CONNECTIONS, help="到 ES 的连接池大小")
+    parser.add_argument("--users-db", default=USERS_DB)
+    parser.add_argument("--session-ttl", type=int, default=SESSION_TTL, help="登录令牌有效期（秒）")
+    parser.add_argument("--slow-query-seconds", type=float, default=metrics.SLOW_QUERY_SECONDS,
+                        help="超过该耗时的请求记录各阶段耗时")
+    parser.add_argument("--slow-query-log", help="慢请求同时追加写入该文件（JSON lines）")
+    parser.add_argument("--profile-interval", type=float, default=metrics.PROFILE_INTERVAL,
+                        help="对请求采样调用栈的间隔（秒），慢请求中附带出现最多的调用栈")
+    args = parser.parse_args()
+
+    metrics.configure(args.slow_query_seconds, args.slow_query_log, args.profile_interval)
+
+    engine = SearchEngine(es_host=args.es_host, index_name=args.index, backend=args.backend,
+                          connections=args.connections)
+    engine.prewarm_cache()
+    service = SearchService(engine, UserStore(args.users_db, USERS_FILE), SessionStore(args.session_ttl))
+    server = make_server(service, args.host, args.port)
+    print(f"搜索服务运行在 http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+        server.server_close()
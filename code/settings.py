@@ -27,25 +27,49 @@ AUTOTHROTTLE_DEBUG = False  # 开启调试模式
 # 输出编码和 CSV 文件格式
 FEED_EXPORT_ENCODING = "utf-8-sig"
 
-# 数据存储位置 (CSV 格式)
-FEEDS = {
-    "output.csv": {
-        "format": "csv",
-        "encoding": "utf-8-sig",
-        "fields": ["title", "url", "text", "linksurl"],
-    }
+# 数据存储位置 (CSV 格式)，由 BufferedCsvPipeline 攒批写入
+CSV_OUTPUT_FILE = "nku_output.csv"
+CSV_BUFFER_SIZE = 1000  # 每攒够多少条记录写一次文件
+
+ITEM_PIPELINES = {
+    "nk_search.pipelines.BufferedCsvPipeline": 300,
 }
 
+# 按规范化 URL 去重（忽略 http/https、末尾斜杠、片段和 index.htm）。
+# 指定 JOBDIR（scrapy crawl nku -s JOBDIR=crawls/nku）时布隆过滤器与请求队列一起保存在其中，
+# 中断后用同一 JOBDIR 重新运行即继续爬取并追加到输出文件；不指定时每次都是完整爬取
+DUPEFILTER_CLASS = "nk_search.dupefilter.BloomDupeFilter"
+SEEN_FILTER_FILE = "seen_urls.bloom"
+SEEN_FILTER_SAVE_SECONDS = 60   # 运行期间保存过滤器的间隔（秒）
+SEEN_FILTER_CAPACITY = 2000000  # 预计的 URL 数
+SEEN_FILTER_ERROR_RATE = 0.001  # 可接受的误判率
+
+# 增量爬取（scrapy crawl nku -s INCREMENTAL_CRAWL=1）：按 CRAWL_STATE_DB 中记录的
+# ETag/Last-Modified 发送条件请求，304 和内容指纹未变化的页面跳过，
+# 只把新增、变化和删除的页面写入 DELTA_OUTPUT_FILE，nku_output.csv 保持不变
+INCREMENTAL_CRAWL = False
+CRAWL_STATE_DB = "crawl_state.db"
+DELTA_OUTPUT_FILE = "nku_delta.csv"
+
+# 多进程共享的爬取队列（scrapy crawl nku -s FRONTIER_ENABLED=1）：待爬 URL 保存在 FRONTIER_DB 中，
+# 可以同时运行多个爬虫进程（各自用 -s CSV_OUTPUT_FILE=... 写不同的文件，爬完后用 frontier.py merge 合并）。
+# 每个主机的请求间隔按响应时间自动调整并在进程之间共享，此时 DOWNLOAD_DELAY 和 AUTOTHROTTLE 不再生效；
+# 中途退出后重新运行同一命令即从断点继续，上一轮已经爬完时开始新一轮
+FRONTIER_ENABLED = False
+FRONTIER_DB = "frontier.db"
+FRONTIER_TARGET_CONCURRENCY = 2  # 每个主机期望同时进行的请求数（所有进程合计）
+FRONTIER_MIN_DELAY = 0.02        # 每个主机请求间隔的范围（秒）
+FRONTIER_MAX_DELAY = 10
+FRONTIER_LEASE_SECONDS = 600     # 租约时长（秒）：进程退出后其 URL 多久重新入队，写出一批输出的耗时必须远小于该值
+FRONTIER_PAGERANK_STATE = "pagerank_state.npz"  # 新一轮按上一轮的 PageRank 排列优先级（文件存在时）
+# FRONTIER_WORKER = "worker-1"   # 固定进程名时，该进程崩溃重启后立即收回自己的租约，不必等租约到期
+
 # 请求头 (伪装成浏览器)
 DEFAULT_REQUEST_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Accept-Language": "en",
 }
 
-# ITEM_PIPELINES = {
-#     "nk_search.pipelines.MySQLPipeline": 300,  # 数字表示执行顺序，越小优先级越高
-# }
-
 # # 增加爬取和处理的超时时间
 # DOWNLOAD_TIMEOUT = 10
 
@@ -1,35 +1,54 @@
 import csv
 import sys
 
+from corpus import Corpus, is_corpus
+
 # 设置最大字段大小
 csv.field_size_limit(2**31 - 1)
 
 # 定义生成联想建议的函数
 def generate_suggestion(title):
     # 示例：简单的建议生成方法，基于标题返回一部分关键词或与之相关的词
-    words = title.split()
+    words = (title or '').split()
+    if not words:
+        # 空标题或只有空白的标题没有建议
+        return ''
     if len(words) > 1:
         return ' '.join(words[:2]) + "..."
     else:
         return words[0] + "..."
 
-# 读取 pagerankedoutput.csv 文件并添加 suggestion 字段
-input_file = 'pagerankedoutput.csv'
-output_file = 'finaloutput.csv'
+def add_suggestions(input_file, output_file):
+    # 语料目录只读取 title 列，在原目录中添加 suggest 列，不写出新文件
+    if is_corpus(input_file):
+        corpus = Corpus(input_file)
+        corpus.add_column('suggest', (generate_suggestion(title) for title in corpus.column('title')))
+        return input_file
+
+    # 打开输入文件进行读取，输出文件进行写入
+    with open(input_file, 'r', encoding='utf-8') as infile, open(output_file, 'w', newline='', encoding='utf-8') as outfile:
+        reader = csv.DictReader(infile)
+        # 清理列名中的 BOM 标记
+        reader.fieldnames = [field.replace('\ufeff', '') for field in reader.fieldnames]
+        fieldnames = reader.fieldnames + ['suggest']  # 增加新的字段
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+
+        writer.writeheader()
 
-# 打开输入文件进行读取，输出文件进行写入
-with open(input_file, 'r', encoding='utf-8') as infile, open(output_file, 'w', newline='', encoding='utf-8') as outfile:
-    reader = csv.DictReader(infile)
-    # 清理列名中的 BOM 标记
-    reader.fieldnames = [field.replace('\ufeff', '') for field in reader.fieldnames]
-    fieldnames = reader.fieldnames + ['suggest']  # 增加新的字段
-    writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+        for row in reader:
+            # 为每一行数据生成联想建议
+            row['suggest'] = generate_suggestion(row['title'])
+            writer.writerow(row)
+    return output_file
 
-    writer.writeheader()
+if __name__ == "__main__":
+    # 读取 pagerankedoutput.csv 文件并添加 suggestion 字段
+    input_file = 'pagerankedoutput.csv'
+    output_file = 'finaloutput.csv'
 
-    for row in reader:
-        # 为每一行数据生成联想建议
-        row['suggest'] = generate_suggestion(row['title'])
-        writer.writerow(row)
+    if len(sys.argv) > 1:
+        # 也可以指定语料目录，直接在目录中添加 suggest 列
+        input_file = sys.argv[1]
+    output_file = add_suggestions(input_file, output_file)
 
-print(f"新的CSV文件已经保存为: {output_file}")
+    print(f"联想建议已经保存到: {output_file}")
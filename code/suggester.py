@@ -0,0 +1,283 @@
+import argparse
+import bisect
+import heapq
+import math
+import mmap
+import re
+import struct
+import time
+from array import array
+
+SUGGEST_INDEX = 'suggest.idx'   # 本地联想索引文件
+TOP_K = 5                       # 默认返回的建议数
+TABLE_K = 10                    # 短前缀预先计算的建议数
+TABLE_DEPTH = 3                 # 预先计算 top-k 的前缀最大长度
+PAGERANK_WEIGHT = 0.6           # 标题的 PageRank 权重
+QUERY_WEIGHT = 0.4              # 历史查询频率权重
+MAX_FUZZY_SCAN = 2000           # 模糊匹配时每个前缀区间最多扫描的条目数
+
+MAGIC = b'NKSG'
+HEADER = struct.Struct('<4sIIIII')
+NO_ID = 0xFFFFFFFF
+
+# 标题中常见的分隔符，如 "规章制度-宣传部"、"南开大学 | 新闻网"
+SEPARATORS = re.compile(r'\s*[-_|｜—–·:：,，]+\s*|\s+')
+
+
+def normalize(text):
+    return text.strip().lower()
+
+
+def title_keys(title):
+    """
+    标题本身以及按分隔符切出的各段都作为可匹配的前缀键
+    """
+    keys = {normalize(title)}
+    keys.update(normalize(part) for part in SEPARATORS.split(title) if part.strip())
+    keys.discard('')
+    return keys
+
+
+class _Strings:
+    """
+    按偏移量从 UTF-8 字节块中取字符串，支持 bisect
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+def _pack_strings(strings):
+    offsets = array('I', [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets.tobytes(), bytes(blob)
+
+
+def _within_one_edit(prefix, key):
+    """
+    判断 key 是否以与 prefix 编辑距离不超过 1 的字符串开头
+    """
+    n = len(prefix)
+    head = key[:n]
+    if len(head) == n and sum(a != b for a, b in zip(prefix, head)) <= 1:
+        return True
+    # prefix 多输入了一个字符
+    for i in range(n):
+        if key.startswith(prefix[:i] + prefix[i + 1:]):
+            return True
+    # prefix 漏输入了一个字符
+    head = key[:n + 1]
+    return len(head) == n + 1 and any(head[:i] + head[i + 1:] == prefix for i in range(n + 1))
+
+
+class Suggester:
+    """
+    本地前缀联想索引：前缀键按字典序排列，二分查找定位前缀区间；
+    长度不超过 TABLE_DEPTH 的前缀预先计算了 top-k。
+    所有数据存放在一块连续缓冲区中，可以直接 mmap 加载
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        magic, n_keys, n_texts, n_prefixes, self.table_k, self.depth = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError("不是有效的联想索引文件。")
+        pos = HEADER.size
+        lengths = struct.unpack_from('<9Q', view, pos)
+        pos += struct.calcsize('<9Q')
+        sections = []
+        for length in lengths:
+            sections.append(view[pos:pos + length])
+            pos += length + (-length % 4)
+        (key_offsets, key_blob, key_text, key_score,
+         text_offsets, text_blob, prefix_offsets, prefix_blob, prefix_ids) = sections
+        self.keys = _Strings(key_offsets.cast('I'), key_blob)
+        self.key_text = key_text.cast('I')
+        self.key_score = key_score.cast('f')
+        self.texts = _Strings(text_offsets.cast('I'), text_blob)
+        self.prefixes = _Strings(prefix_offsets.cast('I'), prefix_blob)
+        self.prefix_ids = prefix_ids.cast('I')
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, entries, table_k=TABLE_K, depth=TABLE_DEPTH):
+        """
+        entries: {显示文本: 得分}，返回内存中的索引
+        """
+        texts = sorted(entries)
+        text_ids = {text: i for i, text in enumerate(texts)}
+        pairs = {}
+        for text in texts:
+            for key in title_keys(text):
+                # 同一个键对应多个标题时保留得分最高的
+                current = pairs.get(key)
+                if current is None or entries[text] > entries[texts[current]]:
+                    pairs[key] = text_ids[text]
+        keys = sorted(pairs)
+        scores = array('f', (entries[texts[pairs[key]]] for key in keys))
+
+        # 短前缀的 top-k：同一标题只保留一次
+        table = {}
+        for key_id, key in enumerate(keys):
+            for length in range(1, min(depth, len(key)) + 1):
+                heap = table.setdefault(key[:length], [])
+                item = (scores[key_id], -key_id)
+                if len(heap) < table_k * 2:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        prefixes = sorted(table)
+        prefix_ids = array('I')
+        for prefix in prefixes:
+            ids, seen = [], set()
+            for _, neg_id in sorted(table[prefix], reverse=True):
+                text_id = pairs[keys[-neg_id]]
+                if text_id not in seen:
+                    seen.add(text_id)
+                    ids.append(-neg_id)
+            ids = ids[:table_k]
+            prefix_ids.extend(ids + [NO_ID] * (table_k - len(ids)))
+
+        key_offsets, key_blob = _pack_strings(keys)
+        text_offsets, text_blob = _pack_strings(texts)
+        prefix_offsets, prefix_blob = _pack_strings(prefixes)
+        sections = [key_offsets, key_blob, array('I', (pairs[key] for key in keys)).tobytes(), scores.tobytes(),
+                    text_offsets, text_blob, prefix_offsets, prefix_blob, prefix_ids.tobytes()]
+        buffer = bytearray(HEADER.pack(MAGIC, len(keys), len(texts), len(prefixes), table_k, depth))
+        buffer += struct.pack('<9Q', *(len(section) for section in sections))
+        for section in sections:
+            buffer += section
+            buffer += b'\0' * (-len(section) % 4)
+        return cls(bytes(buffer))
+
+    def save(self, path=SUGGEST_INDEX):
+        with open(path, 'wb') as f:
+            f.write(self.buffer)
+
+    @classmethod
+    def load(cls, path=SUGGEST_INDEX):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _range(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        return lo, hi
+
+    def _ranked(self, key_ids, k, seen):
+        results = []
+        for key_id in key_ids:
+            text_id = self.key_text[key_id]
+            if text_id not in seen:
+                seen.add(text_id)
+                results.append(self.texts[text_id])
+                if len(results) == k:
+                    break
+        return results
+
+    def suggest(self, prefix, k=TOP_K, fuzzy=False):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        seen = set()
+        if len(prefix) <= self.depth and k <= self.table_k:
+            i = bisect.bisect_left(self.prefixes, prefix)
+            if i < len(self.prefixes) and self.prefixes[i] == prefix:
+                ids = self.prefix_ids[i * self.table_k:(i + 1) * self.table_k]
+                results = self._ranked((key_id for key_id in ids if key_id != NO_ID), k, seen)
+            else:
+                results = []
+        else:
+            lo, hi = self._range(prefix)
+            candidates = heapq.nlargest(k * 4, range(lo, hi), key=self.key_score.__getitem__)
+            results = self._ranked(candidates, k, seen)
+
+        if fuzzy and len(results) < k:
+            results += self._fuzzy(prefix, k - len(results), seen)
+        return results
+
+    def _fuzzy(self, prefix, k, seen):
+        """
+        编辑距离为 1 的前缀匹配：首字符需正确，只扫描规模有限的前缀区间
+        """
+        candidates = set()
+        for i in range(len(prefix) - 1, 0, -1):
+            lo, hi = self._range(prefix[:i])
+            if hi - lo > MAX_FUZZY_SCAN:
+                break
+            candidates.update(key_id for key_id in range(lo, hi) if _within_one_edit(prefix, self.keys[key_id]))
+        ranked = sorted(candidates, key=self.key_score.__getitem__, reverse=True)
+        return self._ranked(ranked, k, seen)
+
+
+def collect_entries(csv_file_path, history_store=None, query_limit=10000):
+    """
+    从语料标题（按 PageRank）和历史查询（按频率）收集联想条目
+    """
+    # 语料读取依赖 numpy，只在构建索引时导入，查询进程加载联想索引不需要
+    from corpus import read_records
+    pageranks = {}
+    for row in read_records(csv_file_path, ('title', 'pagerank')):
+        title = (row.get('title') or '').strip()
+        if not title or title == 'Untitled':
+            continue
+        try:
+            pagerank = float(row.get('pagerank') or 0)
+        except ValueError:
+            pagerank = 0.0
+        pageranks[title] = max(pagerank, pageranks.get(title, 0.0))
+
+    frequencies = {}
+    if history_store is not None:
+        for query, count in history_store.query_counts(query_limit):
+            frequencies[query.strip()] = count
+
+    max_pagerank = max(pageranks.values(), default=0.0) or 1.0
+    max_frequency = math.log1p(max(frequencies.values(), default=0)) or 1.0
+    entries = {}
+    for text in set(pageranks) | set(frequencies):
+        entries[text] = (PAGERANK_WEIGHT * pageranks.get(text, 0.0) / max_pagerank
+                         + QUERY_WEIGHT * math.log1p(frequencies.get(text, 0)) / max_frequency)
+    return entries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地联想索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="从语料和历史记录构建联想索引")
+    build_parser.add_argument("csv_file_path", nargs="?", default="finaloutput.csv")
+    build_parser.add_argument("--history", default="history.db", help="查询历史数据库")
+    build_parser.add_argument("--output", default=SUGGEST_INDEX)
+
+    query_parser = subparsers.add_parser("query", help="查询联想建议")
+    query_parser.add_argument("prefix")
+    query_parser.add_argument("--index", default=SUGGEST_INDEX)
+    query_parser.add_argument("--fuzzy", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        from history import HistoryStore
+
+        start = time.perf_counter()
+        entries = collect_entries(args.csv_file_path, HistoryStore(args.history))
+        suggester = Suggester.build(entries)
+        suggester.save(args.output)
+        print(f"联想索引已保存到 {args.output}：{len(entries)} 个条目，{len(suggester)} 个前缀键，"
+              f"{len(suggester.buffer) / 1024:.1f} KB，用时 {time.perf_counter() - start:.2f}s")
+    elif args.command == "query":
+        for suggestion in Suggester.load(args.index).suggest(args.prefix, fuzzy=args.fuzzy):
+            print(suggestion)
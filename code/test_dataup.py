@@ -0,0 +1,120 @@
+# BulkIngestor 在本地模拟 ES（mock_es.py）上的测试：python -m pytest code/test_dataup.py
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+import dataup
+from mock_es import MockElasticsearch
+
+
+class FlakyES:
+    """
+    包装 ES 客户端：第 fail_on 次起的 _bulk 请求抛出 error 或返回 response，其余请求照常转发
+    """
+
+    def __init__(self, es, fail_on=1, error=None, response=None):
+        self.es = es
+        self.fail_on = fail_on
+        self.error = error
+        self.response = response
+        self.calls = 0
+
+    def bulk(self, **kwargs):
+        self.calls += 1
+        if self.calls >= self.fail_on:
+            if self.error is not None:
+                raise self.error
+            return self.response
+        return self.es.bulk(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.es, name)
+
+
+@pytest.fixture
+def mock():
+    with MockElasticsearch(seed=1) as server:
+        yield server
+
+
+@pytest.fixture
+def es(mock):
+    return dataup.connect(mock.url)
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "url", "text", "linksurl", "pagerank"])
+        for i in range(rows):
+            writer.writerow([f"页面 {i}", f"http://a/{i}", "南开 大学", "", 0.1])
+    return str(path)
+
+
+def test_backoff_on_429(tmp_path, mock, es):
+    mock.reject_rate = 0.5
+    csv_file_path = write_csv(tmp_path / "out.csv", 100)
+    index_name = dataup.create_versioned_index(es)
+    ingestor = dataup.BulkIngestor(es, workers=2, chunk_size=10, max_retries=20, initial_backoff=0.001)
+    failed = ingestor.run(dataup.read_actions(csv_file_path, index_name))
+    assert mock.rejected > 0
+    assert failed == [] and ingestor.failed_batches == 0
+    assert ingestor.indexed == len(mock.indices[index_name]) == 100
+
+
+def test_failed_documents_not_counted(es):
+    index_name = dataup.create_versioned_index(es)
+    actions = [(i, dataup.build_action({"url": f"http://a/{i}"}, index_name)) for i in range(3)]
+    # 更新不存在的文档，mock_es 对这些条目返回 404 错误
+    actions += [(3 + i, {"_op_type": "update", "_index": index_name, "_id": f"missing{i}",
+                         "_source": {"doc": {"pagerank": 1.0}}}) for i in range(2)]
+    ingestor = dataup.BulkIngestor(es, workers=1)
+    failed = ingestor.run(actions)
+    assert ingestor.indexed == 3
+    assert len(failed) == 2
+
+
+@pytest.mark.parametrize("error", [TypeError("bad body"), ValueError("bad value")])
+def test_non_transport_errors_not_retried(es, error):
+    flaky = FlakyES(es, error=error)
+    ingestor = dataup.BulkIngestor(flaky, workers=1, initial_backoff=0.001)
+    ingestor.run([(0, dataup.build_action({"url": "http://a/0"}, "xxjs"))])
+    assert flaky.calls == 1
+    assert ingestor.failed_batches == 1 and len(ingestor.failed_documents) == 1
+
+
+def test_unexpected_error_fails_batch(tmp_path, es):
+    # 响应缺少 items，send 抛出 KeyError：批次计为失败，断点不推进
+    csv_file_path = write_csv(tmp_path / "out.csv", 30)
+    checkpoint = dataup.Checkpoint(str(tmp_path / "checkpoint.json"), csv_file_path)
+    ingestor = dataup.BulkIngestor(FlakyES(es, fail_on=2, response={}), workers=1, chunk_size=10,
+                                   checkpoint=checkpoint)
+    ingestor.run(dataup.read_actions(csv_file_path, dataup.create_versioned_index(es)))
+    assert ingestor.failed_batches == 2
+    assert len(ingestor.failed_documents) == 20
+    assert checkpoint.offset == 10
+
+
+def test_resume_from_checkpoint(tmp_path, mock, es):
+    csv_file_path = write_csv(tmp_path / "out.csv", dataup.CHUNK_SIZE * 3)
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    failing = FlakyES(es, fail_on=2, error=TypeError("bad body"))
+    failed = dataup.upload_csv(failing, csv_file_path, alias="t", workers=1, checkpoint_path=checkpoint_path)
+    # 有批次失败：别名不切换，断点保留
+    assert failed
+    assert "t" not in mock.aliases
+    assert os.path.exists(checkpoint_path)
+    checkpoint = dataup.Checkpoint(checkpoint_path, csv_file_path)
+    index_name = checkpoint.index
+    assert checkpoint.offset == dataup.CHUNK_SIZE
+
+    # 重新运行从断点继续，只上传剩余的两批
+    calls = mock.bulk_requests
+    assert dataup.upload_csv(es, csv_file_path, alias="t", workers=1, checkpoint_path=checkpoint_path) == []
+    assert mock.bulk_requests - calls == 2
+    assert mock.aliases["t"] == {index_name}
+    assert len(mock.indices[index_name]) == dataup.CHUNK_SIZE * 3
+    assert not os.path.exists(checkpoint_path)
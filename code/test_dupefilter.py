@@ -0,0 +1,27 @@
+# URL 规范化的测试：python -m pytest code/test_dupefilter.py
+import pytest
+
+pytest.importorskip("scrapy")
+
+from dupefilter import canonical_key, canonical_url, canonicalize_url
+
+
+@pytest.mark.parametrize("url", [
+    "http://www.nankai.edu.cn/",
+    "https://www.nankai.edu.cn/",
+    "HTTPS://WWW.Nankai.edu.cn:443/index.htm",
+    "http://www.nankai.edu.cn:80//#top",
+])
+def test_one_key_per_page(url):
+    assert canonical_url(url) == "http://www.nankai.edu.cn/"
+    assert canonical_key(url) == "www.nankai.edu.cn/"
+
+
+def test_canonicalize_keeps_scheme():
+    # 请求按原协议发出，只有输出的键统一协议
+    assert canonicalize_url("https://a.nankai.edu.cn/x/?b=2&a=1") == "https://a.nankai.edu.cn/x?a=1&b=2"
+    assert canonical_url("https://a.nankai.edu.cn/x/?b=2&a=1") == "http://a.nankai.edu.cn/x?a=1&b=2"
+
+
+def test_unparsable():
+    assert canonical_url("http://[::1") is None
@@ -0,0 +1,54 @@
+# 共享爬取队列租约的测试：python -m pytest code/test_frontier.py
+import time
+
+import pytest
+
+pytest.importorskip("scrapy")
+
+from frontier import Frontier
+
+LEASE_SECONDS = 0.4
+URLS = [f"http://h{i}.nankai.edu.cn/" for i in range(4)]
+
+
+def fetch_all(db_path):
+    """
+    worker a 领取并下载全部 URL，页面处于 fetched 状态（还没写入输出文件）
+    """
+    worker = Frontier(db_path, worker="a", lease_seconds=LEASE_SECONDS)
+    worker.commit_with_output = True
+    worker.start()
+    for url in URLS:
+        worker.add(url)
+    leases = worker.lease(limit=len(URLS))
+    assert sorted(lease.url for lease in leases) == URLS
+    for lease in leases:
+        worker.complete(lease.key, lease.host, latency=0.01)
+    worker.flush()
+    assert worker.stats()['fetched'] == len(URLS)
+    return worker
+
+
+def test_fetched_not_released_before_commit(tmp_path):
+    db_path = str(tmp_path / "frontier.db")
+    worker = fetch_all(db_path)
+    other = Frontier(db_path, worker="b", lease_seconds=LEASE_SECONDS)
+    # 超过租约时长的三倍：a 在此期间仍在运行（定期 flush 续约），b 领取不到这些页面
+    deadline = time.time() + 3 * LEASE_SECONDS
+    while time.time() < deadline:
+        worker.flush()
+        assert other.lease(limit=len(URLS)) == []
+        time.sleep(LEASE_SECONDS / 8)
+    worker.commit()
+    assert other.lease(limit=len(URLS)) == []
+    assert worker.stats()['done'] == len(URLS)
+
+
+def test_stalled_worker_loses_fetched_rows(tmp_path):
+    # 进程停顿（不领取也不 flush）超过租约时长时，其他进程会重新爬取它 fetched 的页面：
+    # 输出文件的单次写出等停顿必须明显短于 lease_seconds
+    db_path = str(tmp_path / "frontier.db")
+    fetch_all(db_path)
+    time.sleep(LEASE_SECONDS * 1.5)
+    other = Frontier(db_path, worker="b", lease_seconds=LEASE_SECONDS)
+    assert sorted(lease.url for lease in other.lease(limit=len(URLS))) == URLS
@@ -0,0 +1,52 @@
+# 旧版 history.txt 导入的测试：python -m pytest code/test_history.py
+from history import HistoryStore, migrate_history_file
+
+LEGACY = """\
+2024-12-17 10:00:00 | alice | 南开大学
+2024-12-17 10:00:00 | alice | 学院新闻 | 南开大学 | http://news.nankai.edu.cn/a | 摘要 | 含分隔符
+2024-12-17 10:00:00 | alice | 经济学院 | http://economics.nankai.edu.cn/ | 摘要
+2024-12-17 10:05:00 | bob | 招生 | 本科
+2024-12-17 10:05:00 | bob | 本科招生 | 南开大学 | 招生网 | http://zsb.nankai.edu.cn/ | 招生信息
+"""
+
+
+def results(store):
+    return store.conn.execute("SELECT q.user, q.query, r.rank, r.title, r.url, r.snippet FROM results r "
+                              "JOIN queries q ON q.id = r.query_id ORDER BY q.id, r.rank").fetchall()
+
+
+def test_titles_with_separator(tmp_path):
+    path = tmp_path / "history.txt"
+    path.write_text(LEGACY, encoding="utf-8")
+    store = HistoryStore(str(tmp_path / "history.db"))
+    assert migrate_history_file(store, str(path)) == 2
+    assert store.user_queries("alice") == [("2024-12-17 10:00:00", "南开大学")]
+    # 查询本身含 " | " 时整行仍是查询
+    assert store.user_queries("bob") == [("2024-12-17 10:05:00", "招生 | 本科")]
+    assert results(store) == [
+        ("alice", "南开大学", 1, "学院新闻 | 南开大学", "http://news.nankai.edu.cn/a", "摘要 | 含分隔符"),
+        ("alice", "南开大学", 2, "经济学院", "http://economics.nankai.edu.cn/", "摘要"),
+        ("bob", "招生 | 本科", 1, "本科招生 | 南开大学 | 招生网", "http://zsb.nankai.edu.cn/", "招生信息"),
+    ]
+
+
+def test_migrate_twice_imports_once(tmp_path):
+    path = tmp_path / "history.txt"
+    path.write_text(LEGACY, encoding="utf-8")
+    db_path = str(tmp_path / "history.db")
+    store = HistoryStore(db_path)
+    assert migrate_history_file(store, str(path)) == 2
+    profile = store.user_profile("alice")
+    store.close()
+
+    # 重新启动后再次导入同一文件：跳过，画像得分不变
+    store = HistoryStore(db_path)
+    assert migrate_history_file(store, str(path)) is None
+    assert len(store.user_queries("alice")) == 1
+    assert len(results(store)) == 3
+    assert store.user_profile("alice") == profile
+
+    # 文件内容变化（追加了新记录）时视为新文件导入
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("2024-12-18 09:00:00 | carol | 图书馆\n")
+    assert migrate_history_file(store, str(path)) == 3
@@ -0,0 +1,84 @@
+# LinkGraph.pagerank 与 networkx.pagerank 的一致性测试及增量计算的测试：python -m pytest code/test_pagerank.py
+import csv
+
+import numpy as np
+import pytest
+
+from pagerank import LinkGraph, incremental_pagerank
+
+nx = pytest.importorskip("networkx")
+
+# 每个图是 (页面, 出链列表) 的列表，与 CSV 中的 url / linksurl 对应
+GRAPHS = {
+    "chain_with_dangling": [("a", ["b"]), ("b", ["c"]), ("c", ["d"])],   # d 没有出链
+    "self_loops": [("a", ["a", "b"]), ("b", ["b"]), ("c", ["a", "c"])],
+    "duplicate_edges": [("a", ["b", "b", "c"]), ("b", ["c", "c"]), ("c", ["a", "a", "b"])],
+    "disconnected": [("a", ["b"]), ("b", ["a"]), ("x", ["y", "z"]), ("y", ["z"]), ("z", ["x"]), ("p", ["q"])],
+    "mixed": [("a", ["b", "c", "c", "a"]), ("b", ["d"]), ("c", ["d", "e"]), ("e", ["c"]),
+              ("f", ["g"]), ("g", ["g", "h"])],   # d、h 没有出链，f-g-h 与其余部分不相连
+}
+
+
+def build(pages):
+    graph = LinkGraph()
+    expected = nx.DiGraph()
+    for url, links in pages:
+        graph.add_links(url, links)
+        expected.add_edges_from((url, link) for link in links)
+    return graph, expected
+
+
+def assert_parity(pages, alpha=0.85, tol=1.0e-6, atol=1.0e-5):
+    graph, expected = build(pages)
+    scores = graph.scores_to_dict(graph.pagerank(alpha=alpha, tol=tol))
+    reference = nx.pagerank(expected, alpha=alpha, tol=tol)
+    assert set(scores) == set(reference)
+    urls = sorted(reference)
+    assert np.allclose([scores[url] for url in urls], [reference[url] for url in urls], rtol=0, atol=atol)
+    assert sum(scores.values()) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("name", sorted(GRAPHS))
+def test_default_tolerance(name):
+    assert_parity(GRAPHS[name])
+
+
+@pytest.mark.parametrize("name", sorted(GRAPHS))
+def test_custom_tolerance(name):
+    assert_parity(GRAPHS[name], alpha=0.9, tol=1.0e-10, atol=1.0e-9)
+
+
+def test_random_graph():
+    rng = np.random.default_rng(0)
+    pages = [(f"p{i}", [f"p{j}" for j in rng.integers(0, 60, size=rng.integers(0, 6))]) for i in range(50)]
+    assert_parity(pages)
+    assert_parity(pages, tol=1.0e-10, atol=1.0e-9)
+
+
+def write_crawl(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["url", "linksurl", "change"])
+        writer.writeheader()
+        for url, links, change in rows:
+            writer.writerow({"url": url, "linksurl": ";".join(links), "change": change})
+
+
+@pytest.mark.parametrize("full_crawl", [True, False])
+def test_incremental_drops_deleted_pages(tmp_path, full_crawl):
+    # d 没有出链，只作为链接目标出现；c 是有出链的页面。两者被删除后仍被 a、b 链接
+    state_path = str(tmp_path / "state.npz")
+    graph, _ = build([("a", ["b", "c", "d"]), ("b", ["a", "c"]), ("c", ["a", "d"])])
+    graph.save(state_path, graph.pagerank())
+
+    delta_path = str(tmp_path / "delta.csv")
+    rows = [("c", [], "deleted"), ("d", [], "deleted")]
+    if full_crawl:
+        rows += [("a", ["b", "c", "d"], ""), ("b", ["a", "c"], "")]
+    write_crawl(delta_path, rows)
+    moved = incremental_pagerank(delta_path, state_path, full_crawl=full_crawl)
+    assert set(moved) <= {"a", "b"}
+
+    merged, scores = LinkGraph.load(state_path)
+    assert sorted(merged.urls) == ["a", "b"]
+    assert merged.outlinks("a") == {"b"} and merged.outlinks("b") == {"a"}
+    assert scores.sum() == pytest.approx(1.0)
@@ -0,0 +1,73 @@
+# BufferedCsvPipeline 从 JOBDIR 继续爬取的测试：python -m pytest code/test_pipelines.py
+import csv
+import os
+
+import pytest
+
+pytest.importorskip("scrapy")
+
+from pipelines import WRITTEN_URLS_FILE, BufferedCsvPipeline
+
+LONG_TEXT = "正文" * 100000   # 超过 csv 模块默认的 128 KB 字段长度限制
+
+
+def page(url, text="text"):
+    return {"title": url, "url": url, "text": text, "linksurl": ""}
+
+
+def run(output, jobdir, items, buffer_size=1000, crash=False):
+    """
+    模拟一次爬取；crash 时不调用 close_spider，缓冲区中的记录丢失
+    """
+    pipeline = BufferedCsvPipeline(str(output), buffer_size, seen_filter=str(jobdir / "seen_urls.bloom"))
+    pipeline.open_spider()
+    for item in items:
+        pipeline.process_item(item)
+    if crash:
+        pipeline.file.close()
+        pipeline.written_file.close()
+    else:
+        pipeline.close_spider()
+    # 去重过滤器在运行期间或结束时保存到 JOBDIR
+    (jobdir / "seen_urls.bloom").write_bytes(b"")
+
+
+def read_urls(output):
+    # 只在读取结果时放宽字段长度限制，不掩盖流水线自身的读取
+    limit = csv.field_size_limit(2**31 - 1)
+    try:
+        with open(output, newline="", encoding="utf-8-sig") as f:
+            return [row["url"] for row in csv.DictReader(f)]
+    finally:
+        csv.field_size_limit(limit)
+
+
+def test_resume_appends_without_duplicates(tmp_path):
+    output, jobdir = tmp_path / "out.csv", tmp_path / "job"
+    jobdir.mkdir()
+    run(output, jobdir, [page("http://a/"), page("http://a/long", LONG_TEXT)])
+    # 起始页每次都会重新抓取
+    run(output, jobdir, [page("http://a/"), page("http://a/b")])
+    assert read_urls(output) == ["http://a/", "http://a/long", "http://a/b"]
+    with open(jobdir / WRITTEN_URLS_FILE, encoding="utf-8") as f:
+        assert f.read().split() == ["http://a/", "http://a/long", "http://a/b"]
+
+
+def test_resume_rewrites_unflushed_items(tmp_path):
+    output, jobdir = tmp_path / "out.csv", tmp_path / "job"
+    jobdir.mkdir()
+    run(output, jobdir, [page("http://a/"), page("http://a/b"), page("http://a/c")], buffer_size=2, crash=True)
+    assert read_urls(output) == ["http://a/", "http://a/b"]
+    run(output, jobdir, [page("http://a/"), page("http://a/c")])
+    assert read_urls(output) == ["http://a/", "http://a/b", "http://a/c"]
+
+
+def test_without_jobdir_every_run_rewrites(tmp_path):
+    output = tmp_path / "out.csv"
+    for _ in range(2):
+        pipeline = BufferedCsvPipeline(str(output))
+        pipeline.open_spider()
+        pipeline.process_item(page("http://a/"))
+        pipeline.close_spider()
+    assert read_urls(output) == ["http://a/"]
+    assert not os.path.exists(tmp_path / WRITTEN_URLS_FILE)
@@ -0,0 +1,79 @@
+# SearchEngine 按索引记录的分词词典选择查询字段的测试：python -m pytest code/test_search.py
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+import dataup
+from embedded import EmbeddedBackend, build_index
+from mock_es import MockElasticsearch
+from search import SearchEngine
+from segmenter import Segmenter, segment_stage
+
+DICTIONARY = {"南开": 50, "大学": 50, "南开大学": 80, "学院": 30}
+
+
+@pytest.fixture
+def mock():
+    with MockElasticsearch() as server:
+        yield server
+
+
+def save_dictionary(path, freqs):
+    Segmenter(freqs).save(str(path))
+    return str(path)
+
+
+def upload(mock, alias, segmenter=None):
+    es = dataup.connect(mock.url)
+    rows = [{"title": "南开大学", "url": "http://a/0", "text": "南开大学经济学院"},
+            {"title": "其他", "url": "http://a/1", "text": "天津大学"}]
+    if segmenter is not None:
+        rows = list(segment_stage(segmenter)(rows))
+    index_name = dataup.create_versioned_index(es, alias, segmenter.fingerprint if segmenter else None)
+    dataup.BulkIngestor(es, workers=1).run((i, dataup.build_action(row, index_name)) for i, row in enumerate(rows))
+    dataup.publish_index(es, index_name, alias)
+
+
+def engine(tmp_path, mock, segment_dict, backend="es"):
+    return SearchEngine(es_host=mock.url, index_name="t", history_db=str(tmp_path / "history.db"),
+                        suggest_index=None, segment_dict=segment_dict, backend=backend)
+
+
+def phrase_field(engine):
+    return next(iter(engine.phrase_query("南开大学")["query"]["match_phrase"]))
+
+
+def test_segmented_index_with_same_dictionary(tmp_path, mock):
+    path = save_dictionary(tmp_path / "segdict.txt", DICTIONARY)
+    upload(mock, "t", Segmenter.load(path))
+    search = engine(tmp_path, mock, path)
+    assert phrase_field(search) == "text_seg"
+    assert [hit["url"] for hit in search.search_phrase("南开大学")] == ["http://a/0"]
+    assert search.profile_functions([("南开大学", 1.0)])[0]["filter"]["terms"] == {"text_seg": ["南开大学"]}
+
+
+def test_unsegmented_index_falls_back_to_text(tmp_path, mock):
+    # 本地有词典，但索引没有预分词字段
+    path = save_dictionary(tmp_path / "segdict.txt", DICTIONARY)
+    upload(mock, "t")
+    search = engine(tmp_path, mock, path)
+    assert phrase_field(search) == "text"
+    assert [hit["url"] for hit in search.search_phrase("南开大学")] == ["http://a/0"]
+    assert search.profile_functions([("南开大学", 1.0)])[0]["filter"]["terms"] == {"text": ["南开大学"]}
+
+
+def test_changed_dictionary_falls_back_to_text(tmp_path, mock):
+    upload(mock, "t", Segmenter(DICTIONARY))
+    path = save_dictionary(tmp_path / "segdict.txt", dict(DICTIONARY, 经济学院=20))
+    assert phrase_field(engine(tmp_path, mock, path)) == "text"
+    assert phrase_field(engine(tmp_path, mock, None)) == "text"
+
+
+def test_embedded_index_records_dictionary(tmp_path, mock):
+    path = save_dictionary(tmp_path / "segdict.txt", DICTIONARY)
+    segmenter = Segmenter.load(path)
+    rows = list(segment_stage(segmenter)([{"title": "南开大学", "url": "http://a/0", "text": "南开大学"}]))
+    build_index(rows, str(tmp_path / "seg.idx"), verbose=False, segment_dict=segmenter.fingerprint)
+    build_index(rows, str(tmp_path / "plain.idx"), verbose=False)
+    assert phrase_field(engine(tmp_path, mock, path, EmbeddedBackend.load(str(tmp_path / "seg.idx")))) == "text_seg"
+    assert phrase_field(engine(tmp_path, mock, path, EmbeddedBackend.load(str(tmp_path / "plain.idx")))) == "text"
@@ -0,0 +1,43 @@
+# 联想建议的测试：python -m pytest code/test_suggest.py
+import pytest
+
+from suggest import add_suggestions, generate_suggestion
+from suggester import Suggester
+
+
+@pytest.mark.parametrize("title", ["", "   ", None])
+def test_empty_title(title):
+    assert generate_suggestion(title) == ''
+
+
+def test_title():
+    assert generate_suggestion("南开大学 新闻网 首页") == "南开大学 新闻网..."
+    assert generate_suggestion("南开大学") == "南开大学..."
+
+
+def test_add_suggestions_with_empty_title(tmp_path):
+    input_file, output_file = tmp_path / "in.csv", tmp_path / "out.csv"
+    input_file.write_text("title,url\n,http://a/0\n南开大学,http://a/1\n", encoding="utf-8")
+    add_suggestions(str(input_file), str(output_file))
+    assert output_file.read_text(encoding="utf-8").splitlines()[1:] == [",http://a/0,", "南开大学,http://a/1,南开大学..."]
+
+
+@pytest.mark.parametrize("prefix", ["", "  "])
+def test_empty_prefix(prefix):
+    suggester = Suggester.build({"南开大学...": 1.0})
+    assert suggester.suggest(prefix) == []
+    assert suggester.suggest(prefix, fuzzy=True) == []
+
+
+class NoSearch:
+    # 不应被调用的后端：空前缀不发出查询
+    def search(self, **kwargs):
+        raise AssertionError("空前缀不应查询后端")
+
+
+@pytest.mark.parametrize("prefix", ["", "  "])
+def test_engine_empty_prefix(tmp_path, prefix):
+    from search import SearchEngine
+    engine = SearchEngine(history_db=str(tmp_path / "history.db"), suggest_index=None, segment_dict=None,
+                          backend=NoSearch())
+    assert engine.wildcard_suggest(prefix) == []
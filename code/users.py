@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+USERS_DB = 'users.db'         # 用户数据库
+USERS_FILE = 'users.json'     # 旧版 JSON 格式的用户数据，首次打开数据库时导入
+SESSION_TTL = 24 * 3600       # 登录令牌的有效期（秒）
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL
+);
+"""
+
+
+def hash_password(password, salt='random_salt'):
+    return hashlib.sha256((password + salt).encode()).hexdigest()
+
+
+class UserStore:
+    """
+    用户账号（SQLite）：注册是一条 INSERT，用户名冲突由主键保证，
+    多个线程或进程同时注册不会互相覆盖，也不需要重写整个文件
+    """
+
+    def __init__(self, db_path=USERS_DB, users_file=USERS_FILE):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        if users_file and os.path.exists(users_file) and not len(self):
+            self.import_file(users_file)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def __contains__(self, username):
+        return self.password_hash(username) is not None
+
+    def import_file(self, users_file=USERS_FILE):
+        """
+        导入旧版 users.json（用户名 -> 密码哈希），已存在的用户保持不变
+        """
+        with open(users_file, 'r') as f:
+            try:
+                users = json.load(f)
+            except json.JSONDecodeError:
+                users = {}
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", users.items())
+        return len(users)
+
+    def password_hash(self, username):
+        with self._lock:
+            row = self.conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, username, password):
+        """
+        注册新用户，用户名已存在时返回 False
+        """
+        try:
+            with self._lock, self.conn:
+                self.conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                                  (username, hash_password(password)))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def verify(self, username, password):
+        stored = self.password_hash(username)
+        return stored is not None and secrets.compare_digest(stored, hash_password(password))
+
+
+class SessionStore:
+    """
+    登录令牌 -> 用户名，令牌在有效期内每次使用都会续期
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}  # 令牌 -> (用户名, 过期时间)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def create(self, username):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (username, time.monotonic() + self.ttl)
+            if len(self._sessions) % 1024 == 0:
+                self._expire()
+        return token
+
+    def user(self, token):
+        """
+        返回令牌对应的用户名，令牌无效或已过期时返回 None
+        """
+        if not token:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            username, expires = session
+            if expires < now:
+                del self._sessions[token]
+                return None
+            self._sessions[token] = (username, now + self.ttl)
+            return username
+
+    def remove(self, token):
+        with self._lock:
+            return self._sessions.pop(token, None) is not None
+
+    def _expire(self):
+        now = time.monotonic()
+        for token in [token for token, (_, expires) in self._sessions.items() if expires < now]:
+            del self._sessions[token]